@@ -0,0 +1,134 @@
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+
+from metrics import ADMISSION_WAIT_SECONDS, ADMISSION_WAITING
+
+LANES = ('live', 'backfill')
+
+
+class Overloaded(Exception):
+    """Raised when a render cannot be admitted; retry_after is a suggested delay in seconds"""
+
+    def __init__(self, lane: str, retry_after: int):
+        super().__init__(f"Too many {lane} renders in progress, retry in {retry_after}s")
+        self.lane = lane
+        self.retry_after = retry_after
+
+
+class Ticket:
+    """A granted render slot; release() is idempotent"""
+
+    def __init__(self, controller: 'AdmissionController', lane: str):
+        self.controller = controller
+        self.lane = lane
+        self.started = time.monotonic()
+        self._released = False
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self.controller._release(self)
+
+
+class AdmissionController:
+    """Per-process limit on concurrent renders with bounded, prioritized wait queues.
+
+    Live requests and backfill traffic wait in separate lanes. A free slot always
+    goes to a waiting live request first, and backfill never holds more than
+    backfill_concurrency slots, so bulk re-renders cannot starve new confessions.
+    A request that finds its lane's queue full, or waits longer than
+    queue_timeout, is rejected with Overloaded instead of piling up.
+    """
+
+    def __init__(self, concurrency: int, queue_size: int, backfill_concurrency: int = 1,
+                 backfill_queue_size: int = 4, queue_timeout: float = 20.0):
+        self.concurrency = concurrency
+        self.lane_concurrency = {'live': concurrency, 'backfill': min(backfill_concurrency, concurrency)}
+        self.queue_size = {'live': queue_size, 'backfill': backfill_queue_size}
+        self.queue_timeout = queue_timeout
+
+        self._condition = threading.Condition()
+        self._running = {lane: 0 for lane in LANES}
+        self._waiting = {lane: 0 for lane in LANES}
+        self._rejected = {lane: 0 for lane in LANES}
+        # Moving average of how long a slot is held, for Retry-After
+        self._hold_seconds = 1.0
+
+    def acquire(self, lane: str = 'live', timeout: Optional[float] = None) -> Ticket:
+        """Wait for a render slot in lane, raising Overloaded if the lane is saturated"""
+        if lane not in LANES:
+            raise ValueError(f"Unknown lane '{lane}'. Available: {', '.join(LANES)}")
+        timeout = self.queue_timeout if timeout is None else timeout
+
+        with self._condition:
+            if not self._can_run(lane):
+                if self._waiting[lane] >= self.queue_size[lane]:
+                    raise self._reject(lane)
+                self._wait(lane, time.monotonic() + timeout)
+            self._running[lane] += 1
+
+        return Ticket(self, lane)
+
+    def check(self, lane: str):
+        """Raise Overloaded if lane's wait queue is already full, without taking a slot"""
+        with self._condition:
+            if not self._can_run(lane) and self._waiting[lane] >= self.queue_size[lane]:
+                raise self._reject(lane)
+
+    @contextmanager
+    def admit(self, lane: str = 'live', timeout: Optional[float] = None):
+        ticket = self.acquire(lane, timeout)
+        try:
+            yield ticket
+        finally:
+            ticket.release()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._condition:
+            return {
+                'concurrency': self.concurrency,
+                'running': dict(self._running),
+                'waiting': dict(self._waiting),
+                'rejected': dict(self._rejected),
+                'avg_render_seconds': round(self._hold_seconds, 3),
+            }
+
+    def _can_run(self, lane: str) -> bool:
+        if sum(self._running.values()) >= self.concurrency:
+            return False
+        if lane == 'backfill':
+            return self._waiting['live'] == 0 and self._running['backfill'] < self.lane_concurrency['backfill']
+        return True
+
+    def _wait(self, lane: str, deadline: float):
+        started = time.monotonic()
+        self._waiting[lane] += 1
+        ADMISSION_WAITING.labels(lane).inc()
+        try:
+            while not self._can_run(lane):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise self._reject(lane)
+                self._condition.wait(remaining)
+        finally:
+            self._waiting[lane] -= 1
+            ADMISSION_WAITING.labels(lane).dec()
+            ADMISSION_WAIT_SECONDS.labels(lane).observe(time.monotonic() - started)
+            # A live request leaving the queue may unblock backfill
+            self._condition.notify_all()
+
+    def _reject(self, lane: str) -> Overloaded:
+        self._rejected[lane] += 1
+        backlog = self._waiting[lane] + sum(self._running.values())
+        retry_after = math.ceil(self._hold_seconds * max(1, backlog) / self.lane_concurrency[lane])
+        return Overloaded(lane, max(1, retry_after))
+
+    def _release(self, ticket: Ticket):
+        held = time.monotonic() - ticket.started
+        with self._condition:
+            self._running[ticket.lane] -= 1
+            self._hold_seconds = 0.8 * self._hold_seconds + 0.2 * held
+            self._condition.notify_all()
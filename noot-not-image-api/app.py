@@ -1,12 +1,25 @@
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, Response, g, request, jsonify, send_file, stream_with_context
+from werkzeug.utils import secure_filename
+import hmac
+import io
+import itertools
+import json
+import mimetypes
+from urllib.parse import quote
 import os
-import requests
-from dotenv import load_dotenv
 import logging
+import threading
+import time
+import metrics
+from admission import AdmissionController, Overloaded
+from callback_outbox import CallbackOutbox
+from encoders import ENCODERS, negotiate_format, resolve_format
 from image_generator import ImageGeneratorService
-
-# Load environment variables
-load_dotenv()
+from job_queue import JobQueue
+from profiling import RequestProfiler
+from settings import load_config
+from storage import is_confession_id, is_image_name, size_variant
+from streaming import multipart_boundary, multipart_stream, zip_stream
 
 app = Flask(__name__)
 
@@ -15,32 +28,135 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # Configuration
-config = {
-    'IMAGE_WIDTH': int(os.getenv('IMAGE_WIDTH', 1920)),
-    'IMAGE_HEIGHT': int(os.getenv('IMAGE_HEIGHT', 1920)),
-    'FONT_SIZE': int(os.getenv('FONT_SIZE', 84)),
-    'LINE_HEIGHT': int(os.getenv('LINE_HEIGHT', 110)),
-    'MAX_LINES_PER_IMAGE': int(os.getenv('MAX_LINES_PER_IMAGE', 15)),
-    'TEXT_MARGIN': int(os.getenv('TEXT_MARGIN', 100)),
-    'FONTS_DIR': os.getenv('FONTS_DIR', './assets/fonts'),
-    'IMAGES_DIR': os.getenv('IMAGES_DIR', './assets/images'),
-    'BACKGROUND_DIR': os.getenv('BACKGROUND_DIR', './assets/backgrounds'),
-}
+config = load_config()
 
 # Initialize image generator
 image_generator = ImageGeneratorService(config)
+storage = image_generator.storage
 
 # PHP API configuration
-PHP_API_BASE_URL = os.getenv('PHP_API_BASE_URL', 'http://localhost:8000')
+PHP_API_BASE_URL = config['PHP_API_BASE_URL']
+
+# /generate-images modes: store files and return URLs, or stream the pages back from memory
+GENERATE_MODES = ('store', 'zip', 'multipart')
+
+# Bounded, prioritized render concurrency for this worker process
+admission = AdmissionController(
+    config['RENDER_CONCURRENCY'],
+    config['RENDER_QUEUE_SIZE'],
+    backfill_concurrency=config['BACKFILL_CONCURRENCY'],
+    backfill_queue_size=config['BACKFILL_QUEUE_SIZE'],
+    queue_timeout=config['ADMISSION_TIMEOUT'],
+)
+
+# cProfile/tracemalloc captures of upcoming requests, armed through /admin/profile
+profiler = RequestProfiler(config['PROFILE_DIR'])
+
+# Probes and scrapes are not worth profiling and would use up a capture's request count
+UNPROFILED_ENDPOINTS = {'health_check', 'readiness_check', 'metrics_endpoint', 'static'}
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    endpoint = request.endpoint or ''
+    if not endpoint.startswith('admin_') and endpoint not in UNPROFILED_ENDPOINTS:
+        g.profile = profiler.start_request()
+
+@app.teardown_request
+def finish_request_profile(error=None):
+    profiler.finish_request(g.pop('profile', None), request.endpoint or 'unmatched')
+
+@app.after_request
+def observe_request(response):
+    """Record request latency (until the headers are ready) and failed responses per endpoint"""
+    endpoint = request.endpoint or 'unmatched'
+    if 'request_started' in g:
+        metrics.REQUEST_SECONDS.labels(endpoint).observe(time.perf_counter() - g.request_started)
+    if response.status_code >= 400:
+        metrics.ERRORS.labels(endpoint, str(response.status_code)).inc()
+    return response
 
 @app.route('/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
-    return jsonify({
+    response = {
         'status': 'healthy',
         'service': 'noot-not-image-api',
         'version': '1.0.0'
-    })
+    }
+    
+    if image_generator.render_cache is not None:
+        response['render_cache'] = image_generator.render_cache.stats()
+    
+    response['callback_outbox'] = callback_outbox.stats()
+    response['admission'] = admission.stats()
+    response['render_contexts'] = image_generator.render_contexts.stats()
+    response['memory'] = {**image_generator.memory_budget.stats(), 'canvas_pool': image_generator.canvas_pool.stats()}
+    
+    return jsonify(response)
+
+@app.route('/ready', methods=['GET'])
+def readiness_check():
+    """Readiness endpoint: 503 until this worker has warmed up and started its background threads"""
+    if not worker_ready.is_set():
+        return jsonify({'status': 'starting', 'pid': os.getpid()}), 503
+    
+    return jsonify({'status': 'ready', 'pid': os.getpid()})
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Prometheus metrics, aggregated over all worker processes"""
+    if not metrics.METRICS_ENABLED:
+        return jsonify({'error': 'prometheus_client is not installed'}), 501
+    
+    data, content_type = metrics.render_latest()
+    return Response(data, content_type=content_type)
+
+def admin_denied():
+    """Error response unless the request carries ADMIN_TOKEN in X-Admin-Token; admin hooks are off without a token"""
+    if not config['ADMIN_TOKEN']:
+        return jsonify({'error': 'Endpoint not found'}), 404
+    token = request.headers.get('X-Admin-Token', '')
+    if not hmac.compare_digest(token.encode('utf-8'), config['ADMIN_TOKEN'].encode('utf-8')):
+        return jsonify({'error': 'Invalid admin token'}), 401
+    return None
+
+@app.route('/admin/profile', methods=['POST'])
+def admin_start_profile():
+    """Profile the next requests handled by this worker with cProfile or tracemalloc"""
+    denied = admin_denied()
+    if denied:
+        return denied
+    
+    data = request.get_json(silent=True) or {}
+    try:
+        capture = profiler.arm(data.get('mode', 'cprofile'), int(data.get('requests', 10)),
+                               float(data.get('seconds', config['PROFILE_MAX_SECONDS'])))
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+    
+    logger.info(f"Profiling the next {capture['requests']} requests with {capture['mode']}")
+    return jsonify({**capture, 'status_url': f"/admin/profile/{capture['capture_id']}"}), 202
+
+@app.route('/admin/profile/<capture_id>', methods=['GET'])
+def admin_profile_result(capture_id):
+    """Report of a capture (from any worker); ?format=pstats downloads a finished cProfile capture"""
+    denied = admin_denied()
+    if denied:
+        return denied
+    
+    if request.args.get('format') == 'pstats':
+        path = profiler.profile_path(capture_id)
+        if path is None:
+            return jsonify({'error': 'Profile not found'}), 404
+        return send_file(os.path.abspath(path), mimetype='application/octet-stream', as_attachment=True,
+                         download_name=f"{capture_id}.prof")
+    
+    result = profiler.result(capture_id)
+    if result is None:
+        return jsonify({'error': 'Capture not found'}), 404
+    
+    return jsonify(result)
 
 @app.route('/generate-images', methods=['POST'])
 def generate_images():
@@ -48,32 +164,39 @@ def generate_images():
     try:
         data = request.get_json()
         
-        if not data:
-            return jsonify({'error': 'No JSON data provided'}), 400
-            
-        confession_id = data.get('confession_id')
-        content = data.get('content')
+        try:
+            confession_id, content, image_format, generator = parse_render_request(data)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
-        if not confession_id or not content:
-            return jsonify({'error': 'confession_id and content are required'}), 400
+        mode = data.get('mode', 'store')
+        if mode not in GENERATE_MODES:
+            return jsonify({'error': f"mode must be one of: {', '.join(GENERATE_MODES)}"}), 400
+        
+        plan, content_error, status = plan_layout(content, generator)
+        if content_error:
+            return jsonify({'error': content_error}), status
+        
+        lane = request_lane(data, request.headers.get('X-Priority'))
+        
+        if mode != 'store':
+            logger.info(f"Streaming images for confession {confession_id} as {mode}")
+            return stream_pages_response(confession_id, content, image_format, mode, lane, plan, generator)
         
         logger.info(f"Generating images for confession {confession_id}")
         
-        # Generate images
-        image_urls = image_generator.generate_confession_images(confession_id, content)
+        # Generate images, reusing the layout computed for the page cap
+        with admission.admit(lane):
+            result = generator.render_confession(confession_id, content, image_format, plan)
+        image_urls = result['image_urls']
         
         logger.info(f"Generated {len(image_urls)} images for confession {confession_id}")
+        log_encoding_stats(confession_id, result)
         
-        # Return the image URLs
-        response = {
-            'success': True,
-            'confession_id': confession_id,
-            'image_urls': image_urls,
-            'total_images': len(image_urls)
-        }
-        
-        return jsonify(response)
+        return jsonify(render_response(confession_id, image_format, result))
         
+    except Overloaded as e:
+        return overloaded_response(e)
     except Exception as e:
         logger.error(f"Error generating images: {str(e)}")
         return jsonify({
@@ -81,13 +204,352 @@ def generate_images():
             'message': str(e)
         }), 500
 
+@app.route('/layout', methods=['POST'])
+def layout():
+    """Wrap and paginate a confession without rendering it: lines, widths and page count"""
+    data = request.get_json(silent=True)
+    
+    if not isinstance(data, dict) or not data.get('content'):
+        return jsonify({'error': 'content is required'}), 400
+    
+    try:
+        generator = image_generator.themed(data.get('theme'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    plan, content_error, status = plan_layout(data['content'], generator)
+    if plan is None:
+        return jsonify({'error': content_error}), status
+    
+    return jsonify({
+        'success': True,
+        'confession_id': data.get('confession_id'),
+        'renderable': content_error is None,
+        'error': content_error,
+        **plan.as_dict()
+    })
+
+@app.route('/generate-images/batch', methods=['POST'])
+def generate_images_batch():
+    """Generate images for many confessions, streaming NDJSON progress per item"""
+    data = request.get_json(silent=True)
+    
+    if not isinstance(data, dict) or not isinstance(data.get('items'), list):
+        return jsonify({'error': 'items array is required'}), 400
+    
+    items = data['items']
+    if len(items) > config['BATCH_MAX_ITEMS']:
+        return jsonify({'error': f"At most {config['BATCH_MAX_ITEMS']} items per batch"}), 413
+    
+    try:
+        default_format = resolve_format(data.get('format'), config['IMAGE_FORMAT'])
+        image_generator.themed(data.get('theme'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    # Batches are backfill traffic: refuse them up front if that lane is already saturated
+    try:
+        admission.check('backfill')
+    except Overloaded as e:
+        return overloaded_response(e)
+    
+    logger.info(f"Generating images for a batch of {len(items)} confessions")
+    
+    def progress():
+        succeeded = 0
+        for index, item in enumerate(items):
+            line = {'index': index, 'confession_id': item.get('confession_id') if isinstance(item, dict) else None}
+            try:
+                if not isinstance(item, dict) or not item.get('confession_id') or not item.get('content'):
+                    raise ValueError('confession_id and content are required')
+                if not is_confession_id(item['confession_id']):
+                    raise ValueError('confession_id cannot be used in an image filename')
+                
+                generator = image_generator.themed(item.get('theme') or data.get('theme'))
+                plan, content_error, _ = plan_layout(item['content'], generator)
+                if content_error:
+                    raise ValueError(content_error)
+                
+                with admission.admit('backfill'):
+                    result = generator.render_confession(item['confession_id'], item['content'],
+                                                         item.get('format') or default_format, plan)
+                line.update({
+                    'status': 'ok',
+                    'image_urls': result['image_urls'],
+                    'total_images': len(result['image_urls']),
+                    'cached': result['cached']
+                })
+                succeeded += 1
+            except Overloaded as e:
+                metrics.ERRORS.labels('generate_images_batch', 'item_overloaded').inc()
+                line.update({'status': 'error', 'error': str(e), 'retry_after': e.retry_after})
+            except Exception as e:
+                logger.error(f"Batch item {index} failed: {str(e)}")
+                metrics.ERRORS.labels('generate_images_batch', 'item_failed').inc()
+                line.update({'status': 'error', 'error': str(e)})
+            
+            yield json.dumps(line) + '\n'
+        
+        yield json.dumps({'done': True, 'total': len(items), 'succeeded': succeeded,
+                          'failed': len(items) - succeeded}) + '\n'
+    
+    return Response(stream_with_context(progress()), mimetype='application/x-ndjson')
+
+def stream_pages_response(confession_id, content, image_format, mode, lane, plan, generator):
+    """Render pages in memory and stream them back as a ZIP or multipart body"""
+    # The render slot is held until the whole body has been sent
+    ticket = admission.acquire(lane)
+    try:
+        pages = generator.iter_confession_pages(confession_id, content, image_format, plan)
+        
+        # Render the first page before answering so layout errors still produce a 500
+        pages = itertools.chain([next(pages)], pages)
+    except Exception:
+        ticket.release()
+        raise
+    
+    if mode == 'zip':
+        response = Response(stream_with_context(zip_stream(pages)), mimetype='application/zip')
+        filename = secure_filename(str(confession_id)) or 'confession'
+        response.headers['Content-Disposition'] = f'attachment; filename="{filename}.zip"'
+    else:
+        boundary = multipart_boundary()
+        response = Response(stream_with_context(multipart_stream(pages, boundary)),
+                            content_type=f'multipart/mixed; boundary={boundary}')
+    
+    response.call_on_close(ticket.release)
+    return response
+
+def parse_render_request(data):
+    """(confession_id, content, image_format, generator for its theme) of a render request body.
+
+    Raises ValueError if it is invalid.
+    """
+    if not data:
+        raise ValueError('No JSON data provided')
+    if not isinstance(data, dict):
+        raise ValueError('Request body must be a JSON object')
+    
+    confession_id = data.get('confession_id')
+    content = data.get('content')
+    
+    if not confession_id or not content:
+        raise ValueError('confession_id and content are required')
+    if not isinstance(content, str):
+        raise ValueError('content must be a string')
+    if not is_confession_id(confession_id):
+        raise ValueError('confession_id cannot be used in an image filename')
+    
+    image_format = resolve_format(data.get('format'), config['IMAGE_FORMAT'])
+    return confession_id, content, image_format, image_generator.themed(data.get('theme'))
+
+def render_response(confession_id, image_format, result):
+    """/generate-images body for a stored render"""
+    return {
+        'success': True,
+        'confession_id': confession_id,
+        'image_urls': result['image_urls'],
+        'total_images': len(result['image_urls']),
+        'format': image_format,
+        'image_sets': result['image_sets'],
+        'pages': result['pages'],
+        'cached': result['cached']
+    }
+
+def request_lane(data, priority_header=None):
+    """Admission lane: backfill when asked for with X-Priority or a priority field, live otherwise"""
+    priority = priority_header or data.get('priority') or 'live'
+    return 'backfill' if str(priority).lower() == 'backfill' else 'live'
+
+def plan_layout(content, generator=None):
+    """Lay out content with generator's theme.
+
+    Returns (plan, error, status): error says why the content cannot be
+    rendered and status is the HTTP status to answer with.
+    """
+    if not isinstance(content, str):
+        return None, 'content must be a string', 400
+    if len(content) > config['MAX_CONTENT_CHARS']:
+        return None, f"content is longer than {config['MAX_CONTENT_CHARS']} characters", 413
+    
+    plan = (generator or image_generator).layout(content)
+    if not plan.pages:
+        return plan, 'content has no text to render', 400
+    if len(plan.pages) > config['MAX_PAGES']:
+        return plan, f"content needs {len(plan.pages)} pages, more than the {config['MAX_PAGES']} allowed", 413
+    return plan, None, None
+
+def overloaded_response(error):
+    """429 with a Retry-After hint"""
+    response = jsonify({'error': 'Too many renders in progress', 'message': str(error),
+                        'retry_after': error.retry_after})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response
+
+def log_encoding_stats(confession_id, result):
+    """Log encoded size and encode time for each page"""
+    if result['cached']:
+        logger.info(f"Served confession {confession_id} from the render cache")
+        return
+    
+    for page in result['pages']:
+        logger.info(f"Encoded {page['url']} as {page['format']}: {page['bytes']} bytes in {page['encode_ms']}ms")
+
+def ensure_size_variant(filename, source):
+    """Derive a configured size variant from its page when it is missing or older than the page"""
+    original = storage.find(size_variant(filename)[0])
+    if original is None:
+        return source
+    if source is None or source.mtime < original.mtime:
+        if image_generator.create_size_variant(filename) is not None:
+            return storage.find(filename)
+    return source
+
+def negotiate_image(filename, source, accept):
+    """Return the name of a variant of filename in a format the client prefers, if any"""
+    if not config['NEGOTIATE_IMAGE_FORMATS']:
+        return None
+    
+    image_format = negotiate_format(accept, config['NEGOTIATE_IMAGE_FORMATS'])
+    if image_format is None:
+        return None
+    
+    stem, _ = os.path.splitext(filename)
+    variant_name = f"{stem}.{ENCODERS[image_format].extension}"
+    if variant_name == filename:
+        return None
+    
+    # Transcode once and keep the result next to the original
+    variant = storage.find(variant_name)
+    if variant is None or variant.mtime < source.mtime:
+        stats = image_generator.transcode_image(filename, variant_name, image_format)
+        logger.info(f"Transcoded {filename} to {image_format}: {stats['bytes']} bytes in {stats['encode_ms']}ms")
+    
+    return variant_name
+
+def image_cache_control(digest, version):
+    """Long-lived caching for URLs versioned with the current content hash, revalidation otherwise"""
+    if len(version) >= 8 and digest.startswith(version):
+        return 'public, max-age=31536000, immutable'
+    return f"public, max-age={config['IMAGE_CACHE_MAX_AGE']}, must-revalidate"
+
 @app.route('/images/<filename>')
 def serve_image(filename):
     """Serve generated images"""
-    try:
-        return send_from_directory(config['IMAGES_DIR'], filename)
-    except FileNotFoundError:
+    source = storage.find(filename) if is_image_name(filename) else None
+    if size_variant(filename) is not None:
+        source = ensure_size_variant(filename, source)
+    if source is None:
         return jsonify({'error': 'Image not found'}), 404
+    
+    served_name = negotiate_image(filename, source, request.headers.get('Accept')) or filename
+    digest = storage.digest(served_name)
+    image_path = storage.local_path(served_name)
+    
+    if config['IMAGES_ACCEL_REDIRECT_PREFIX'] and image_path is not None:
+        # Flask only resolves the file; nginx sends it (including range requests)
+        if request.if_none_match.contains(digest):
+            response = Response(status=304)
+        else:
+            response = Response(mimetype=mimetypes.guess_type(served_name)[0] or 'application/octet-stream')
+            response.headers['X-Accel-Redirect'] = (config['IMAGES_ACCEL_REDIRECT_PREFIX']
+                                                    + quote(storage.relative_path(served_name)))
+        response.set_etag(digest)
+    elif image_path is not None:
+        # Strong content-hash ETag; handles If-None-Match (304) and Range requests
+        response = send_file(image_path, etag=digest, conditional=True, max_age=None)
+    else:
+        # Object storage: proxy the bytes, with the same conditional handling
+        mimetype = mimetypes.guess_type(served_name)[0] or 'application/octet-stream'
+        response = send_file(io.BytesIO(storage.read(served_name)), mimetype=mimetype,
+                             etag=digest, conditional=True, max_age=None)
+    
+    # ?v= is the hash of the requested file; a format negotiated from it is just as immutable
+    requested_digest = digest if served_name == filename else storage.digest(filename)
+    response.headers['Cache-Control'] = image_cache_control(requested_digest, request.args.get('v', ''))
+    if config['NEGOTIATE_IMAGE_FORMATS']:
+        response.vary.add('Accept')
+    
+    return response
+
+def process_confession_job(payload):
+    """Render a queued confession and report the images to the PHP API"""
+    confession_id = payload['confession_id']
+    
+    try:
+        generator = image_generator.themed(payload.get('theme'))
+        plan = generator.plan_from_payload(payload.get('plan'))
+        result = generator.render_confession(confession_id, payload['content'], payload.get('format'), plan)
+    except Exception:
+        metrics.ERRORS.labels('confession_created_webhook', 'job_failed').inc()
+        raise
+    image_urls = result['image_urls']
+    logger.info(f"Generated {len(image_urls)} images for confession {confession_id}")
+    log_encoding_stats(confession_id, result)
+    
+    # Delivered (and retried) in the background by the callback outbox
+    callback_outbox.enqueue(confession_id, image_urls)
+    
+    return {
+        'image_urls': image_urls,
+        'total_images': len(image_urls),
+        'image_sets': result['image_sets'],
+        'pages': result['pages']
+    }
+
+# Durable, retrying delivery of image URLs to the PHP API
+callback_outbox = CallbackOutbox(
+    config['OUTBOX_DB_PATH'],
+    PHP_API_BASE_URL,
+    max_attempts=config['CALLBACK_MAX_ATTEMPTS'],
+    timeout=config['CALLBACK_TIMEOUT'],
+)
+
+# Background render queue for webhook requests
+job_queue = JobQueue(
+    config['JOBS_DB_PATH'],
+    process_confession_job,
+    workers=config['RENDER_WORKERS'],
+    lease_seconds=config['JOB_LEASE_SECONDS'],
+    max_attempts=config['JOB_MAX_ATTEMPTS'],
+)
+
+# Set once this process is warmed up and its background threads run (see /ready)
+worker_ready = threading.Event()
+
+def start_worker():
+    """Warm up the renderer and start the background threads of a serving process"""
+    warm_up_ms = image_generator.warm_up()
+    callback_outbox.start()
+    job_queue.start()
+    worker_ready.set()
+    logger.info(f"Worker {os.getpid()} ready after a {warm_up_ms:.0f}ms warm-up render")
+
+# Decode the prepared background now; under gunicorn --preload this happens once, in the master
+image_generator.create_gradient_background()
+
+if config['START_BACKGROUND_WORKERS']:
+    start_worker()
+
+def check_job_queue(depth):
+    """Raise Overloaded when the render queue already holds JOB_QUEUE_MAX_DEPTH jobs"""
+    if depth >= config['JOB_QUEUE_MAX_DEPTH']:
+        retry_after = max(1, round(depth * admission.stats()['avg_render_seconds'] / config['RENDER_WORKERS']))
+        raise Overloaded('live', retry_after)
+
+def job_response(job):
+    """Public representation of a render job"""
+    result = job['result'] or {}
+    return {
+        'job_id': job['job_id'],
+        'status': job['status'],
+        'confession_id': job['payload'].get('confession_id'),
+        'image_urls': result.get('image_urls', []),
+        'total_images': result.get('total_images', 0),
+        'error': job['error'],
+        'status_url': f"/jobs/{job['job_id']}"
+    }
 
 @app.route('/webhook/confession-created', methods=['POST'])
 def confession_created_webhook():
@@ -95,48 +557,34 @@ def confession_created_webhook():
     try:
         data = request.get_json()
         
-        if not data:
-            return jsonify({'error': 'No JSON data provided'}), 400
+        try:
+            confession_id, content, image_format, generator = parse_render_request(data)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
-        confession_id = data.get('confession_id')
-        content = data.get('content')
+        plan, content_error, status = plan_layout(content, generator)
+        if content_error:
+            return jsonify({'error': content_error}), status
         
-        if not confession_id or not content:
-            return jsonify({'error': 'confession_id and content are required'}), 400
+        # The render queue is the webhook's wait queue; keep it bounded too
+        try:
+            check_job_queue(job_queue.depth())
+        except Overloaded as e:
+            return overloaded_response(e)
         
         logger.info(f"Received webhook for confession {confession_id}")
         
-        # Generate images
-        image_urls = image_generator.generate_confession_images(confession_id, content)
-        
-        # Send the image URLs back to the PHP API
-        update_payload = {
-            'confession_id': confession_id,
-            'image_urls': image_urls
-        }
-        
-        try:
-            response = requests.post(
-                f"{PHP_API_BASE_URL}/api/confessions/{confession_id}/update-images",
-                json=update_payload,
-                timeout=10
-            )
-            
-            if response.status_code == 200:
-                logger.info(f"Successfully updated confession {confession_id} with images")
-            else:
-                logger.warning(f"Failed to update confession {confession_id}: {response.status_code}")
-                
-        except requests.RequestException as e:
-            logger.error(f"Failed to send images back to PHP API: {str(e)}")
-        
-        return jsonify({
-            'success': True,
+        # Render in the background, reusing this layout; the images are posted back to the PHP API when done
+        job = job_queue.enqueue({
             'confession_id': confession_id,
-            'image_urls': image_urls,
-            'total_images': len(image_urls)
+            'content': content,
+            'format': image_format,
+            'theme': generator.theme,
+            'plan': generator.plan_payload(plan)
         })
         
+        return jsonify({'success': True, **job_response(job)}), 202
+        
     except Exception as e:
         logger.error(f"Error in webhook: {str(e)}")
         return jsonify({
@@ -144,6 +592,16 @@ def confession_created_webhook():
             'message': str(e)
         }), 500
 
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Report the status of a queued render job"""
+    job = job_queue.get(job_id)
+    
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    
+    return jsonify(job_response(job))
+
 @app.errorhandler(404)
 def not_found(error):
     return jsonify({'error': 'Endpoint not found'}), 404
@@ -0,0 +1,408 @@
+"""ASGI serving mode: the render API on an event loop.
+
+    hypercorn asgi_app:app --bind 0.0.0.0:8001 --workers 2
+
+Requests, image downloads and the PHP callbacks (through an async HTTP client)
+are handled by the event loop, so an idle keep-alive or a slow download costs a
+coroutine instead of a worker thread. Layout, rendering and transcoding run on a
+bounded thread executor of RENDER_CONCURRENCY threads, behind the same admission
+lanes as the WSGI app. Pillow releases the GIL while it resizes and encodes, but
+not while FreeType draws text, so the executor mainly keeps the loop responsive;
+RENDER_PROCESSES is what spreads the drawing of long confessions over cores.
+Services, config and helpers are shared with app.py; the batch endpoint stays
+on the WSGI app.
+"""
+import asyncio
+import functools
+import io
+import itertools
+import logging
+import mimetypes
+import os
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
+
+# The job queue and the outbox dispatcher are started below, once the loop runs
+os.environ['START_BACKGROUND_WORKERS'] = 'False'
+
+import httpx  # noqa: E402
+from quart import Quart, Response, g, jsonify, request, send_file  # noqa: E402
+from werkzeug.utils import secure_filename  # noqa: E402
+
+import app as wsgi  # noqa: E402
+import metrics  # noqa: E402
+from admission import Overloaded  # noqa: E402
+from storage import is_image_name, size_variant  # noqa: E402
+from streaming import multipart_boundary, multipart_stream, zip_stream  # noqa: E402
+
+logger = logging.getLogger(__name__)
+
+config = wsgi.config
+image_generator = wsgi.image_generator
+storage = wsgi.storage
+admission = wsgi.admission
+job_queue = wsgi.job_queue
+callback_outbox = wsgi.callback_outbox
+
+app = Quart(__name__)
+
+# CPU-bound work; admission already keeps renders within RENDER_CONCURRENCY
+render_executor = ThreadPoolExecutor(config['RENDER_CONCURRENCY'], thread_name_prefix='render')
+# Requests queued for a render slot block a thread each; the admission queues bound how many
+admission_executor = ThreadPoolExecutor(
+    config['RENDER_CONCURRENCY'] + config['RENDER_QUEUE_SIZE'] + config['BACKFILL_QUEUE_SIZE'],
+    thread_name_prefix='admission'
+)
+
+# Outbox dispatcher task and its HTTP client, while serving
+background = {}
+
+_DONE = object()
+
+
+async def run_cpu(function, *args):
+    """Run CPU-bound service work on the render executor"""
+    return await asyncio.get_running_loop().run_in_executor(render_executor, functools.partial(function, *args))
+
+
+async def acquire(lane):
+    """Wait for a render slot without blocking the event loop"""
+    granted = asyncio.get_running_loop().run_in_executor(admission_executor, admission.acquire, lane)
+    try:
+        return await asyncio.shield(granted)
+    except asyncio.CancelledError:
+        # The client went away while queued; give the slot back once it is granted
+        granted.add_done_callback(_release_granted)
+        raise
+
+
+def _release_granted(granted):
+    if not granted.cancelled() and granted.exception() is None:
+        granted.result().release()
+
+
+async def iterate_in_executor(iterator):
+    """Pull a blocking iterator (rendering one page per step) from the render executor"""
+    while True:
+        item = await run_cpu(next, iterator, _DONE)
+        if item is _DONE:
+            return
+        yield item
+
+
+class TicketBody:
+    """Streamed response body that holds a render slot until it is closed.
+
+    Quart closes the body once it has been sent or the client went away; if
+    the body is dropped without ever being started (the request was cancelled
+    before the response began), the slot is released when it is collected.
+    """
+
+    def __init__(self, chunks, ticket):
+        self._chunks = iterate_in_executor(chunks)
+        self._release = weakref.finalize(self, ticket.release)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        return await self._chunks.__anext__()
+
+    async def aclose(self):
+        try:
+            await self._chunks.aclose()
+        finally:
+            self._release()
+
+
+@app.before_serving
+async def start_worker():
+    """Warm up the renderer and start the job queue and the async callback dispatcher"""
+    warm_up_ms = await run_cpu(image_generator.warm_up)
+    job_queue.start()
+    client = httpx.AsyncClient(limits=httpx.Limits(max_connections=4, max_keepalive_connections=4))
+    background['client'] = client
+    background['outbox'] = asyncio.create_task(callback_outbox.run_async(client))
+    wsgi.worker_ready.set()
+    logger.info(f"Worker {os.getpid()} ready after a {warm_up_ms:.0f}ms warm-up render")
+
+
+@app.after_serving
+async def stop_worker():
+    wsgi.worker_ready.clear()
+    callback_outbox.stop()
+    await asyncio.to_thread(job_queue.stop)
+    if 'outbox' in background:
+        await background.pop('outbox')
+        await background.pop('client').aclose()
+
+
+@app.before_request
+async def start_request_timer():
+    g.request_started = time.perf_counter()
+
+
+@app.after_request
+async def observe_request(response):
+    """Record request latency (until the headers are ready) and failed responses per endpoint"""
+    endpoint = request.endpoint or 'unmatched'
+    if 'request_started' in g:
+        metrics.REQUEST_SECONDS.labels(endpoint).observe(time.perf_counter() - g.request_started)
+    if response.status_code >= 400:
+        metrics.ERRORS.labels(endpoint, str(response.status_code)).inc()
+    return response
+
+
+def overloaded_response(error):
+    """429 with a Retry-After hint"""
+    response = jsonify({'error': 'Too many renders in progress', 'message': str(error),
+                        'retry_after': error.retry_after})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response
+
+
+@app.route('/health', methods=['GET'])
+async def health_check():
+    """Health check endpoint"""
+    response = {
+        'status': 'healthy',
+        'service': 'noot-not-image-api',
+        'version': '1.0.0',
+        'server': 'asgi'
+    }
+
+    if image_generator.render_cache is not None:
+        response['render_cache'] = image_generator.render_cache.stats()
+
+    response['callback_outbox'] = await asyncio.to_thread(callback_outbox.stats)
+    response['admission'] = admission.stats()
+    response['render_contexts'] = image_generator.render_contexts.stats()
+    response['memory'] = {**image_generator.memory_budget.stats(), 'canvas_pool': image_generator.canvas_pool.stats()}
+
+    return jsonify(response)
+
+
+@app.route('/ready', methods=['GET'])
+async def readiness_check():
+    """Readiness endpoint: 503 until this worker has warmed up and started its background tasks"""
+    if not wsgi.worker_ready.is_set():
+        return jsonify({'status': 'starting', 'pid': os.getpid()}), 503
+
+    return jsonify({'status': 'ready', 'pid': os.getpid()})
+
+
+@app.route('/metrics', methods=['GET'])
+async def metrics_endpoint():
+    """Prometheus metrics, aggregated over all worker processes"""
+    if not metrics.METRICS_ENABLED:
+        return jsonify({'error': 'prometheus_client is not installed'}), 501
+
+    data, content_type = await asyncio.to_thread(metrics.render_latest)
+    return Response(data, content_type=content_type)
+
+
+@app.route('/generate-images', methods=['POST'])
+async def generate_images():
+    """Generate images for a confession"""
+    try:
+        data = await request.get_json()
+
+        try:
+            confession_id, content, image_format, generator = await run_cpu(wsgi.parse_render_request, data)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        mode = data.get('mode', 'store')
+        if mode not in wsgi.GENERATE_MODES:
+            return jsonify({'error': f"mode must be one of: {', '.join(wsgi.GENERATE_MODES)}"}), 400
+
+        plan, content_error, status = await run_cpu(wsgi.plan_layout, content, generator)
+        if content_error:
+            return jsonify({'error': content_error}), status
+
+        lane = wsgi.request_lane(data, request.headers.get('X-Priority'))
+
+        if mode != 'store':
+            logger.info(f"Streaming images for confession {confession_id} as {mode}")
+            return await stream_pages_response(confession_id, content, image_format, mode, lane, plan, generator)
+
+        logger.info(f"Generating images for confession {confession_id}")
+
+        ticket = await acquire(lane)
+        try:
+            result = await run_cpu(generator.render_confession, confession_id, content, image_format, plan)
+        finally:
+            ticket.release()
+
+        logger.info(f"Generated {len(result['image_urls'])} images for confession {confession_id}")
+        wsgi.log_encoding_stats(confession_id, result)
+
+        return jsonify(wsgi.render_response(confession_id, image_format, result))
+
+    except Overloaded as e:
+        return overloaded_response(e)
+    except Exception as e:
+        logger.error(f"Error generating images: {str(e)}")
+        return jsonify({
+            'error': 'Failed to generate images',
+            'message': str(e)
+        }), 500
+
+
+async def stream_pages_response(confession_id, content, image_format, mode, lane, plan, generator):
+    """Render pages in memory and stream them back as a ZIP or multipart body"""
+    # The render slot is held until the whole body has been sent
+    ticket = await acquire(lane)
+    try:
+        pages = generator.iter_confession_pages(confession_id, content, image_format, plan)
+
+        # Render the first page before answering so layout errors still produce a 500
+        pages = itertools.chain([await run_cpu(next, pages)], pages)
+    except BaseException:
+        ticket.release()
+        raise
+
+    if mode == 'zip':
+        body, headers = zip_stream(pages), {'Content-Type': 'application/zip'}
+        filename = secure_filename(str(confession_id)) or 'confession'
+        headers['Content-Disposition'] = f'attachment; filename="{filename}.zip"'
+    else:
+        boundary = multipart_boundary()
+        body, headers = multipart_stream(pages, boundary), {'Content-Type': f'multipart/mixed; boundary={boundary}'}
+
+    return Response(TicketBody(body, ticket), headers=headers)
+
+
+@app.route('/layout', methods=['POST'])
+async def layout():
+    """Wrap and paginate a confession without rendering it: lines, widths and page count"""
+    data = await request.get_json(silent=True)
+
+    if not isinstance(data, dict) or not data.get('content'):
+        return jsonify({'error': 'content is required'}), 400
+
+    try:
+        generator = await run_cpu(image_generator.themed, data.get('theme'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    plan, content_error, status = await run_cpu(wsgi.plan_layout, data['content'], generator)
+    if plan is None:
+        return jsonify({'error': content_error}), status
+
+    return jsonify({
+        'success': True,
+        'confession_id': data.get('confession_id'),
+        'renderable': content_error is None,
+        'error': content_error,
+        **plan.as_dict()
+    })
+
+
+@app.route('/webhook/confession-created', methods=['POST'])
+async def confession_created_webhook():
+    """Webhook endpoint for when a confession is created"""
+    try:
+        data = await request.get_json()
+
+        try:
+            confession_id, content, image_format, generator = await run_cpu(wsgi.parse_render_request, data)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        plan, content_error, status = await run_cpu(wsgi.plan_layout, content, generator)
+        if content_error:
+            return jsonify({'error': content_error}), status
+
+        try:
+            wsgi.check_job_queue(await asyncio.to_thread(job_queue.depth))
+        except Overloaded as e:
+            return overloaded_response(e)
+
+        logger.info(f"Received webhook for confession {confession_id}")
+
+        # Render in the background, reusing this layout; the images are posted back to the PHP API when done
+        job = await asyncio.to_thread(job_queue.enqueue, {
+            'confession_id': confession_id,
+            'content': content,
+            'format': image_format,
+            'theme': generator.theme,
+            'plan': generator.plan_payload(plan)
+        })
+
+        return jsonify({'success': True, **wsgi.job_response(job)}), 202
+
+    except Exception as e:
+        logger.error(f"Error in webhook: {str(e)}")
+        return jsonify({
+            'error': 'Webhook processing failed',
+            'message': str(e)
+        }), 500
+
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+async def get_job(job_id):
+    """Report the status of a queued render job"""
+    job = await asyncio.to_thread(job_queue.get, job_id)
+
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+
+    return jsonify(wsgi.job_response(job))
+
+
+@app.route('/images/<filename>')
+async def serve_image(filename):
+    """Serve generated images; files are streamed by the loop, derived variants are encoded on the executor"""
+    source = await asyncio.to_thread(storage.find, filename) if is_image_name(filename) else None
+    if size_variant(filename) is not None:
+        source = await run_cpu(wsgi.ensure_size_variant, filename, source)
+    if source is None:
+        return jsonify({'error': 'Image not found'}), 404
+
+    served_name = filename
+    if config['NEGOTIATE_IMAGE_FORMATS']:
+        served_name = await run_cpu(wsgi.negotiate_image, filename, source, request.headers.get('Accept')) or filename
+    digest = await asyncio.to_thread(storage.digest, served_name)
+    image_path = await asyncio.to_thread(storage.local_path, served_name)
+    mimetype = mimetypes.guess_type(served_name)[0] or 'application/octet-stream'
+
+    if config['IMAGES_ACCEL_REDIRECT_PREFIX'] and image_path is not None:
+        # Only resolve the file; nginx sends it (including range requests)
+        if request.if_none_match.contains(digest):
+            response = Response(b'', status=304)
+        else:
+            response = Response(b'', mimetype=mimetype)
+            location = await asyncio.to_thread(storage.relative_path, served_name)
+            response.headers['X-Accel-Redirect'] = config['IMAGES_ACCEL_REDIRECT_PREFIX'] + quote(location)
+        response.set_etag(digest)
+    else:
+        # Local files are read asynchronously; object storage is proxied from memory
+        if image_path is None:
+            image_path = io.BytesIO(await asyncio.to_thread(storage.read, served_name))
+        response = await send_file(image_path, mimetype=mimetype, add_etags=False)
+        response.set_etag(digest)
+        del response.headers['Expires']
+        # Strong content-hash ETag; handles If-None-Match (304) and Range requests
+        await response.make_conditional(request, accept_ranges=True, complete_length=response.content_length)
+
+    # ?v= is the hash of the requested file; a format negotiated from it is just as immutable
+    requested_digest = digest if served_name == filename else await asyncio.to_thread(storage.digest, filename)
+    response.headers['Cache-Control'] = wsgi.image_cache_control(requested_digest, request.args.get('v', ''))
+    if config['NEGOTIATE_IMAGE_FORMATS']:
+        response.vary.add('Accept')
+
+    return response
+
+
+@app.errorhandler(404)
+async def not_found(error):
+    return jsonify({'error': 'Endpoint not found'}), 404
+
+
+@app.errorhandler(500)
+async def internal_error(error):
+    return jsonify({'error': 'Internal server error'}), 500
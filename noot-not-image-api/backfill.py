@@ -0,0 +1,184 @@
+"""Re-render confessions in bulk and report their images to the PHP API.
+
+Reads a JSONL file of {"confession_id": ..., "content": ...} objects, renders
+them with a pool of worker processes and posts each result to the PHP
+update-images endpoint over a pooled keep-alive session. Every finished
+confession is appended to a state file, so an interrupted run can simply be
+started again and picks up where it stopped.
+
+    python backfill.py confessions.jsonl --workers 4 --state backfill-state.jsonl
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Dict, Iterator, Optional, Set
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from encoders import resolve_format
+from render_pool import create_worker_pool, render_confession_job
+from settings import load_config
+
+logger = logging.getLogger('backfill')
+
+
+def read_items(path: str) -> Iterator[Dict[str, Any]]:
+    """Yield confession items from a JSONL file, skipping blank and invalid lines"""
+    with open(path, 'r', encoding='utf-8') as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                item = json.loads(line)
+            except ValueError:
+                logger.warning(f"Skipping invalid JSON on line {line_number}")
+                continue
+            if not isinstance(item, dict) or not item.get('confession_id') or not item.get('content'):
+                logger.warning(f"Skipping line {line_number}: expected an object with confession_id and content")
+                continue
+            yield item
+
+
+def load_completed(state_path: str) -> Set[str]:
+    """Confession ids already finished by a previous run"""
+    completed = set()
+    if not os.path.exists(state_path):
+        return completed
+
+    with open(state_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                completed.add(str(json.loads(line)['confession_id']))
+            except (ValueError, KeyError):
+                # A run killed mid-write can leave a truncated last line
+                continue
+    return completed
+
+
+def create_session(pool_size: int) -> requests.Session:
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def post_images(session: requests.Session, base_url: str, confession_id: Any, image_urls: list,
+                attempts: int = 3, timeout: float = 10) -> Optional[str]:
+    """Send image URLs to the PHP API; returns an error message or None on success"""
+    error = None
+    for attempt in range(attempts):
+        try:
+            response = session.post(
+                f"{base_url}/api/confessions/{confession_id}/update-images",
+                json={'confession_id': confession_id, 'image_urls': image_urls},
+                timeout=timeout
+            )
+            if response.status_code == 200:
+                return None
+            error = f"PHP API answered {response.status_code}"
+            # Client errors (e.g. deleted confession) will not get better with retries
+            if response.status_code < 500:
+                return error
+        except requests.RequestException as e:
+            error = str(e)
+        if attempt + 1 < attempts:
+            time.sleep(2 ** attempt)
+    return error
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Re-render confession images in bulk')
+    parser.add_argument('input', help='JSONL file with confession_id and content per line')
+    parser.add_argument('--state', default='backfill-state.jsonl',
+                        help='File recording finished confessions, used to resume (default: %(default)s)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 2,
+                        help='Render processes (default: number of CPUs)')
+    parser.add_argument('--format', help='Output format, overriding IMAGE_FORMAT')
+    parser.add_argument('--php-url', help='PHP API base URL, overriding PHP_API_BASE_URL')
+    parser.add_argument('--callback-concurrency', type=int, default=8,
+                        help='Concurrent update-images requests (default: %(default)s)')
+    parser.add_argument('--no-callback', action='store_true', help='Render only, do not notify the PHP API')
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    args = parse_args(argv)
+
+    config = load_config()
+    config['RENDER_PROCESSES'] = 0
+    image_format = resolve_format(args.format, config['IMAGE_FORMAT'])
+    base_url = args.php_url or config['PHP_API_BASE_URL']
+
+    completed = load_completed(args.state)
+    if completed:
+        logger.info(f"Resuming: {len(completed)} confessions already done")
+    pending = (item for item in read_items(args.input) if str(item['confession_id']) not in completed)
+
+    session = create_session(args.callback_concurrency)
+    done = failed = 0
+    started = time.time()
+
+    with open(args.state, 'a', encoding='utf-8') as state, \
+            create_worker_pool(config, args.workers) as renders, \
+            ThreadPoolExecutor(args.callback_concurrency) as callbacks:
+
+        def record(item: Dict[str, Any], image_urls: list):
+            nonlocal done
+            state.write(json.dumps({'confession_id': item['confession_id'], 'image_urls': image_urls}) + '\n')
+            state.flush()
+            done += 1
+            if done % 100 == 0:
+                logger.info(f"{done} confessions done ({done / (time.time() - started):.1f}/s)")
+
+        in_flight = {}
+        exhausted = False
+
+        while in_flight or not exhausted:
+            # Keep a bounded number of renders queued so huge inputs are streamed
+            while not exhausted and sum(1 for kind, _ in in_flight.values() if kind == 'render') < args.workers * 2:
+                item = next(pending, None)
+                if item is None:
+                    exhausted = True
+                    break
+                job = {**item, 'format': item.get('format') or image_format}
+                in_flight[renders.submit(render_confession_job, job)] = ('render', item)
+
+            if not in_flight:
+                break
+
+            finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in finished:
+                kind, item = in_flight.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    logger.error(f"Confession {item['confession_id']} failed to {kind}: {str(e)}")
+                    failed += 1
+                    continue
+
+                if kind == 'render' and not args.no_callback:
+                    callback = callbacks.submit(post_images, session, base_url, item['confession_id'],
+                                                result['image_urls'])
+                    in_flight[callback] = ('callback', {**item, 'image_urls': result['image_urls']})
+                elif kind == 'render':
+                    record(item, result['image_urls'])
+                elif result is None:
+                    record(item, item['image_urls'])
+                else:
+                    logger.error(f"Confession {item['confession_id']} was rendered but not updated: {result}")
+                    failed += 1
+
+    logger.info(f"Finished: {done} done, {failed} failed in {time.time() - started:.1f}s")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,127 @@
+import os
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from PIL import Image
+
+# Purple to blue gradient used when the background image cannot be loaded
+GRADIENT_TOP = (107, 114, 224)
+GRADIENT_BOTTOM = (67, 56, 184)
+
+
+def create_gradient(size: Tuple[int, int]) -> Image.Image:
+    """Build the fallback vertical gradient one row at a time"""
+    width, height = size
+
+    # Compute one pixel per row, then stretch the column across the full width
+    column = Image.new('RGB', (1, height))
+    column.putdata([
+        tuple(int(top + (bottom - top) * (y / height)) for top, bottom in zip(GRADIENT_TOP, GRADIENT_BOTTOM))
+        for y in range(height)
+    ])
+
+    return column.resize((width, height), Image.Resampling.NEAREST)
+
+
+class BackgroundCache:
+    """Decodes and resizes page backgrounds once, reloading when the file changes"""
+
+    def __init__(self):
+        self._entries: Dict[Tuple[str, Tuple[int, int]], Tuple[Optional[int], Image.Image]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, path: str, size: Tuple[int, int]) -> Image.Image:
+        """Return a private copy of the prepared background that callers may draw on"""
+        return self.get_prepared(path, size).copy()
+
+    def get_prepared(self, path: str, size: Tuple[int, int]) -> Image.Image:
+        """Return the shared prepared background; callers must not modify it"""
+        key = (path, size)
+        mtime = self._mtime(path)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == mtime:
+                return entry[1]
+
+        background = self._load(path, size)
+
+        with self._lock:
+            self._entries[key] = (mtime, background)
+
+        return background
+
+    def clear(self):
+        """Drop every prepared background"""
+        with self._lock:
+            self._entries.clear()
+
+    def _mtime(self, path: str) -> Optional[int]:
+        try:
+            return os.stat(path).st_mtime_ns
+        except OSError:
+            return None
+
+    def _load(self, path: str, size: Tuple[int, int]) -> Image.Image:
+        try:
+            with Image.open(path) as source:
+                # Convert to RGB if necessary (in case it's RGBA or other format)
+                background = source.convert('RGB') if source.mode != 'RGB' else source.copy()
+
+            # Resize to match our target dimensions if needed
+            if background.size != size:
+                background = background.resize(size, Image.Resampling.LANCZOS)
+
+            return background
+
+        except Exception as e:
+            print(f"Error loading background image from {path}: {e}")
+            print("Falling back to gradient background")
+            return create_gradient(size)
+
+
+class CanvasPool:
+    """Page-sized RGB canvases reused across pages instead of copying the background into a new buffer.
+
+    A borrowed canvas still holds the previous page, so callers paste the prepared
+    background over it before drawing. It goes back to the pool when the block
+    exits; at most max_idle canvases (the most recently returned) are kept.
+    """
+
+    def __init__(self, max_idle: int = 2):
+        self.max_idle = max_idle
+        self._idle: List[Image.Image] = []
+        self._lock = threading.Lock()
+        self._created = 0
+        self._reused = 0
+
+    @contextmanager
+    def borrow(self, size: Tuple[int, int]) -> Iterator[Image.Image]:
+        """An RGB canvas of size for use inside the block only"""
+        canvas = self._take(size)
+        try:
+            yield canvas
+        finally:
+            with self._lock:
+                self._idle.append(canvas)
+                # Keep the most recently returned canvases, whatever their size
+                if len(self._idle) > self.max_idle:
+                    del self._idle[:len(self._idle) - self.max_idle]
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {'idle': len(self._idle), 'created': self._created, 'reused': self._reused}
+
+    def clear(self):
+        with self._lock:
+            self._idle.clear()
+
+    def _take(self, size: Tuple[int, int]) -> Image.Image:
+        with self._lock:
+            for index, canvas in enumerate(self._idle):
+                if canvas.size == size:
+                    self._reused += 1
+                    return self._idle.pop(index)
+            self._created += 1
+        return Image.new('RGB', size)
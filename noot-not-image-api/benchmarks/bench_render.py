@@ -0,0 +1,225 @@
+"""Benchmarks for the confession render pipeline.
+
+Times each stage of ImageGeneratorService separately (text wrapping and
+layout, background preparation, text drawing, PNG encoding and the full
+generate_confession_images call) over synthetic corpora, and writes the
+results as JSON. The compare mode fails when a stage got slower than a
+baseline by more than a given percentage.
+
+    python benchmarks/bench_render.py run -o baseline.json
+    python benchmarks/bench_render.py run -o current.json --baseline baseline.json --threshold 15
+    python benchmarks/bench_render.py compare baseline.json current.json --threshold 15
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, List
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVICE_DIR)
+
+import PIL  # noqa: E402
+
+from encoders import encode_image  # noqa: E402
+from image_generator import ImageGeneratorService  # noqa: E402
+
+# The PHP API accepts confessions of up to 1000 bytes
+MAX_CONTENT_BYTES = 1000
+
+
+def _fill(unit: str, max_bytes: int = MAX_CONTENT_BYTES) -> str:
+    text = ''
+    while len((text + unit).encode('utf-8')) <= max_bytes:
+        text += unit
+    return text.strip()
+
+
+CORPORA: Dict[str, str] = {
+    'short': 'Nunca le dije a nadie que reprobé el examen de manejo tres veces.',
+    'max_length': _fill('Confieso que todas las mañanas le robo un poco de café a mi compañero de piso '),
+    'emoji_heavy': _fill('me reí tanto 😂😂 que lloré 😭 ❤️ 👍🏽 👨‍👩‍👧 🇨🇱 '),
+    'long_word': 'Estoy ' + 'a' * 600 + ' cansado',
+    'cjk': _fill('我从来没有告诉过任何人这件事情，'),
+}
+
+
+def build_service(images_dir: str) -> ImageGeneratorService:
+    return ImageGeneratorService({
+        'FONTS_DIR': os.path.join(SERVICE_DIR, 'assets', 'fonts'),
+        'BACKGROUND_DIR': os.path.join(SERVICE_DIR, 'assets', 'backgrounds'),
+        'IMAGES_DIR': images_dir,
+    })
+
+
+def draw_lines(service: ImageGeneratorService, image, lines: List[str]):
+    """The text drawing part of render_page"""
+    start_y = (service.image_height - len(lines) * service.line_height) // 2
+    for index, line in enumerate(lines):
+        x = (service.image_width - service.get_mixed_text_width(line)) // 2
+        service.add_mixed_text_with_effects(image, line, x, start_y + index * service.line_height)
+
+
+def stage_timers(service: ImageGeneratorService, text: str) -> Dict[str, Callable[[], Any]]:
+    """Callables for every benchmarked stage; setup work happens here, outside the timings"""
+    first_page = service.paginate(text)[0]
+    page_image = service.render_page(first_page, 1, 1, 1)
+    background = service.create_gradient_background()
+
+    def wrap_text_cold():
+        service.text_measurer.cache.clear()
+        service.wrap_text(text)
+
+    return {
+        'wrap_text': lambda: service.wrap_text(text),
+        'wrap_text_cold': wrap_text_cold,
+        'layout': lambda: service.layout(text),
+        'create_gradient_background': service.create_gradient_background,
+        'add_mixed_text_with_effects': lambda: draw_lines(service, background.copy(), first_page),
+        'encode_png': lambda: encode_image(page_image, 'png', service.config),
+        'generate_confession_images': lambda: service.generate_confession_images(1, text),
+    }
+
+
+def measure(fn: Callable[[], Any], repeat: int, warmup: int) -> Dict[str, Any]:
+    for _ in range(warmup):
+        fn()
+
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+
+    samples.sort()
+    return {
+        'median_ms': round(statistics.median(samples), 3),
+        'min_ms': round(samples[0], 3),
+        'p95_ms': round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 3),
+        'runs': repeat,
+    }
+
+
+def run(corpora: List[str], stages: List[str], repeat: int, warmup: int) -> Dict[str, Any]:
+    results: Dict[str, Dict[str, Any]] = {}
+
+    with tempfile.TemporaryDirectory() as images_dir:
+        service = build_service(images_dir)
+        for corpus in corpora:
+            timers = stage_timers(service, CORPORA[corpus])
+            results[corpus] = {}
+            for stage in stages:
+                results[corpus][stage] = measure(timers[stage], repeat, warmup)
+                print(f"{corpus:<12} {stage:<28} {results[corpus][stage]['median_ms']:>10.2f} ms", file=sys.stderr)
+
+    return {
+        'meta': {
+            'created_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'python': platform.python_version(),
+            'pillow': PIL.__version__,
+            'machine': platform.machine(),
+            'repeat': repeat,
+            'warmup': warmup,
+        },
+        'results': results,
+    }
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any], threshold: float,
+            min_delta_ms: float) -> List[str]:
+    """Return a description of every stage whose median regressed beyond threshold percent"""
+    regressions = []
+
+    for corpus, stages in current['results'].items():
+        for stage, result in stages.items():
+            before = baseline['results'].get(corpus, {}).get(stage)
+            if before is None:
+                continue
+
+            delta = result['median_ms'] - before['median_ms']
+            change = delta / before['median_ms'] * 100 if before['median_ms'] else 0.0
+            marker = ''
+            # Tiny absolute changes on fast stages are noise, not regressions
+            if change > threshold and delta > min_delta_ms:
+                marker = '  REGRESSION'
+                regressions.append(f"{corpus}/{stage}: {before['median_ms']:.2f} -> {result['median_ms']:.2f} ms "
+                                   f"({change:+.1f}%)")
+            print(f"{corpus:<12} {stage:<28} {before['median_ms']:>10.2f} {result['median_ms']:>10.2f} "
+                  f"{change:>+8.1f}%{marker}")
+
+    return regressions
+
+
+def load(path: str) -> Dict[str, Any]:
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Benchmark the confession render pipeline')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help='Run the benchmarks')
+    run_parser.add_argument('-o', '--output', help='Write results JSON here (default: stdout)')
+    run_parser.add_argument('--corpus', action='append', choices=sorted(CORPORA),
+                            help='Corpus to run (repeatable, default: all)')
+    run_parser.add_argument('--stage', action='append', help='Stage to run (repeatable, default: all)')
+    run_parser.add_argument('--repeat', type=int, default=5, help='Timed runs per stage (default: %(default)s)')
+    run_parser.add_argument('--warmup', type=int, default=1, help='Untimed runs per stage (default: %(default)s)')
+    run_parser.add_argument('--baseline', help='Compare against this results file after running')
+
+    compare_parser = commands.add_parser('compare', help='Compare two results files')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('current')
+
+    for sub in (run_parser, compare_parser):
+        sub.add_argument('--threshold', type=float, default=10.0,
+                         help='Allowed slowdown of a stage median, in percent (default: %(default)s)')
+        sub.add_argument('--min-delta-ms', type=float, default=0.5,
+                         help='Ignore slowdowns smaller than this many ms (default: %(default)s)')
+
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+
+    if args.command == 'compare':
+        baseline, current = load(args.baseline), load(args.current)
+    else:
+        with tempfile.TemporaryDirectory() as images_dir:
+            known_stages = list(stage_timers(build_service(images_dir), CORPORA['short']))
+        stages = args.stage or known_stages
+        unknown = set(stages) - set(known_stages)
+        if unknown:
+            print(f"Unknown stages: {', '.join(sorted(unknown))}. Available: {', '.join(known_stages)}",
+                  file=sys.stderr)
+            return 2
+
+        current = run(args.corpus or list(CORPORA), stages, args.repeat, args.warmup)
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as f:
+                json.dump(current, f, indent=2)
+        else:
+            print(json.dumps(current, indent=2))
+
+        if not args.baseline:
+            return 0
+        baseline = load(args.baseline)
+
+    regressions = compare(baseline, current, args.threshold, args.min_delta_ms)
+    if regressions:
+        print(f"\n{len(regressions)} stage(s) regressed by more than {args.threshold}%:", file=sys.stderr)
+        for regression in regressions:
+            print(f"  {regression}", file=sys.stderr)
+        return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,291 @@
+import asyncio
+import json
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from metrics import ERRORS, stage_timer
+
+logger = logging.getLogger(__name__)
+
+# Client errors worth retrying; any other 4xx means the update will never be accepted
+RETRYABLE_CLIENT_ERRORS = (408, 409, 425, 429)
+
+
+class CallbackOutbox:
+    """Durable outbox for the PHP update-images callback.
+
+    Updates are written to SQLite before any network I/O and delivered by a
+    background dispatcher over a pooled keep-alive session. Failed deliveries
+    are retried with exponential backoff and jitter. A newer update for the same
+    confession replaces one still waiting, so only the latest image URLs are sent.
+    Under an event loop, run_async() replaces the dispatcher thread and delivers
+    through an async HTTP client instead.
+    """
+
+    def __init__(self, db_path: str, base_url: str, max_attempts: int = 12, base_delay: float = 1.0,
+                 max_delay: float = 600.0, timeout: float = 10.0, pool_size: int = 4,
+                 poll_interval: float = 1.0, session: Optional[requests.Session] = None):
+        self.db_path = db_path
+        self.base_url = base_url.rstrip('/')
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self.session = session or self._create_session(pool_size)
+
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        self._init_db()
+
+    def _create_session(self, pool_size: int) -> requests.Session:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _init_db(self):
+        conn = self._connect()
+        try:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS callbacks (
+                    confession_id TEXT PRIMARY KEY,
+                    image_urls TEXT NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'pending',
+                    version INTEGER NOT NULL DEFAULT 1,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    next_attempt_at REAL NOT NULL,
+                    last_error TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS callbacks_due ON callbacks (status, next_attempt_at)')
+        finally:
+            conn.close()
+
+    def enqueue(self, confession_id: Any, image_urls: List[str]):
+        """Record an update, replacing any pending update for the same confession"""
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute('''
+                INSERT INTO callbacks (confession_id, image_urls, next_attempt_at, created_at, updated_at)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (confession_id) DO UPDATE SET
+                    image_urls = excluded.image_urls,
+                    status = 'pending',
+                    version = callbacks.version + 1,
+                    attempts = 0,
+                    next_attempt_at = excluded.next_attempt_at,
+                    last_error = NULL,
+                    -- A delivered or dead row starts a new backlog; a superseded pending one keeps waiting
+                    created_at = CASE WHEN callbacks.status = 'pending' THEN callbacks.created_at
+                                      ELSE excluded.created_at END,
+                    updated_at = excluded.updated_at
+            ''', (str(confession_id), json.dumps(image_urls), now, now, now))
+        finally:
+            conn.close()
+
+        self._wakeup.set()
+
+    def stats(self) -> Dict[str, Any]:
+        """Outbox depth, age of the oldest pending update and undeliverable updates"""
+        conn = self._connect()
+        try:
+            pending, oldest = conn.execute(
+                "SELECT COUNT(*), MIN(created_at) FROM callbacks WHERE status = 'pending'"
+            ).fetchone()
+            dead = conn.execute("SELECT COUNT(*) FROM callbacks WHERE status = 'dead'").fetchone()[0]
+        finally:
+            conn.close()
+
+        return {
+            'depth': pending,
+            'oldest_age_seconds': round(time.time() - oldest, 1) if oldest else 0.0,
+            'dead': dead,
+        }
+
+    def start(self):
+        """Start the background dispatcher (idempotent)"""
+        if self._thread is not None:
+            return
+
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name='callback-dispatcher', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        self._stopping.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self._thread = None
+
+    def dispatch_due(self) -> int:
+        """Deliver every update that is due; returns how many were attempted"""
+        attempted = 0
+        while not self._stopping.is_set():
+            row = self._claim()
+            if row is None:
+                break
+            self._deliver(row)
+            attempted += 1
+        return attempted
+
+    def _claim(self) -> Optional[sqlite3.Row]:
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            row = conn.execute(
+                "SELECT * FROM callbacks WHERE status = 'pending' AND next_attempt_at <= ? "
+                "ORDER BY next_attempt_at LIMIT 1",
+                (now,)
+            ).fetchone()
+
+            if row is not None:
+                # Lease the row so other processes leave it alone while it is in flight
+                conn.execute(
+                    'UPDATE callbacks SET next_attempt_at = ? WHERE confession_id = ?',
+                    (now + self.timeout * 3, row['confession_id'])
+                )
+            conn.execute('COMMIT')
+            return row
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        finally:
+            conn.close()
+
+    def _deliver(self, row: sqlite3.Row):
+        error = None
+        retryable = True
+
+        try:
+            with stage_timer('php_callback'):
+                response = self.session.post(self._callback_url(row), json=self._callback_body(row),
+                                             timeout=self.timeout)
+            error, retryable = self._check_response(row, response.status_code)
+        except requests.RequestException as e:
+            error = str(e)
+
+        self._record(row, error, retryable)
+
+    async def _deliver_async(self, row: sqlite3.Row, client):
+        import httpx
+
+        error = None
+        retryable = True
+
+        try:
+            with stage_timer('php_callback'):
+                response = await client.post(self._callback_url(row), json=self._callback_body(row),
+                                             timeout=self.timeout)
+            error, retryable = self._check_response(row, response.status_code)
+        except httpx.HTTPError as e:
+            error = str(e) or type(e).__name__
+
+        await asyncio.to_thread(self._record, row, error, retryable)
+
+    def _callback_url(self, row: sqlite3.Row) -> str:
+        return f"{self.base_url}/api/confessions/{row['confession_id']}/update-images"
+
+    def _callback_body(self, row: sqlite3.Row) -> Dict[str, Any]:
+        return {'confession_id': row['confession_id'], 'image_urls': json.loads(row['image_urls'])}
+
+    def _check_response(self, row: sqlite3.Row, status_code: int):
+        """(error, retryable) for a PHP API answer"""
+        if status_code == 200:
+            logger.info(f"Successfully updated confession {row['confession_id']} with images")
+            return None, True
+        return f"PHP API answered {status_code}", status_code >= 500 or status_code in RETRYABLE_CLIENT_ERRORS
+
+    def _record(self, row: sqlite3.Row, error: Optional[str], retryable: bool):
+        """Drop a delivered update, or schedule a retry (or give up) after a failed one"""
+        confession_id = row['confession_id']
+        conn = self._connect()
+        try:
+            if error is None:
+                # Only drop the row if no newer update arrived while this one was in flight
+                conn.execute('DELETE FROM callbacks WHERE confession_id = ? AND version = ?',
+                             (confession_id, row['version']))
+                return
+
+            ERRORS.labels('php_callback', 'delivery_failed').inc()
+            attempts = row['attempts'] + 1
+            if not retryable or attempts >= self.max_attempts:
+                logger.error(f"Giving up on updating confession {confession_id} after {attempts} attempts: {error}")
+                status, next_attempt_at = 'dead', time.time()
+            else:
+                delay = self.backoff(attempts)
+                logger.warning(f"Failed to update confession {confession_id} (attempt {attempts}), "
+                               f"retrying in {delay:.1f}s: {error}")
+                status, next_attempt_at = 'pending', time.time() + delay
+
+            conn.execute(
+                'UPDATE callbacks SET status = ?, attempts = ?, next_attempt_at = ?, last_error = ?, updated_at = ? '
+                'WHERE confession_id = ? AND version = ?',
+                (status, attempts, next_attempt_at, error, time.time(), confession_id, row['version'])
+            )
+        finally:
+            conn.close()
+
+    def backoff(self, attempts: int) -> float:
+        """Exponential backoff with jitter: half fixed, half random"""
+        delay = min(self.max_delay, self.base_delay * (2 ** (attempts - 1)))
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                self.dispatch_due()
+            except sqlite3.Error as e:
+                logger.error(f"Callback dispatcher failed: {str(e)}")
+
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+
+    async def run_async(self, client):
+        """Dispatcher loop for an event loop, posting through client (an httpx.AsyncClient) until stop()"""
+        self._stopping.clear()
+        while not self._stopping.is_set():
+            try:
+                await self.dispatch_due_async(client)
+            except sqlite3.Error as e:
+                logger.error(f"Callback dispatcher failed: {str(e)}")
+
+            # enqueue() may be called from job queue threads, so keep waiting on the thread event
+            await asyncio.to_thread(self._wakeup.wait, self.poll_interval)
+            self._wakeup.clear()
+
+    async def dispatch_due_async(self, client) -> int:
+        """dispatch_due() through an async HTTP client; SQLite work runs in a thread"""
+        attempted = 0
+        while not self._stopping.is_set():
+            row = await asyncio.to_thread(self._claim)
+            if row is None:
+                break
+            await self._deliver_async(row, client)
+            attempted += 1
+        return attempted
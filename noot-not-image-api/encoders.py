@@ -0,0 +1,128 @@
+import io
+import time
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+
+from PIL import Image, features
+
+DEFAULT_FORMAT = 'png'
+
+
+class Encoder(NamedTuple):
+    name: str
+    extension: str
+    mimetype: str
+    encode: Callable[[Image.Image, Dict[str, Any]], bytes]
+
+
+class EncodedImage(NamedTuple):
+    data: bytes
+    format: str
+    extension: str
+    mimetype: str
+    encode_ms: float
+
+
+def _save(image: Image.Image, image_format: str, **params) -> bytes:
+    buffer = io.BytesIO()
+    image.save(buffer, image_format, **params)
+    return buffer.getvalue()
+
+
+def encode_png(image: Image.Image, options: Dict[str, Any]) -> bytes:
+    return _save(image, 'PNG', compress_level=options.get('PNG_COMPRESS_LEVEL', 6))
+
+
+def encode_png_palette(image: Image.Image, options: Dict[str, Any]) -> bytes:
+    """PNG quantized to a 256 colour palette; the flat backgrounds survive almost untouched"""
+    quantized = image.quantize(colors=options.get('PNG_PALETTE_COLORS', 256), method=Image.Quantize.FASTOCTREE,
+                               dither=Image.Dither.NONE)
+    return _save(quantized, 'PNG', compress_level=options.get('PNG_COMPRESS_LEVEL', 6))
+
+
+def encode_webp(image: Image.Image, options: Dict[str, Any]) -> bytes:
+    return _save(image, 'WEBP', quality=options.get('WEBP_QUALITY', 85), method=options.get('WEBP_METHOD', 4))
+
+
+def encode_avif(image: Image.Image, options: Dict[str, Any]) -> bytes:
+    return _save(image, 'AVIF', quality=options.get('AVIF_QUALITY', 60), speed=options.get('AVIF_SPEED', 8))
+
+
+def encode_jpeg(image: Image.Image, options: Dict[str, Any]) -> bytes:
+    return _save(image, 'JPEG', quality=options.get('JPEG_QUALITY', 88), optimize=True, progressive=True)
+
+
+ENCODERS: Dict[str, Encoder] = {
+    'png': Encoder('png', 'png', 'image/png', encode_png),
+    'png8': Encoder('png8', 'png', 'image/png', encode_png_palette),
+    'jpeg': Encoder('jpeg', 'jpg', 'image/jpeg', encode_jpeg),
+}
+if features.check('webp'):
+    ENCODERS['webp'] = Encoder('webp', 'webp', 'image/webp', encode_webp)
+if features.check('avif'):
+    ENCODERS['avif'] = Encoder('avif', 'avif', 'image/avif', encode_avif)
+
+# Formats that may be requested but are missing from this Pillow build
+FALLBACK_FORMATS = {'avif': 'jpeg', 'webp': 'png'}
+
+# Config keys read by the encoders; they are part of the render cache key
+ENCODER_OPTIONS = ('PNG_COMPRESS_LEVEL', 'PNG_PALETTE_COLORS', 'WEBP_QUALITY', 'WEBP_METHOD',
+                   'AVIF_QUALITY', 'AVIF_SPEED', 'JPEG_QUALITY')
+
+
+def available_formats() -> List[str]:
+    return sorted(ENCODERS)
+
+
+def format_for_extension(extension: str) -> Optional[str]:
+    """Encoder for a file extension, e.g. 'jpeg' for 'jpg'"""
+    extension = extension.lower().lstrip('.')
+    return next((name for name, encoder in ENCODERS.items() if encoder.extension == extension), None)
+
+
+def resolve_format(name: Optional[str], default: str = DEFAULT_FORMAT) -> str:
+    """Normalize a requested format name, raising ValueError for unknown formats"""
+    name = (name or default).lower()
+    if name == 'jpg':
+        name = 'jpeg'
+    if name not in ENCODERS:
+        name = FALLBACK_FORMATS.get(name, name)
+    if name not in ENCODERS:
+        raise ValueError(f"Unsupported image format '{name}'. Available: {', '.join(available_formats())}")
+    return name
+
+
+def encode_image(image: Image.Image, image_format: str, options: Optional[Dict[str, Any]] = None) -> EncodedImage:
+    """Encode image in the given format and time it"""
+    encoder = ENCODERS[resolve_format(image_format)]
+
+    started = time.perf_counter()
+    data = encoder.encode(image, options or {})
+    encode_ms = (time.perf_counter() - started) * 1000
+
+    return EncodedImage(data, encoder.name, encoder.extension, encoder.mimetype, encode_ms)
+
+
+def negotiate_format(accept_header: Optional[str], preferred: List[str]) -> Optional[str]:
+    """Pick the first preferred format the Accept header allows, if any"""
+    if not accept_header:
+        return None
+
+    accepted = {}
+    for item in accept_header.split(','):
+        mimetype, _, params = item.strip().partition(';')
+        quality = 1.0
+        for param in params.split(';'):
+            key, _, value = param.strip().partition('=')
+            if key == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        accepted[mimetype.strip().lower()] = quality
+
+    for name in preferred:
+        encoder = ENCODERS.get(name)
+        if encoder is not None and accepted.get(encoder.mimetype, 0) > 0:
+            return name
+
+    return None
@@ -0,0 +1,37 @@
+# Gunicorn settings: the app (fonts, prepared background) is loaded once in the master and
+# shared with the workers through fork; each worker warms up before it accepts requests.
+import os
+
+import metrics
+
+bind = f"0.0.0.0:{os.getenv('PORT', 8001)}"
+workers = int(os.getenv('GUNICORN_WORKERS', 2))
+# Threads let requests wait in the admission queue (and /health answer) while renders run
+worker_class = 'gthread'
+threads = int(os.getenv('GUNICORN_THREADS', 8))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 60))
+preload_app = True
+
+# Threads do not survive fork, so the master must not start the job queue and outbox
+os.environ['START_BACKGROUND_WORKERS'] = 'False'
+
+
+def on_starting(server):
+    # Samples from a previous run would otherwise be added to the new counters
+    metrics.clear_multiproc_dir()
+
+
+def post_fork(server, worker):
+    from app import start_worker
+    start_worker()
+
+
+def worker_exit(server, worker):
+    # Unfinished jobs are leased, so another worker picks them up if this does not finish in time
+    from app import callback_outbox, job_queue
+    job_queue.stop()
+    callback_outbox.stop()
+
+
+def child_exit(server, worker):
+    metrics.mark_process_dead(worker.pid)
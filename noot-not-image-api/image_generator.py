@@ -1,194 +1,243 @@
-from PIL import Image, ImageDraw, ImageFont
+from PIL import Image, ImageFont
+import copy
+import io
 import os
-import re
 import math
-from typing import List, Tuple, Dict, Any
+from typing import List, NamedTuple, Tuple, Dict, Any, Iterator, Optional
 import json
+import hashlib
+import time
+from contextlib import contextmanager
+
+from background_cache import BackgroundCache, CanvasPool
+from encoders import ENCODER_OPTIONS, ENCODERS, EncodedImage, encode_image, format_for_extension, resolve_format
+from memory_budget import MemoryBudget
+from metrics import OUTPUT_BYTES, RENDER_PAGES, RENDER_STAGE_SECONDS, in_flight, stage_timer
+from render_cache import RenderCache, file_digest, render_key
+from render_context import RenderContext, RenderContextCache
+from render_pool import RenderPool
+from storage import ImageStorage, create_storage, size_variant
+from text_effects import TextEffectsRenderer
+from text_metrics import LineWidth, TextMeasurer
+from text_segmentation import contains_emoji, emojis_to_text, segment_text
+
+# Bump whenever a code change alters rendered output, so cached renders are not reused
+RENDER_VERSION = 2
+
+# Composed line widths within this many pixels of the wrap limit are re-measured exactly
+WRAP_EXACT_TOLERANCE = 2
+
+# Rendered once per process by warm_up: most Spanish letters, digits, punctuation and an emoji
+WARM_UP_TEXT = 'El veloz murciélago hindú comía feliz cardillo y kiwi. ¿Qué? ¡Sí! 0123456789 😀'
+
+
+class LayoutPlan(NamedTuple):
+    """Wrapped lines split into pages, with the measured width of every line"""
+    pages: List[List[str]]
+    widths: List[List[int]]
+    max_width: int
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            'total_pages': len(self.pages),
+            'total_lines': sum(len(lines) for lines in self.pages),
+            'max_line_width': self.max_width,
+            'pages': [
+                {
+                    'page_number': index + 1,
+                    'lines': [{'text': line, 'width': width} for line, width in zip(lines, widths)]
+                }
+                for index, (lines, widths) in enumerate(zip(self.pages, self.widths))
+            ]
+        }
 
 class ImageGeneratorService:
-    def __init__(self, config: Dict[str, Any]):
-        self.image_width = config.get('IMAGE_WIDTH', 1920)
-        self.image_height = config.get('IMAGE_HEIGHT', 1920)
-        self.font_size = config.get('FONT_SIZE', 84)
-        self.line_height = config.get('LINE_HEIGHT', 110)
-        self.max_lines_per_image = config.get('MAX_LINES_PER_IMAGE', 15)
-        self.text_margin = config.get('TEXT_MARGIN', 100)
-        self.max_text_width = self.image_width - (self.text_margin * 2)
-        
-        # Font paths
+    def __init__(self, config: Dict[str, Any], storage: ImageStorage = None):
+        self.config = dict(config)
         self.fonts_dir = config.get('FONTS_DIR', './assets/fonts')
-        self.font_path = os.path.join(self.fonts_dir, 'noto-sans.ttf')
+        self.backgrounds_dir = config.get('BACKGROUND_DIR', './assets/backgrounds')
         self.emoji_font_path = os.path.join(self.fonts_dir, 'noto-emoji-bw.ttf')
+        self.configure_layout(self.config)
+        
+        # Output encoding
+        self.image_format = resolve_format(config.get('IMAGE_FORMAT'))
+        self.versioned_urls = config.get('VERSIONED_IMAGE_URLS', False)
         
         # Directories
         self.images_dir = config.get('IMAGES_DIR', './assets/images')
-        self.backgrounds_dir = config.get('BACKGROUND_DIR', './assets/backgrounds')
         
         # Create directories if they don't exist
         os.makedirs(self.images_dir, exist_ok=True)
         os.makedirs(self.backgrounds_dir, exist_ok=True)
         
-        # Load fonts
-        self.load_fonts()
+        # Generated pages (sharded local directory or S3)
+        self.storage = storage or create_storage(self.config)
+        
+        # Shadow/outline compositing for rendered text
+        self.effects_renderer = TextEffectsRenderer()
+        
+        # Page canvases reused across renders, and the memory ceiling that defers new renders
+        self.canvas_pool = CanvasPool(config.get('CANVAS_POOL_SIZE', 2))
+        self.memory_budget = MemoryBudget(config.get('RENDER_MEMORY_LIMIT_MB', 0) * 1024 * 1024,
+                                          config.get('RENDER_MEMORY_WAIT', 30.0))
+        
+        # Fonts, prepared background and segment advances, reused across requests
+        self.theme = None
+        self.context_key = self.layout_key()
+        self.use_context(self.load_context())
+        
+        # The same for the looks in THEMES, least recently used evicted first
+        self.themes = config.get('THEMES', {})
+        self.render_contexts = RenderContextCache(config.get('RENDER_CONTEXTS_MAX', 8),
+                                                  config.get('RENDER_CONTEXTS_MAX_BYTES', 256 * 1024 * 1024))
+        
+        # Optional process pool for rendering the pages of long confessions in parallel
+        render_processes = config.get('RENDER_PROCESSES', 0)
+        self.render_pool = RenderPool(self.config, render_processes) if render_processes > 0 else None
+        
+        # Content-addressed cache of finished renders (disabled when the budget is 0)
+        cache_max_bytes = config.get('RENDER_CACHE_MAX_BYTES', 0)
+        self.render_cache = None
+        if cache_max_bytes > 0:
+            self.render_cache = RenderCache(config.get('RENDER_CACHE_DIR', './cache/renders'), cache_max_bytes)
+
+    def configure_layout(self, config: Dict[str, Any]):
+        """Canvas size, text layout, font and background from config (or a theme's overrides)"""
+        self.image_width = config.get('IMAGE_WIDTH', 1920)
+        self.image_height = config.get('IMAGE_HEIGHT', 1920)
+        self.font_size = config.get('FONT_SIZE', 84)
+        self.line_height = config.get('LINE_HEIGHT', 110)
+        self.max_lines_per_image = config.get('MAX_LINES_PER_IMAGE', 15)
+        self.text_margin = config.get('TEXT_MARGIN', 100)
+        self.max_text_width = self.image_width - (self.text_margin * 2)
+        self.font_path = os.path.join(self.fonts_dir, config.get('FONT_FILE', 'noto-sans.ttf'))
+        self.background_path = os.path.join(self.backgrounds_dir, config.get('BACKGROUND_IMAGE', 'bg.png'))
+        
+        # Downscaled copies of every page for responsive srcsets, largest first
+        self.variant_widths = sorted({width for width in config.get('IMAGE_VARIANTS', [])
+                                      if 0 < width < self.image_width}, reverse=True)
 
-    def load_fonts(self):
-        """Load the fonts or set fallback"""
+    def layout_key(self) -> Tuple[str, int, str, Tuple[int, int]]:
+        """What a render context depends on: font, font size, background and canvas size"""
+        return self.font_path, self.font_size, self.background_path, (self.image_width, self.image_height)
+
+    def plan_payload(self, plan: LayoutPlan) -> Dict[str, Any]:
+        """JSON form of a plan, for rendering it later (e.g. from the job queue) without wrapping again"""
+        return {'layout': self._plan_layout(), 'pages': plan.pages, 'widths': plan.widths,
+                'max_width': plan.max_width}
+
+    def plan_from_payload(self, payload: Optional[Dict[str, Any]]) -> Optional[LayoutPlan]:
+        """Plan stored by plan_payload, or None if there is none or the layout settings changed since"""
+        if not payload or payload.get('layout') != self._plan_layout():
+            return None
+        return LayoutPlan(pages=payload['pages'], widths=payload['widths'], max_width=payload['max_width'])
+
+    def _plan_layout(self) -> List[Any]:
+        # Everything wrapping and pagination depend on besides the content
+        return [self.font_path, self.font_size, self.max_text_width, self.max_lines_per_image]
+
+    def load_context(self) -> RenderContext:
+        """Load the fonts and set up the background and measurement caches for the current layout"""
+        font, emoji_font, id_font, emoji_font_available = self.load_fonts()
+        font_bytes = sum(os.path.getsize(path) for path in {self.font_path, self.emoji_font_path}
+                         if os.path.exists(path))
+        return RenderContext(
+            font=font,
+            emoji_font=emoji_font,
+            id_font=id_font,
+            emoji_font_available=emoji_font_available,
+            text_measurer=TextMeasurer(
+                max_entries=self.config.get('MEASURE_CACHE_SIZE', 50000),
+                fallback_char_width=self.font_size // 2,
+            ),
+            background_cache=BackgroundCache(),
+            font_bytes=font_bytes,
+            canvas=(self.image_width, self.image_height),
+        )
+
+    def use_context(self, context: RenderContext):
+        self.font = context.font
+        self.emoji_font = context.emoji_font
+        self.id_font = context.id_font
+        self.emoji_font_available = context.emoji_font_available
+        self.text_measurer = context.text_measurer
+        self.background_cache = context.background_cache
+
+    def themed(self, theme: Optional[str]) -> 'ImageGeneratorService':
+        """This service, or a view of it that renders with a theme's canvas, fonts and background.
+
+        Views share storage, caches and the render pool; only the layout settings and
+        the render context differ. Raises ValueError for themes not in THEMES.
+        """
+        if not theme or theme == self.theme:
+            return self
+        if theme not in self.themes:
+            raise ValueError(f"Unknown theme '{theme}'. Available: {', '.join(sorted(self.themes)) or 'none'}")
+        
+        view = copy.copy(self)
+        view.theme = theme
+        view.configure_layout({**self.config, **self.themes[theme]})
+        view.context_key = view.layout_key()
+        if view.context_key == self.context_key:
+            # Only spacing differs, so the loaded fonts and background still apply
+            return view
+        
+        view.use_context(self.render_contexts.get(view.context_key, view.load_context))
+        return view
+
+    def load_fonts(self) -> Tuple[ImageFont.ImageFont, ImageFont.ImageFont, ImageFont.ImageFont, bool]:
+        """Load the fonts of the current layout or fallbacks: (font, emoji_font, id_font, emoji_font_available)"""
         try:
             if os.path.exists(self.font_path):
-                self.font = ImageFont.truetype(self.font_path, self.font_size)
+                font = ImageFont.truetype(self.font_path, self.font_size)
             else:
-                self.font = ImageFont.load_default()
+                font = ImageFont.load_default()
                 
             # Try to load emoji font, but prepare for fallback
-            self.emoji_font_available = False
+            emoji_font_available = False
             if os.path.exists(self.emoji_font_path):
                 try:
-                    self.emoji_font = ImageFont.truetype(self.emoji_font_path, self.font_size)
+                    emoji_font = ImageFont.truetype(self.emoji_font_path, self.font_size)
                     # Test if emoji font can actually render emojis
-                    test_bbox = self.emoji_font.getbbox('😊')
+                    test_bbox = emoji_font.getbbox('😊')
                     if test_bbox[2] - test_bbox[0] > 0:
-                        self.emoji_font_available = True
+                        emoji_font_available = True
                         print("✅ Emoji font loaded and working")
                     else:
                         print("⚠️  Emoji font loaded but cannot render emojis properly")
-                        self.emoji_font = self.font
+                        emoji_font = font
                 except Exception as e:
                     print(f"⚠️  Emoji font failed to load: {e}")
-                    self.emoji_font = self.font
+                    emoji_font = font
             else:
                 print("⚠️  Emoji font file not found, using text fallbacks")
-                self.emoji_font = self.font
+                emoji_font = font
                 
             # ID font (bigger - about 75% of main font size)
             id_font_size = int(self.font_size)  # About 63px if font_size is 84px
             if os.path.exists(self.font_path):
-                self.id_font = ImageFont.truetype(self.font_path, id_font_size)
+                id_font = ImageFont.truetype(self.font_path, id_font_size)
             else:
-                self.id_font = ImageFont.load_default()
+                id_font = ImageFont.load_default()
                 
         except Exception as e:
             print(f"Error loading fonts: {e}")
-            self.font = ImageFont.load_default()
-            self.emoji_font = ImageFont.load_default()
-            self.id_font = ImageFont.load_default()
-            self.emoji_font_available = False
+            default = ImageFont.load_default()
+            return default, default, default, False
+        
+        return font, emoji_font, id_font, emoji_font_available
 
     def contains_emoji(self, text: str) -> bool:
         """Check if text contains emojis"""
-        emoji_pattern = re.compile(
-            "[\U0001F600-\U0001F64F"  # emoticons
-            "\U0001F300-\U0001F5FF"  # symbols & pictographs
-            "\U0001F680-\U0001F6FF"  # transport & map symbols
-            "\U0001F1E0-\U0001F1FF"  # flags (iOS)
-            "\U00002600-\U000026FF"  # miscellaneous symbols
-            "\U00002700-\U000027BF"  # dingbats
-            "\U0001F900-\U0001F9FF"  # supplemental symbols and pictographs
-            "\U0001FA70-\U0001FAFF"  # symbols and pictographs extended-A
-            "]+", 
-            flags=re.UNICODE
-        )
-        return bool(emoji_pattern.search(text))
+        return contains_emoji(text)
 
     def split_text_and_emojis(self, text: str) -> List[Tuple[str, bool]]:
         """Split text into segments, marking which are emojis and which are regular text"""
-        emoji_pattern = re.compile(
-            "([\U0001F600-\U0001F64F"  # emoticons
-            "\U0001F300-\U0001F5FF"  # symbols & pictographs
-            "\U0001F680-\U0001F6FF"  # transport & map symbols
-            "\U0001F1E0-\U0001F1FF"  # flags (iOS)
-            "\U00002600-\U000026FF"  # miscellaneous symbols
-            "\U00002700-\U000027BF"  # dingbats
-            "\U0001F900-\U0001F9FF"  # supplemental symbols and pictographs
-            "\U0001FA70-\U0001FAFF"  # symbols and pictographs extended-A
-            "]+)", 
-            flags=re.UNICODE
-        )
-        
-        segments = []
-        parts = emoji_pattern.split(text)
-        
-        for part in parts:
-            if part:  # Skip empty strings
-                is_emoji = bool(emoji_pattern.match(part))
-                segments.append((part, is_emoji))
-        
-        return segments
+        return segment_text(text)
 
     def convert_emojis_to_text(self, text: str) -> str:
         """Convert emojis to text representations as fallback"""
-        emoji_map = {
-            # Caras y emociones
-            '😀': ':D', '😁': ':D', '😂': 'XD', '🤣': 'XD', '😃': ':D',
-            '😄': ':D', '😅': ':)', '😆': 'XD', '😊': ':)', '😇': ':)',
-            '🙂': ':)', '🙃': ':)', '😉': ';)', '😌': ':)', '😍': '<3',
-            '🥰': '<3', '😘': ':*', '😗': ':*', '😙': ':*', '😚': ':*',
-            '😋': ':P', '😛': ':P', '😝': 'XP', '😜': ';P', '🤪': 'XP',
-            '🤨': ':/', '🧐': '(monocle)', '🤓': '(nerd)', '😎': 'B)',
-            '🤩': '*_*', '🥳': '(party)',
-            
-            # Emociones negativas
-            '😞': ':(', '😒': ':|', '😔': ':(', '😟': ':(', '😕': ':(',
-            '🙁': ':(', '☹️': ':(', '😣': '>:(', '😖': '>:(', '😫': 'X(',
-            '😩': ':(', '🥺': ':(', '😢': 'T_T', '😭': 'T_T', '😤': '>:(',
-            '😠': '>:(', '😡': '>:(', '🤬': '****', '🤯': '(mind blown)',
-            '😳': 'O_O', '🥵': '(hot)', '🥶': '(cold)', '😱': ':O',
-            '😨': 'D:', '😰': 'D:', '😥': ':(', '😓': ':-/',
-            
-            # Gestos y manos
-            '👍': '(thumbs up)', '👎': '(thumbs down)', '👌': '(OK)',
-            '✌️': '(peace)', '🤞': '(fingers crossed)', '🤟': '(love)',
-            '🤘': '(rock)', '🤙': '(call me)', '👈': '(point left)',
-            '👉': '(point right)', '👆': '(point up)', '👇': '(point down)',
-            '☝️': '(index up)', '✋': '(hand)', '🤚': '(hand)', '🖐️': '(hand)',
-            '🖖': '(vulcan)', '👋': '(wave)', '🤝': '(handshake)',
-            '🙏': '(pray)', '✍️': '(write)', '💪': '(strong)',
-            
-            # Corazones y amor
-            '❤️': '<3', '🧡': '<3', '💛': '<3', '💚': '<3', '💙': '<3',
-            '💜': '<3', '🖤': '</3', '🤍': '<3', '🤎': '<3', '💔': '</3',
-            '❣️': '<3', '💕': '<3', '💞': '<3', '💓': '<3', '💗': '<3',
-            '💖': '<3', '💘': '<3', '💝': '<3', '💟': '<3',
-            
-            # Objetos y símbolos
-            '🔥': '(fire)', '⭐': '(star)', '🌟': '(star)', '✨': '(sparkles)',
-            '💫': '(dizzy)', '💥': '(boom)', '💯': '(100)', '💢': '(anger)',
-            '💦': '(sweat)', '💨': '(dash)', '🕳️': '(hole)', '💤': '(sleep)',
-            '🎉': '(party)', '🎊': '(confetti)', '🎈': '(balloon)',
-            '🎁': '(gift)', '🎂': '(cake)', '🍰': '(cake)', '🎵': '(music)',
-            '🎶': '(music)', '🎯': '(target)', '🏆': '(trophy)',
-            '🥇': '(gold)', '🥈': '(silver)', '🥉': '(bronze)',
-            '🏅': '(medal)', '🎖️': '(medal)',
-            
-            # Transporte y tecnología
-            '🚀': '(rocket)', '✈️': '(plane)', '🚗': '(car)', '🏠': '(home)',
-            '🏫': '(school)', '🏢': '(office)', '🏥': '(hospital)',
-            '🏪': '(store)', '🎬': '(movie)', '📱': '(phone)',
-            '💻': '(computer)', '📷': '(camera)', '📺': '(TV)',
-            '⏰': '(clock)', '📅': '(calendar)', '📚': '(books)',
-            '✏️': '(pencil)', '📝': '(memo)', '📄': '(page)', '📋': '(clipboard)',
-            
-            # Naturaleza
-            '🌞': '(sun)', '🌙': '(moon)', '🌈': '(rainbow)', '☀️': '(sun)',
-            '⛅': '(cloud)', '☁️': '(cloud)', '🌧️': '(rain)',
-            '⛈️': '(storm)', '🌩️': '(lightning)', '❄️': '(snow)',
-            '🌨️': '(snow)', '🌊': '(wave)', '🌳': '(tree)',
-            '🌸': '(flower)', '🌺': '(flower)', '🌻': '(flower)',
-            '🌹': '(rose)', '🌷': '(tulip)',
-            
-            # Comida y bebida
-            '🍕': '(pizza)', '🍔': '(burger)', '🍟': '(fries)',
-            '🌭': '(hotdog)', '🥪': '(sandwich)', '🌮': '(taco)',
-            '🌯': '(burrito)', '🍣': '(sushi)', '🍜': '(ramen)',
-            '🍝': '(pasta)', '🍪': '(cookie)', '🍫': '(chocolate)',
-            '🍯': '(honey)', '☕': '(coffee)', '🍵': '(tea)',
-            '🥤': '(drink)', '🍺': '(beer)', '🍷': '(wine)',
-        }
-        
-        result = text
-        for emoji, text_replacement in emoji_map.items():
-            result = result.replace(emoji, text_replacement)
-        
-        return result
+        return emojis_to_text(text)
 
     def get_text_width(self, text: str, font: ImageFont.ImageFont) -> int:
         """Get the width of text with given font"""
@@ -212,96 +261,93 @@ class ImageGeneratorService:
         
         return total_width
 
+    def append_segments(self, width: LineWidth, segments: List[Tuple[str, bool]]) -> LineWidth:
+        """Extend a line width with text/emoji segments using cached advances"""
+        for segment, is_emoji in segments:
+            width.append(segment, self.emoji_font if is_emoji else self.font, is_emoji)
+        return width
+
+    def fits_width(self, width: LineWidth, text: str, max_width: int) -> bool:
+        """Check a composed line width against max_width.
+
+        Composed widths can drift by a pixel or so from a whole-line getbbox (kerning,
+        fractional advances), so lines close to the limit are measured directly.
+        """
+        measured = width.width
+        if abs(measured - max_width) <= WRAP_EXACT_TOLERANCE:
+            measured = self.get_mixed_text_width(text)
+        return measured <= max_width
+
     def wrap_text(self, text: str) -> List[str]:
         """Wrap text into lines that fit within the image width"""
+        return [line for line, _ in self.wrap_lines(text)]
+
+    @property
+    def wrap_width(self) -> int:
+        return self.max_text_width - 100  # Leave margin
+
+    def wrap_lines(self, text: str) -> List[Tuple[str, int]]:
+        """Wrap text into (line, width) pairs, the widths composed from cached segment advances"""
         words = text.split(' ')
         lines = []
         current_line = ''
-        max_width = self.max_text_width - 100  # Leave margin
+        current_width = self.text_measurer.line()
+        max_width = self.wrap_width
         
         for word in words:
-            test_line = current_line + ' ' + word if current_line else word
+            segments = self.split_text_and_emojis(word)
+            word_width = self.append_segments(self.text_measurer.line(), segments)
             
-            if self.get_mixed_text_width(test_line) <= max_width:
+            if current_line:
+                test_line = current_line + ' ' + word
+                test_width = current_width.copy()
+                test_width.append(' ', self.font)
+                self.append_segments(test_width, segments)
+            else:
+                test_line = word
+                test_width = word_width
+            
+            if self.fits_width(test_width, test_line, max_width):
                 current_line = test_line
+                current_width = test_width
             else:
                 if current_line:
-                    lines.append(current_line)
+                    lines.append((current_line, current_width.width))
                 current_line = word
+                current_width = word_width
                 
                 # If single word is too long, force break it
-                if self.get_mixed_text_width(current_line) > max_width:
-                    lines.append(current_line)
+                if not self.fits_width(word_width, word, max_width):
+                    lines.append((current_line, current_width.width))
                     current_line = ''
+                    current_width = self.text_measurer.line()
         
         if current_line:
-            lines.append(current_line)
+            lines.append((current_line, current_width.width))
         
         return lines
 
     def create_gradient_background(self) -> Image.Image:
-        """Create a background image from assets/backgrounds/bg.png"""
-        bg_path = os.path.join(self.backgrounds_dir, 'bg.png')
-        
-        try:
-            # Load the background image
-            background = Image.open(bg_path)
-            
-            # Convert to RGB if necessary (in case it's RGBA or other format)
-            if background.mode != 'RGB':
-                background = background.convert('RGB')
-            
-            # Resize to match our target dimensions if needed
-            if background.size != (self.image_width, self.image_height):
-                background = background.resize((self.image_width, self.image_height), Image.Resampling.LANCZOS)
-            
-            return background
-            
-        except Exception as e:
-            print(f"Error loading background image from {bg_path}: {e}")
-            print("Falling back to gradient background")
-            
-            # Fallback to gradient if image loading fails
-            image = Image.new('RGB', (self.image_width, self.image_height))
-            
-            for y in range(self.image_height):
-                ratio = y / self.image_height
-                
-                # Purple to blue gradient
-                r = int(107 + (67 - 107) * ratio)  # 107 -> 67
-                g = int(114 + (56 - 114) * ratio)  # 114 -> 56
-                b = int(224 + (184 - 224) * ratio)  # 224 -> 184
-                
-                for x in range(self.image_width):
-                    image.putpixel((x, y), (r, g, b))
-            
-            return image
+        """Create a background image from BACKGROUND_IMAGE (bg.png) in the backgrounds directory"""
+        # Decoded and resized once per worker; each page gets its own copy to draw on
+        return self.background_cache.get(self.background_path, (self.image_width, self.image_height))
 
-    def add_text_with_effects(self, draw: ImageDraw.Draw, text: str, x: int, y: int, 
+    def add_text_with_effects(self, image: Image.Image, text: str, x: int, y: int, 
                             font: ImageFont.ImageFont, text_color: Tuple[int, int, int] = (0, 0, 0),
                             shadow_color: Tuple[int, int, int] = (150, 150, 150),
                             outline_color: Tuple[int, int, int] = (128, 128, 128)):
         """Add text with shadow and outline effects"""
-        
-        # Add shadow (offset by 4 pixels)
-        draw.text((x + 4, y + 4), text, font=font, fill=shadow_color)
-        
-        # Add outline by drawing text in multiple directions
-        for ox in range(-2, 3):
-            for oy in range(-2, 3):
-                if ox != 0 or oy != 0:
-                    draw.text((x + ox, y + oy), text, font=font, fill=outline_color)
-        
-        # Add main text
-        draw.text((x, y), text, font=font, fill=text_color)
+        self.effects_renderer.draw_runs(image, [(text, font, 0, True)], x, y,
+                                        text_color, shadow_color, outline_color)
 
-    def add_mixed_text_with_effects(self, draw: ImageDraw.Draw, text: str, x: int, y: int,
+    def add_mixed_text_with_effects(self, image: Image.Image, text: str, x: int, y: int,
                                   text_color: Tuple[int, int, int] = (0, 0, 0),
                                   shadow_color: Tuple[int, int, int] = (150, 150, 150),
                                   outline_color: Tuple[int, int, int] = (128, 128, 128)):
         """Add text that may contain emojis with shadow and outline effects"""
         segments = self.split_text_and_emojis(text)
-        current_x = x
+        runs = []
+        offset = 0
         
         for segment, is_emoji in segments:
             if is_emoji:
@@ -311,62 +357,223 @@ class ImageGeneratorService:
                     emoji_width = bbox[2] - bbox[0]
                     
                     if emoji_width > 0:  # Emoji font can render this
-                        # For emojis, we'll render them larger and without heavy effects
-                        # to preserve readability
-                        
-                        # Light shadow for emoji
-                        draw.text((current_x + 2, y + 2), segment, font=self.emoji_font, fill=(200, 200, 200))
-                        
-                        # Main emoji (slightly larger size for better visibility)
-                        draw.text((current_x, y), segment, font=self.emoji_font, fill=text_color)
-                        current_x += emoji_width
-                    else:
-                        # Fallback to text conversion
-                        fallback_text = self.convert_emojis_to_text(segment)
-                        self.add_text_with_effects(draw, fallback_text, current_x, y, self.font, 
-                                                 text_color, shadow_color, outline_color)
-                        current_x += self.get_text_width(fallback_text, self.font)
+                        # Emojis get a light shadow and no outline to preserve readability
+                        runs.append((segment, self.emoji_font, offset, False))
+                        offset += emoji_width
+                        continue
                         
                 except Exception as e:
-                    # Fallback to text conversion
                     print(f"Emoji rendering failed for '{segment}': {e}")
-                    fallback_text = self.convert_emojis_to_text(segment)
-                    self.add_text_with_effects(draw, fallback_text, current_x, y, self.font, 
-                                             text_color, shadow_color, outline_color)
-                    current_x += self.get_text_width(fallback_text, self.font)
+                
+                # Fallback to text conversion
+                fallback_text = self.convert_emojis_to_text(segment)
+                runs.append((fallback_text, self.font, offset, True))
+                offset += self.get_text_width(fallback_text, self.font)
             else:
                 # Regular text
-                self.add_text_with_effects(draw, segment, current_x, y, self.font, 
-                                         text_color, shadow_color, outline_color)
-                current_x += self.get_text_width(segment, self.font)
+                runs.append((segment, self.font, offset, True))
+                offset += self.get_text_width(segment, self.font)
+        
+        # Rasterize the whole line once and composite shadow, outline and fill
+        self.effects_renderer.draw_runs(image, runs, x, y, text_color, shadow_color, outline_color)
 
-    def generate_confession_images(self, confession_id: int, content: str) -> List[str]:
-        """Generate confession images and return list of image URLs"""
-        lines = self.wrap_text(content)
+    def render_cache_key(self, confession_id: int, content: str, image_format: str) -> str:
+        """Hash of the content and everything else that determines the rendered pages"""
+        return render_key({
+            'version': RENDER_VERSION,
+            'confession_id': confession_id,
+            'content': content,
+            'layout': {
+                'image_width': self.image_width,
+                'image_height': self.image_height,
+                'font_size': self.font_size,
+                'line_height': self.line_height,
+                'max_lines_per_image': self.max_lines_per_image,
+                'text_margin': self.text_margin,
+            },
+            'fonts': [file_digest(self.font_path), file_digest(self.emoji_font_path)],
+            'background': file_digest(self.background_path),
+            'format': image_format,
+            'variants': self.variant_widths,
+            'encoder': {key: self.config.get(key) for key in ENCODER_OPTIONS},
+        })
+
+    def layout(self, content: str) -> LayoutPlan:
+        """Wrap and paginate content without rasterizing anything"""
+        with stage_timer('wrap'):
+            lines = self.wrap_lines(content)
         pages = [lines[i:i + self.max_lines_per_image] for i in range(0, len(lines), self.max_lines_per_image)]
+        return LayoutPlan(
+            pages=[[line for line, _ in page] for page in pages],
+            widths=[[width for _, width in page] for page in pages],
+            max_width=self.wrap_width,
+        )
+
+    def paginate(self, content: str) -> List[List[str]]:
+        """Wrap content and split the lines into pages"""
+        return self.layout(content).pages
+
+    def image_url(self, filename: str, sha256: str = None) -> str:
+        """Public URL of a generated image, versioned by content hash when enabled"""
+        if self.versioned_urls and sha256:
+            return f"/images/{filename}?v={sha256[:16]}"
+        return f"/images/{filename}"
+
+    def page_filename(self, confession_id: int, page_number: int, total_pages: int, image_format: str) -> str:
+        extension = ENCODERS[image_format].extension
+        return f"{confession_id}-{page_number}.{extension}" if total_pages > 1 else f"{confession_id}.{extension}"
+
+    def render_confession(self, confession_id: int, content: str, image_format: str = None,
+                          plan: Optional[LayoutPlan] = None) -> Dict[str, Any]:
+        """Generate confession images and return their URLs with per-page encoding stats.
+
+        plan, from layout(content), skips wrapping the text again.
+        """
+        with in_flight('confession'):
+            return self._render_confession(confession_id, content, image_format, plan)
+
+    def _render_confession(self, confession_id: int, content: str, image_format: str,
+                           plan: Optional[LayoutPlan]) -> Dict[str, Any]:
+        image_format = resolve_format(image_format, self.image_format)
+        
+        cache_key = None
+        if self.render_cache is not None:
+            cache_key = self.render_cache_key(confession_id, content, image_format)
+            manifest = self.render_cache.lookup(cache_key)
+            if manifest is not None and self.render_cache.restore(manifest, self.storage):
+                originals = [page for page in manifest['files'] if size_variant(page['filename']) is None]
+                self.storage.set_pages(confession_id, [page['filename'] for page in originals])
+                image_urls = [self.image_url(page['filename'], page['sha256']) for page in originals]
+                pages = manifest.get('pages', [])
+                return {'image_urls': image_urls, 'image_sets': self.image_sets(pages, image_urls),
+                        'pages': pages, 'cached': True}
+        
+        plan = plan or self.layout(content)
+        pages = plan.pages
+        RENDER_PAGES.observe(len(pages))
         
-        image_urls = []
+        page_jobs = []
         
         for page_index, page_lines in enumerate(pages):
             page_number = page_index + 1
-            filename = f"{confession_id}-{page_number}.png" if len(pages) > 1 else f"{confession_id}.png"
-            image_path = os.path.join(self.images_dir, filename)
-            
-            self.create_confession_image(page_lines, confession_id, page_number, len(pages), image_path)
-            
-            # Return relative URL path
-            image_urls.append(f"/images/{filename}")
+            filename = self.page_filename(confession_id, page_number, len(pages), image_format)
+            page_jobs.append((page_lines, confession_id, page_number, len(pages), filename, image_format,
+                              plan.widths[page_index]))
+        
+        # Over the memory ceiling, wait for the renders already running to finish
+        with self.memory_budget.render():
+            if self.render_pool is not None and len(page_jobs) > 1:
+                # Fan pages out to the process pool; results come back in page order
+                page_stats = self.render_pool.render_pages(page_jobs, self.theme)
+            else:
+                page_stats = [self.create_confession_image(*page_job) for page_job in page_jobs]
+        
+        # Return relative URL paths
+        filenames = [page_job[4] for page_job in page_jobs]
+        image_urls = [self.image_url(filename, stats['sha256']) for filename, stats in zip(filenames, page_stats)]
+        page_stats = [{'url': url, **stats} for url, stats in zip(image_urls, page_stats)]
+        for stats in page_stats:
+            for variant in stats.get('variants', []):
+                variant['url'] = self.image_url(variant['filename'], variant['sha256'])
         
-        return image_urls
+        # Pages left over from an earlier, longer render are deleted here
+        self.storage.set_pages(confession_id, filenames)
+        
+        if cache_key is not None:
+            variant_filenames = [variant['filename'] for stats in page_stats for variant in stats.get('variants', [])]
+            self.render_cache.store(cache_key, image_urls, self.storage, filenames + variant_filenames, page_stats)
+        
+        return {'image_urls': image_urls, 'image_sets': self.image_sets(page_stats, image_urls),
+                'pages': page_stats, 'cached': False}
 
-    def create_confession_image(self, lines: List[str], confession_id: int, 
-                              page_number: int, total_pages: int, output_path: str):
-        """Create a single confession image"""
+    def image_sets(self, page_stats: List[Dict[str, Any]], image_urls: List[str]) -> List[Dict[str, Any]]:
+        """src and srcset for each page, listing its size variants and the full-size original"""
+        image_sets = []
+        for index, url in enumerate(image_urls):
+            stats = page_stats[index] if index < len(page_stats) else {}
+            candidates = [(variant['url'], variant['width']) for variant in stats.get('variants', [])]
+            candidates.append((url, self.image_width))
+            image_sets.append({
+                'src': url,
+                'srcset': ', '.join(f"{candidate} {width}w" for candidate, width in sorted(candidates, key=lambda c: c[1]))
+            })
+        return image_sets
+
+    def generate_confession_images(self, confession_id: int, content: str, image_format: str = None) -> List[str]:
+        """Generate confession images and return list of image URLs"""
+        return self.render_confession(confession_id, content, image_format)['image_urls']
+
+    def iter_confession_pages(self, confession_id: int, content: str, image_format: str = None,
+                              plan: Optional[LayoutPlan] = None) -> Iterator[Dict[str, Any]]:
+        """Render confession pages into memory, yielding each page as soon as it is encoded.
+
+        Nothing is written to IMAGES_DIR and the render cache is bypassed.
+        """
+        image_format = resolve_format(image_format, self.image_format)
+        plan = plan or self.layout(content)
+        pages = plan.pages
+        RENDER_PAGES.observe(len(pages))
+        page_jobs = [(page_lines, confession_id, index + 1, len(pages), image_format, plan.widths[index])
+                     for index, page_lines in enumerate(pages)]
         
-        # Create background
-        image = self.create_gradient_background()
-        draw = ImageDraw.Draw(image)
+        if self.render_pool is not None and len(page_jobs) > 1:
+            encoded_pages = self.render_pool.encode_pages(page_jobs, self.theme)
+        else:
+            encoded_pages = (self.encode_page_in_memory(*page_job) for page_job in page_jobs)
         
+        # Held until the last page is sent (or the client goes away)
+        with self.memory_budget.render():
+            yield from self._encoded_page_items(confession_id, image_format, page_jobs, encoded_pages)
+
+    def _encoded_page_items(self, confession_id: int, image_format: str, page_jobs: List[Tuple],
+                            encoded_pages: Iterator[EncodedImage]) -> Iterator[Dict[str, Any]]:
+        for (_, _, page_number, total_pages, _, _), encoded in zip(page_jobs, encoded_pages):
+            yield {
+                'filename': self.page_filename(confession_id, page_number, total_pages, image_format),
+                'page_number': page_number,
+                'total_pages': total_pages,
+                'format': encoded.format,
+                'mimetype': encoded.mimetype,
+                'data': encoded.data,
+                'encode_ms': round(encoded.encode_ms, 2)
+            }
+
+    def encode_page_in_memory(self, lines: List[str], confession_id: int, page_number: int,
+                              total_pages: int, image_format: str = None,
+                              widths: Optional[List[int]] = None) -> EncodedImage:
+        """Render and encode a single page without touching disk"""
+        with self.drawn_page(lines, confession_id, page_number, total_pages, widths) as image:
+            encoded = encode_image(image, image_format or self.image_format, self.config)
+        self.observe_encoding(encoded)
+        return encoded
+
+    def render_page(self, lines: List[str], confession_id: int, page_number: int, total_pages: int,
+                    widths: Optional[List[int]] = None) -> Image.Image:
+        """Draw a single confession page into an image the caller keeps"""
+        with self.drawn_page(lines, confession_id, page_number, total_pages, widths) as image:
+            return image.copy()
+
+    @contextmanager
+    def drawn_page(self, lines: List[str], confession_id: int, page_number: int, total_pages: int,
+                   widths: Optional[List[int]] = None) -> Iterator[Image.Image]:
+        """Draw a page on a pooled canvas that is reused once the block exits.
+
+        widths (from a layout plan) avoid measuring the lines again.
+        """
+        size = (self.image_width, self.image_height)
+        with in_flight('page'), self.canvas_pool.borrow(size) as image:
+            # Paint the background over whatever the canvas held before
+            with stage_timer('background'):
+                image.paste(self.background_cache.get_prepared(self.background_path, size))
+            
+            with stage_timer('text_draw'):
+                self.draw_page_text(image, lines, confession_id, page_number, total_pages, widths)
+            
+            yield image
+
+    def draw_page_text(self, image: Image.Image, lines: List[str], confession_id: int,
+                       page_number: int, total_pages: int, widths: Optional[List[int]] = None):
+        """Draw the confession lines and the ID onto a page background"""
         # Calculate starting Y position to center text vertically
         total_text_height = len(lines) * self.line_height
         start_y = (self.image_height - total_text_height) // 2
@@ -376,20 +583,91 @@ class ImageGeneratorService:
             y = start_y + (index * self.line_height)
             
             # Center the text horizontally (accounting for mixed content)
-            text_width = self.get_mixed_text_width(line)
+            text_width = widths[index] if widths is not None else self.get_mixed_text_width(line)
             x = (self.image_width - text_width) // 2
             
             # Add text with effects (handles both emojis and regular text)
-            self.add_mixed_text_with_effects(draw, line, x, y)
+            self.add_mixed_text_with_effects(image, line, x, y)
         
         # Add confession ID in top right corner
         id_text = f"{confession_id}-{page_number}" if total_pages > 1 else str(confession_id)
-        self.add_id_text(draw, id_text)
+        self.add_id_text(image, id_text)
+
+    def encode_page(self, image: Image.Image, filename: str, image_format: str = None) -> Dict[str, Any]:
+        """Encode a rendered page into storage as filename and report the encoding cost"""
+        encoded = encode_image(image, image_format or self.image_format, self.config)
+        self.observe_encoding(encoded)
+        
+        with stage_timer('disk_write'):
+            self.storage.write(filename, encoded.data)
+        
+        return {
+            'sha256': hashlib.sha256(encoded.data).hexdigest(),
+            'format': encoded.format,
+            'bytes': len(encoded.data),
+            'encode_ms': round(encoded.encode_ms, 2)
+        }
+
+    def observe_encoding(self, encoded: EncodedImage):
+        RENDER_STAGE_SECONDS.labels('encode').observe(encoded.encode_ms / 1000)
+        OUTPUT_BYTES.labels(encoded.format).observe(len(encoded.data))
+
+    def create_confession_image(self, lines: List[str], confession_id: int, 
+                              page_number: int, total_pages: int, filename: str,
+                              image_format: str = None, widths: Optional[List[int]] = None) -> Dict[str, Any]:
+        """Create a single confession image, plus its size variants when configured"""
+        with self.drawn_page(lines, confession_id, page_number, total_pages, widths) as image:
+            stats = self.encode_page(image, filename, image_format)
+            if self.variant_widths:
+                stats['variants'] = [self.encode_variant(image, filename, width, image_format)
+                                     for width in self.variant_widths]
+        return stats
+
+    def variant_filename(self, filename: str, width: int) -> str:
+        stem, extension = os.path.splitext(filename)
+        return f"{stem}@{width}w{extension}"
+
+    def encode_variant(self, image: Image.Image, filename: str, width: int,
+                       image_format: str = None) -> Dict[str, Any]:
+        """Downscale a full-size page to width with a single resample and store it"""
+        height = round(image.height * width / image.width)
+        with stage_timer('resize'):
+            # reducing_gap lets Pillow shrink by an integer factor first, then resample once
+            resized = image.resize((width, height), Image.LANCZOS, reducing_gap=2.0)
+        variant_name = self.variant_filename(filename, width)
+        return {'width': width, 'filename': variant_name, **self.encode_page(resized, variant_name, image_format)}
+
+    def create_size_variant(self, variant_name: str) -> Optional[Dict[str, Any]]:
+        """Derive a configured size variant (e.g. 12-1@480w.png) from its stored original"""
+        variant = size_variant(variant_name)
+        if variant is None or variant[1] not in self.variant_widths:
+            return None
+        
+        original, width = variant
+        data = self.storage.read(original)
+        image_format = format_for_extension(os.path.splitext(original)[1])
+        if data is None or image_format is None:
+            return None
         
-        # Save image
-        image.save(output_path, 'PNG', quality=95)
+        with Image.open(io.BytesIO(data)) as source:
+            image = source.convert('RGB')
+        return self.encode_variant(image, original, width, image_format)
+
+    def warm_up(self, image_format: str = None) -> float:
+        """Render and encode a throwaway page so the first real request skips the cold-start costs"""
+        started = time.perf_counter()
+        plan = self.layout(WARM_UP_TEXT)
+        image = self.render_page(plan.pages[0], 0, 1, 1, plan.widths[0])
+        encode_image(image, image_format or self.image_format, self.config)
+        return (time.perf_counter() - started) * 1000
+
+    def transcode_image(self, source_name: str, variant_name: str, image_format: str) -> Dict[str, Any]:
+        """Re-encode a stored image in another format"""
+        with Image.open(io.BytesIO(self.storage.read(source_name))) as source:
+            image = source.convert('RGB')
+        return self.encode_page(image, variant_name, image_format)
 
-    def add_id_text(self, draw: ImageDraw.Draw, id_text: str):
+    def add_id_text(self, image: Image.Image, id_text: str):
         """Add ID text in top right corner"""
         margin = 150
         
@@ -399,4 +677,4 @@ class ImageGeneratorService:
         y = margin
         
         # Add ID text with effects
-        self.add_text_with_effects(draw, id_text, x, y, self.id_font)
+        self.add_text_with_effects(image, id_text, x, y, self.id_font)
@@ -0,0 +1,265 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+JOB_STATUSES = ('queued', 'running', 'done', 'failed')
+
+
+class JobQueue:
+    """Render job queue persisted in SQLite and drained by a pool of worker threads.
+
+    Jobs survive restarts: a job claimed by a worker holds a lease, renewed
+    while the handler runs, and if the process dies before finishing it the job
+    is picked up again once the lease expires. A job whose worker died
+    max_attempts times is failed instead of claimed again. Several processes
+    (e.g. gunicorn workers) can share one database.
+    """
+
+    def __init__(self, db_path: str, handler: Callable[[Dict[str, Any]], Dict[str, Any]],
+                 workers: int = 2, lease_seconds: int = 300, retention_seconds: int = 7 * 24 * 3600,
+                 poll_interval: float = 1.0, max_attempts: int = 3):
+        self.db_path = db_path
+        self.handler = handler
+        self.workers = max(1, workers)
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max(1, max_attempts)
+        self.retention_seconds = retention_seconds
+        self.poll_interval = poll_interval
+
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._threads = []
+        self._last_prune = 0.0
+
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        self._init_db()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _init_db(self):
+        conn = self._connect()
+        try:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    result TEXT,
+                    error TEXT,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    lease_until REAL,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS jobs_status_created ON jobs (status, created_at)')
+        finally:
+            conn.close()
+
+    def enqueue(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """Persist a new job and wake up a worker"""
+        job_id = uuid.uuid4().hex
+        now = time.time()
+
+        conn = self._connect()
+        try:
+            conn.execute(
+                'INSERT INTO jobs (id, status, payload, created_at, updated_at) VALUES (?, ?, ?, ?, ?)',
+                (job_id, 'queued', json.dumps(payload), now, now)
+            )
+        finally:
+            conn.close()
+
+        self._wakeup.set()
+        return self.get(job_id)
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Return the public view of a job, or None if it does not exist"""
+        conn = self._connect()
+        try:
+            row = conn.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        finally:
+            conn.close()
+
+        if row is None:
+            return None
+
+        return {
+            'job_id': row['id'],
+            'status': row['status'],
+            'payload': json.loads(row['payload']),
+            'result': json.loads(row['result']) if row['result'] else None,
+            'error': row['error'],
+            'attempts': row['attempts'],
+            'created_at': row['created_at'],
+            'updated_at': row['updated_at'],
+        }
+
+    def depth(self) -> int:
+        """Number of jobs waiting for a worker"""
+        conn = self._connect()
+        try:
+            return conn.execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued'").fetchone()[0]
+        finally:
+            conn.close()
+
+    def start(self):
+        """Start the worker threads (idempotent)"""
+        if self._threads:
+            return
+
+        self._stopping.clear()
+        for index in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f'render-worker-{index}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout: float = 5.0):
+        """Ask the workers to exit after their current job"""
+        self._stopping.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def _claim(self) -> Optional[Dict[str, Any]]:
+        """Lease the oldest runnable job; the returned attempt number identifies the lease"""
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            # Jobs whose worker died on every attempt (e.g. a payload that crashes or OOM-kills it)
+            conn.execute(
+                "UPDATE jobs SET status = 'failed', error = ?, lease_until = NULL, updated_at = ? "
+                "WHERE status = 'running' AND lease_until < ? AND attempts >= ?",
+                (f'Gave up after {self.max_attempts} attempts', now, now, self.max_attempts)
+            )
+            row = conn.execute(
+                "SELECT id, payload, attempts FROM jobs "
+                "WHERE status = 'queued' OR (status = 'running' AND lease_until < ?) "
+                "ORDER BY created_at LIMIT 1",
+                (now,)
+            ).fetchone()
+
+            if row is not None:
+                conn.execute(
+                    "UPDATE jobs SET status = 'running', attempts = attempts + 1, lease_until = ?, updated_at = ? "
+                    "WHERE id = ?",
+                    (now + self.lease_seconds, now, row['id'])
+                )
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        finally:
+            conn.close()
+
+        if row is None:
+            return None
+        return {'id': row['id'], 'payload': row['payload'], 'attempt': row['attempts'] + 1}
+
+    def _renew(self, job_id: str, attempt: int) -> bool:
+        """Extend the lease of a job this worker still holds"""
+        now = time.time()
+        conn = self._connect()
+        try:
+            cursor = conn.execute(
+                "UPDATE jobs SET lease_until = ?, updated_at = ? WHERE id = ? AND status = 'running' AND attempts = ?",
+                (now + self.lease_seconds, now, job_id, attempt)
+            )
+            return cursor.rowcount == 1
+        finally:
+            conn.close()
+
+    def _heartbeat(self, job_id: str, attempt: int, done: threading.Event):
+        while not done.wait(max(self.lease_seconds / 3, 1.0)):
+            try:
+                if not self._renew(job_id, attempt):
+                    return
+            except sqlite3.Error as e:
+                logger.warning(f"Failed to renew the lease of render job {job_id}: {str(e)}")
+
+    def _finish(self, job_id: str, attempt: int, status: str, result: Optional[Dict[str, Any]] = None,
+                error: Optional[str] = None) -> bool:
+        """Store the outcome, unless the lease was lost and another attempt took the job over"""
+        conn = self._connect()
+        try:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, lease_until = NULL, updated_at = ? "
+                "WHERE id = ? AND status = 'running' AND attempts = ?",
+                (status, json.dumps(result) if result is not None else None, error, time.time(), job_id, attempt)
+            )
+            stored = cursor.rowcount == 1
+        finally:
+            conn.close()
+
+        if not stored:
+            logger.warning(f"Render job {job_id} attempt {attempt} lost its lease; its outcome was dropped")
+            return False
+        return True
+
+    def _prune(self):
+        now = time.time()
+        if now - self._last_prune < 3600:
+            return
+        self._last_prune = now
+
+        conn = self._connect()
+        try:
+            conn.execute(
+                "DELETE FROM jobs WHERE status IN ('done', 'failed') AND updated_at < ?",
+                (now - self.retention_seconds,)
+            )
+        finally:
+            conn.close()
+
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                row = self._claim()
+            except sqlite3.Error as e:
+                logger.error(f"Failed to claim render job: {str(e)}")
+                row = None
+
+            if row is None:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+
+            job_id, attempt = row['id'], row['attempt']
+            done = threading.Event()
+            heartbeat = threading.Thread(target=self._heartbeat, args=(job_id, attempt, done),
+                                         name=f'lease-{job_id[:8]}', daemon=True)
+            heartbeat.start()
+            try:
+                result = self.handler(json.loads(row['payload']))
+                outcome = {'status': 'done', 'result': result}
+            except Exception as e:
+                logger.error(f"Render job {job_id} failed: {str(e)}")
+                outcome = {'status': 'failed', 'error': str(e)}
+            finally:
+                done.set()
+                heartbeat.join()
+
+            try:
+                self._finish(job_id, attempt, **outcome)
+            except sqlite3.Error as e:
+                logger.error(f"Failed to store the outcome of render job {job_id}: {str(e)}")
+
+            try:
+                self._prune()
+            except sqlite3.Error as e:
+                logger.warning(f"Failed to prune old render jobs: {str(e)}")
@@ -0,0 +1,83 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Optional
+
+from metrics import RENDERS_DEFERRED
+
+try:
+    PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+except (AttributeError, ValueError, OSError):
+    PAGE_SIZE = 4096
+
+
+def current_rss() -> Optional[int]:
+    """Resident set size of this process in bytes, or None where /proc is unavailable"""
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[1]) * PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class MemoryBudget:
+    """Per-process memory ceiling for renders.
+
+    While the process is above limit_bytes, a new render waits until the renders
+    already running finish (or max_wait seconds pass) before it starts, so
+    concurrent multi-page renders cannot keep stacking canvases on top of each
+    other. A render is never held back when it would be the only one running,
+    so the process always makes progress. A limit of 0 turns the ceiling off.
+    """
+
+    def __init__(self, limit_bytes: int = 0, max_wait: float = 30.0,
+                 usage: Callable[[], Optional[int]] = current_rss):
+        self.limit_bytes = limit_bytes
+        self.max_wait = max_wait
+        self._usage = usage
+        self._condition = threading.Condition()
+        self._running = 0
+        self._deferred = 0
+
+    @contextmanager
+    def render(self):
+        """Hold a render in this process, waiting first if the process is over its ceiling"""
+        self._enter()
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._running -= 1
+                self._condition.notify_all()
+
+    def over_limit(self) -> bool:
+        if self.limit_bytes <= 0:
+            return False
+        usage = self._usage()
+        return usage is not None and usage > self.limit_bytes
+
+    def stats(self) -> Dict[str, Any]:
+        with self._condition:
+            return {
+                'limit_bytes': self.limit_bytes,
+                'rss_bytes': self._usage(),
+                'running': self._running,
+                'deferred': self._deferred,
+            }
+
+    def _enter(self):
+        with self._condition:
+            deadline = time.monotonic() + self.max_wait
+            deferred = False
+            while self._running > 0 and self.over_limit():
+                if not deferred:
+                    deferred = True
+                    self._deferred += 1
+                    RENDERS_DEFERRED.inc()
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                # Memory is also freed outside of renders, so look again now and then
+                self._condition.wait(min(remaining, 0.5))
+            self._running += 1
@@ -0,0 +1,120 @@
+"""Prometheus metrics for the render pipeline.
+
+When PROMETHEUS_MULTIPROC_DIR is set (it must be, before import, under
+gunicorn), every process writes its samples to that directory and /metrics
+aggregates them, so all gunicorn workers and render pool processes report
+through one endpoint. Without prometheus_client installed every metric is a
+no-op and /metrics is unavailable.
+"""
+import contextlib
+import os
+from typing import Tuple
+
+MULTIPROC_DIR = os.getenv('PROMETHEUS_MULTIPROC_DIR') or os.getenv('prometheus_multiproc_dir')
+if MULTIPROC_DIR:
+    os.makedirs(MULTIPROC_DIR, exist_ok=True)
+
+try:
+    from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram,
+                                   generate_latest, multiprocess)
+    METRICS_ENABLED = True
+except ImportError:
+    METRICS_ENABLED = False
+
+
+class _NoopMetric:
+    """Stands in for any metric when prometheus_client is not installed"""
+
+    def labels(self, *args, **kwargs) -> '_NoopMetric':
+        return self
+
+    def observe(self, value: float):
+        pass
+
+    def inc(self, amount: float = 1):
+        pass
+
+    def dec(self, amount: float = 1):
+        pass
+
+    def time(self):
+        return contextlib.nullcontext()
+
+    def track_inprogress(self):
+        return contextlib.nullcontext()
+
+
+# Render stages, from sub-millisecond text layout up to slow AVIF encodes and callbacks
+STAGE_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+PAGE_BUCKETS = (1, 2, 3, 4, 5, 6, 8, 10, 15, 20, 30)
+BYTES_BUCKETS = tuple(2 ** exponent for exponent in range(14, 25))  # 16 KiB .. 16 MiB
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+if METRICS_ENABLED:
+    RENDER_STAGE_SECONDS = Histogram(
+        'noot_render_stage_seconds', 'Time spent in each render pipeline stage',
+        ['stage'], buckets=STAGE_BUCKETS,
+    )
+    RENDER_PAGES = Histogram(
+        'noot_render_pages', 'Pages per rendered confession', buckets=PAGE_BUCKETS,
+    )
+    OUTPUT_BYTES = Histogram(
+        'noot_output_bytes', 'Size of encoded pages', ['format'], buckets=BYTES_BUCKETS,
+    )
+    RENDERS_IN_FLIGHT = Gauge(
+        'noot_renders_in_flight', 'Confessions and pages being rendered right now',
+        ['kind'], multiprocess_mode='livesum',
+    )
+    REQUEST_SECONDS = Histogram(
+        'noot_request_seconds', 'HTTP request latency', ['endpoint'], buckets=REQUEST_BUCKETS,
+    )
+    ADMISSION_WAITING = Gauge(
+        'noot_admission_waiting', 'Renders waiting for a slot', ['lane'], multiprocess_mode='livesum',
+    )
+    ADMISSION_WAIT_SECONDS = Histogram(
+        'noot_admission_wait_seconds', 'Time renders waited for a slot', ['lane'], buckets=REQUEST_BUCKETS,
+    )
+    ERRORS = Counter(
+        'noot_errors_total', 'Failed requests, batch items and background jobs', ['endpoint', 'reason'],
+    )
+    RENDERS_DEFERRED = Counter(
+        'noot_renders_deferred_total', 'Renders held back by the per-process memory ceiling',
+    )
+else:
+    RENDER_STAGE_SECONDS = RENDER_PAGES = OUTPUT_BYTES = RENDERS_IN_FLIGHT = REQUEST_SECONDS = _NoopMetric()
+    ADMISSION_WAITING = ADMISSION_WAIT_SECONDS = ERRORS = RENDERS_DEFERRED = _NoopMetric()
+
+
+def stage_timer(stage: str):
+    """Context manager observing the duration of a render stage"""
+    return RENDER_STAGE_SECONDS.labels(stage).time()
+
+
+def in_flight(kind: str):
+    """Context manager counting a confession or page render while it runs"""
+    return RENDERS_IN_FLIGHT.labels(kind).track_inprogress()
+
+
+def render_latest() -> Tuple[bytes, str]:
+    """Exposition of all metrics, aggregated over every process in multiprocess mode"""
+    if MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry, path=MULTIPROC_DIR)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+def mark_process_dead(pid: int):
+    """Drop the live gauges of an exited worker (gunicorn child_exit hook)"""
+    if METRICS_ENABLED and MULTIPROC_DIR:
+        multiprocess.mark_process_dead(pid, MULTIPROC_DIR)
+
+
+def clear_multiproc_dir():
+    """Remove samples left by a previous server run"""
+    if not MULTIPROC_DIR:
+        return
+    for name in os.listdir(MULTIPROC_DIR):
+        if name.endswith('.db'):
+            os.remove(os.path.join(MULTIPROC_DIR, name))
@@ -0,0 +1,207 @@
+"""On-demand profiling of live requests.
+
+An admin arms a capture for the next N requests handled by this process, either
+with cProfile (CPU time per function) or tracemalloc (Python allocations per
+line and the peak while each request ran). Reports are written as JSON to a
+directory shared by all workers, so any worker can return them, and cProfile
+captures are also saved as .prof files for snakeviz or pstats.
+
+cProfile only sees the request thread, so pages rendered in the process pool
+or in a streamed response body are not included; tracemalloc traces every
+thread of the process, and not the pixel buffers Pillow allocates itself.
+"""
+import cProfile
+import io
+import json
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+import uuid
+from typing import Any, Dict, List, Optional
+
+MODES = ('cprofile', 'tracemalloc')
+
+# Upper bounds for requests and seconds per capture, so a forgotten capture cannot run forever
+MAX_CAPTURE_REQUESTS = 100
+MAX_CAPTURE_SECONDS = 3600
+
+# Functions or lines listed in a report
+REPORT_ENTRIES = 40
+
+
+class Capture:
+    """State of one armed capture"""
+
+    def __init__(self, mode: str, requests: int, seconds: float):
+        self.capture_id = uuid.uuid4().hex
+        self.mode = mode
+        self.requests = requests
+        self.started = 0
+        self.finished: List[Dict[str, Any]] = []
+        self.created_at = time.time()
+        self.expires_at = self.created_at + seconds
+        self.timer: Optional[threading.Timer] = None
+        # cProfile: the profiler of the current request and the stats of all finished ones
+        self.profiler: Optional[cProfile.Profile] = None
+        self.stats: Optional[pstats.Stats] = None
+        # tracemalloc: snapshot before the first request, and whether this capture started tracing
+        self.baseline: Optional[tracemalloc.Snapshot] = None
+        self.owns_tracing = False
+        self.request_started = 0.0
+
+
+class RequestProfiler:
+    """Profiles the next N requests of this process on demand.
+
+    Requests are profiled one at a time; requests arriving while another is
+    being profiled run normally and do not count towards N. A capture that has
+    not seen N requests by its deadline ends as 'expired' with whatever it
+    captured, and stops tracing if it started it.
+    """
+
+    def __init__(self, output_dir: str):
+        self.output_dir = output_dir
+        self._capture: Optional[Capture] = None
+        self._lock = threading.Lock()
+        # Held by the request being profiled
+        self._busy = threading.Lock()
+
+    def arm(self, mode: str, requests: int, seconds: float = 600) -> Dict[str, Any]:
+        """Capture the next requests within seconds; ValueError for a bad argument, or if a capture is running"""
+        if mode not in MODES:
+            raise ValueError(f"mode must be one of: {', '.join(MODES)}")
+        if not 1 <= requests <= MAX_CAPTURE_REQUESTS:
+            raise ValueError(f"requests must be between 1 and {MAX_CAPTURE_REQUESTS}")
+        if not 0 < seconds <= MAX_CAPTURE_SECONDS:
+            raise ValueError(f"seconds must be between 0 and {MAX_CAPTURE_SECONDS}")
+
+        with self._lock:
+            if self._capture is not None:
+                raise ValueError(f"Capture {self._capture.capture_id} is still running")
+            self._capture = capture = Capture(mode, requests, seconds)
+
+        self._write(capture, 'running')
+        capture.timer = threading.Timer(seconds, self.expire, args=(capture,))
+        capture.timer.daemon = True
+        capture.timer.start()
+        return self.summary(capture, 'running')
+
+    def expire(self, capture: Capture):
+        """End a capture at its deadline, once the request being profiled (if any) has finished"""
+        with self._busy:
+            with self._lock:
+                if self._capture is not capture:
+                    return
+            self._complete(capture, 'expired')
+
+    def start_request(self) -> Optional[Capture]:
+        """Begin profiling the current request if a capture wants it; pass the result to finish_request"""
+        with self._lock:
+            capture = self._capture
+            if capture is None or capture.started >= capture.requests or not self._busy.acquire(blocking=False):
+                return None
+            capture.started += 1
+
+        if capture.mode == 'cprofile':
+            capture.profiler = cProfile.Profile()
+            capture.profiler.enable()
+        else:
+            if capture.baseline is None:
+                if not tracemalloc.is_tracing():
+                    tracemalloc.start(10)
+                    capture.owns_tracing = True
+                capture.baseline = tracemalloc.take_snapshot()
+            tracemalloc.reset_peak()
+        capture.request_started = time.perf_counter()
+        return capture
+
+    def finish_request(self, capture: Optional[Capture], endpoint: str):
+        if capture is None:
+            return
+
+        try:
+            entry = {'endpoint': endpoint, 'ms': round((time.perf_counter() - capture.request_started) * 1000, 2)}
+            if capture.mode == 'cprofile':
+                capture.profiler.disable()
+                if capture.stats is None:
+                    capture.stats = pstats.Stats(capture.profiler)
+                else:
+                    capture.stats.add(capture.profiler)
+            else:
+                entry['peak_bytes'] = tracemalloc.get_traced_memory()[1]
+            capture.finished.append(entry)
+
+            if len(capture.finished) >= capture.requests:
+                self._complete(capture)
+            else:
+                self._write(capture, 'running')
+        finally:
+            self._busy.release()
+
+    def result(self, capture_id: str) -> Optional[Dict[str, Any]]:
+        """Report of a capture from any worker, or None if it is unknown"""
+        path = self._path(capture_id, '.json')
+        if path is None or not os.path.exists(path):
+            return None
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def profile_path(self, capture_id: str) -> Optional[str]:
+        """Path of a finished cProfile capture in pstats format, if there is one"""
+        path = self._path(capture_id, '.prof')
+        return path if path is not None and os.path.exists(path) else None
+
+    def summary(self, capture: Capture, status: str) -> Dict[str, Any]:
+        return {
+            'capture_id': capture.capture_id,
+            'mode': capture.mode,
+            'status': status,
+            'pid': os.getpid(),
+            'requests': capture.requests,
+            'captured': capture.finished,
+            'created_at': capture.created_at,
+            'expires_at': capture.expires_at,
+        }
+
+    def _complete(self, capture: Capture, status: str = 'done'):
+        if capture.timer is not None:
+            capture.timer.cancel()
+
+        report: Dict[str, Any] = {}
+        if capture.stats is not None:
+            output = io.StringIO()
+            capture.stats.stream = output
+            capture.stats.sort_stats('cumulative').print_stats(REPORT_ENTRIES)
+            report['profile'] = output.getvalue()
+            os.makedirs(self.output_dir, exist_ok=True)
+            capture.stats.dump_stats(self._path(capture.capture_id, '.prof'))
+        elif capture.baseline is not None:
+            snapshot = tracemalloc.take_snapshot()
+            if capture.owns_tracing:
+                tracemalloc.stop()
+            # Memory still held after the captured requests, by allocating line
+            report['allocations'] = [
+                {'location': str(stat.traceback[0]), 'size_diff': stat.size_diff, 'size': stat.size,
+                 'count_diff': stat.count_diff}
+                for stat in snapshot.compare_to(capture.baseline, 'lineno')[:REPORT_ENTRIES]
+            ]
+
+        self._write(capture, status, report)
+        with self._lock:
+            self._capture = None
+
+    def _write(self, capture: Capture, status: str, report: Optional[Dict[str, Any]] = None):
+        os.makedirs(self.output_dir, exist_ok=True)
+        path = self._path(capture.capture_id, '.json')
+        temp_path = f"{path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({**self.summary(capture, status), **(report or {})}, f)
+        os.replace(temp_path, path)
+
+    def _path(self, capture_id: str, suffix: str) -> Optional[str]:
+        # Capture ids are uuid4 hex strings; anything else is not a file of ours
+        if len(capture_id) != 32 or not all(c in '0123456789abcdef' for c in capture_id):
+            return None
+        return os.path.join(self.output_dir, capture_id + suffix)
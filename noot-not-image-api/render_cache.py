@@ -0,0 +1,219 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from text_metrics import LRUCache
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = 'manifest.json'
+
+# Eviction frees space down to this share of max_bytes, so the entries are rescanned
+# once per batch of evictions instead of on every store past the limit
+EVICT_TO_RATIO = 0.9
+
+# Digests keyed by (path, mtime, size) so unchanged files are hashed once
+_digest_cache = LRUCache(20000)
+
+
+def file_digest(path: str) -> str:
+    """SHA-256 of a file's contents, or 'missing' if it cannot be read"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return 'missing'
+
+    key = (path, stat.st_mtime_ns, stat.st_size)
+    cached = _digest_cache.get(key)
+    if cached is not None:
+        return cached
+
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+
+    _digest_cache.put(key, digest.hexdigest())
+    return digest.hexdigest()
+
+
+def render_key(parts: Dict[str, Any]) -> str:
+    """Stable hash of everything that affects the rendered output"""
+    encoded = json.dumps(parts, sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha256(encoded.encode('utf-8')).hexdigest()
+
+
+class RenderCache:
+    """Content-addressed store of rendered pages.
+
+    Each entry is a directory named after the render key holding the page files
+    and a manifest with their URLs and digests. Entries are evicted least
+    recently used first once the cache grows past max_bytes, down to
+    EVICT_TO_RATIO of it.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(cache_dir, exist_ok=True)
+        self._total_bytes = self._scan_size()
+
+    def _entry_dir(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], key)
+
+    def lookup(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return the manifest for key, counting the hit or miss"""
+        manifest_path = os.path.join(self._entry_dir(key), MANIFEST_NAME)
+        try:
+            with open(manifest_path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+            # Mark as recently used for eviction
+            os.utime(manifest_path)
+        except (OSError, ValueError):
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.hits += 1
+        return manifest
+
+    def restore(self, manifest: Dict[str, Any], storage) -> bool:
+        """Make sure every cached page is in storage; False if the entry is unusable"""
+        entry_dir = self._entry_dir(manifest['key'])
+
+        for page in manifest['files']:
+            stored = storage.find(page['filename'])
+            if (stored is not None and stored.size == page['bytes']
+                    and storage.digest(page['filename']) == page['sha256']):
+                continue
+
+            try:
+                with open(os.path.join(entry_dir, page['filename']), 'rb') as f:
+                    storage.write(page['filename'], f.read())
+            except OSError as e:
+                logger.warning(f"Render cache entry {manifest['key']} could not be restored: {str(e)}")
+                return False
+
+        return True
+
+    def store(self, key: str, image_urls: List[str], storage, filenames: List[str],
+              pages: Optional[List[Dict[str, Any]]] = None) -> Optional[Dict[str, Any]]:
+        """Copy freshly rendered pages from storage into the cache under key"""
+        entry_dir = self._entry_dir(key)
+        if os.path.isdir(entry_dir):
+            return None
+
+        os.makedirs(os.path.dirname(entry_dir), exist_ok=True)
+        tmp_dir = tempfile.mkdtemp(dir=os.path.dirname(entry_dir), prefix='.tmp-')
+        files = []
+        entry_bytes = 0
+
+        try:
+            for filename in filenames:
+                data = storage.read(filename)
+                if data is None:
+                    raise OSError(f"{filename} is missing from storage")
+                with open(os.path.join(tmp_dir, filename), 'wb') as f:
+                    f.write(data)
+                files.append({
+                    'filename': filename,
+                    'sha256': hashlib.sha256(data).hexdigest(),
+                    'bytes': len(data),
+                })
+                entry_bytes += len(data)
+
+            manifest = {
+                'key': key,
+                'image_urls': image_urls,
+                'pages': pages or [],
+                'files': files,
+                'created_at': time.time(),
+            }
+            with open(os.path.join(tmp_dir, MANIFEST_NAME), 'w', encoding='utf-8') as f:
+                json.dump(manifest, f)
+
+            os.rename(tmp_dir, entry_dir)
+        except OSError as e:
+            # Another process may have stored the same key first
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            if not os.path.isdir(entry_dir):
+                logger.warning(f"Failed to store render cache entry {key}: {str(e)}")
+            return None
+
+        with self._lock:
+            self._total_bytes += entry_bytes
+            over_budget = self._total_bytes > self.max_bytes
+
+        if over_budget:
+            self.evict()
+
+        return manifest
+
+    def evict(self):
+        """Remove least recently used entries until the cache is back under EVICT_TO_RATIO of max_bytes"""
+        entries = []
+        for prefix in self._listdir(self.cache_dir):
+            prefix_dir = os.path.join(self.cache_dir, prefix)
+            for key in self._listdir(prefix_dir):
+                entry_dir = os.path.join(prefix_dir, key)
+                try:
+                    last_used = os.stat(os.path.join(entry_dir, MANIFEST_NAME)).st_mtime
+                except OSError:
+                    continue
+                entries.append((last_used, entry_dir, self._dir_size(entry_dir)))
+
+        total = sum(size for _, _, size in entries)
+        target = int(self.max_bytes * EVICT_TO_RATIO)
+        for _, entry_dir, size in sorted(entries):
+            if total <= target:
+                break
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            total -= size
+
+        with self._lock:
+            self._total_bytes = total
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0,
+                'bytes': self._total_bytes,
+                'max_bytes': self.max_bytes,
+            }
+
+    def _scan_size(self) -> int:
+        total = 0
+        for prefix in self._listdir(self.cache_dir):
+            prefix_dir = os.path.join(self.cache_dir, prefix)
+            for key in self._listdir(prefix_dir):
+                total += self._dir_size(os.path.join(prefix_dir, key))
+        return total
+
+    def _listdir(self, path: str) -> List[str]:
+        try:
+            return [name for name in os.listdir(path) if not name.startswith('.')]
+        except OSError:
+            return []
+
+    def _dir_size(self, path: str) -> int:
+        total = 0
+        for name in self._listdir(path):
+            try:
+                total += os.path.getsize(os.path.join(path, name))
+            except OSError:
+                pass
+        return total
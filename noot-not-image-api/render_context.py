@@ -0,0 +1,88 @@
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, NamedTuple, Tuple
+
+from PIL import ImageFont
+
+from background_cache import BackgroundCache
+from text_metrics import TextMeasurer
+
+# Rough size of one cached segment measurement (key, tuple and dict slot)
+MEASURE_ENTRY_BYTES = 200
+
+
+class RenderContext(NamedTuple):
+    """Loaded fonts, prepared background and measurement cache for one look"""
+    font: ImageFont.ImageFont
+    emoji_font: ImageFont.ImageFont
+    id_font: ImageFont.ImageFont
+    emoji_font_available: bool
+    text_measurer: TextMeasurer
+    background_cache: BackgroundCache
+    font_bytes: int
+    canvas: Tuple[int, int]
+
+    def nbytes(self) -> int:
+        """Estimated memory held: font files, the prepared RGB background and cached measurements"""
+        width, height = self.canvas
+        return self.font_bytes + width * height * 3 + len(self.text_measurer.cache) * MEASURE_ENTRY_BYTES
+
+
+class RenderContextCache:
+    """Bounded LRU of render contexts, keyed by (font path, font size, background, canvas size).
+
+    Least recently used contexts are evicted once there are more than
+    max_entries, or their estimated memory exceeds max_bytes. The most recently
+    used context is always kept, however large.
+    """
+
+    def __init__(self, max_entries: int = 8, max_bytes: int = 256 * 1024 * 1024):
+        self.max_entries = max(1, max_entries)
+        self.max_bytes = max_bytes
+        self._contexts: 'OrderedDict[Hashable, RenderContext]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def get(self, key: Hashable, build: Callable[[], RenderContext]) -> RenderContext:
+        """Return the context for key, building it with build() on a miss"""
+        with self._lock:
+            context = self._contexts.get(key)
+            if context is not None:
+                self._contexts.move_to_end(key)
+                self._hits += 1
+                return context
+            self._misses += 1
+
+        # Loading fonts takes a while; a concurrent miss on the same key keeps the first context stored
+        context = build()
+
+        with self._lock:
+            context = self._contexts.setdefault(key, context)
+            self._contexts.move_to_end(key)
+            self._evict()
+        return context
+
+    def clear(self):
+        with self._lock:
+            self._contexts.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'entries': len(self._contexts),
+                'bytes': self._total_bytes(),
+                'hits': self._hits,
+                'misses': self._misses,
+                'evictions': self._evictions,
+            }
+
+    def _total_bytes(self) -> int:
+        return sum(context.nbytes() for context in self._contexts.values())
+
+    def _evict(self):
+        while len(self._contexts) > 1 and (len(self._contexts) > self.max_entries
+                                           or (self.max_bytes > 0 and self._total_bytes() > self.max_bytes)):
+            self._contexts.popitem(last=False)
+            self._evictions += 1
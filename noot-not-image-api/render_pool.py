@@ -0,0 +1,89 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+# (lines, confession_id, page_number, total_pages, filename, image_format, line widths)
+PageJob = Tuple[List[str], int, int, int, str, str, List[int]]
+
+# Service owned by each pool process, built once by _init_worker
+_worker_service = None
+
+
+def _init_worker(config: Dict[str, Any]):
+    """Load fonts and warm up the renderer once per pool process"""
+    global _worker_service
+    from image_generator import ImageGeneratorService
+
+    _worker_service = ImageGeneratorService({**config, 'RENDER_PROCESSES': 0})
+    _worker_service.warm_up()
+
+
+def create_worker_pool(config: Dict[str, Any], processes: int) -> ProcessPoolExecutor:
+    """Process pool whose workers each own a ready-to-use ImageGeneratorService"""
+    # Spawn rather than fork: the parent may be running render worker threads
+    return ProcessPoolExecutor(
+        max_workers=processes,
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=_init_worker,
+        initargs=(config,),
+    )
+
+
+def render_confession_job(item: Dict[str, Any]) -> Dict[str, Any]:
+    """Render a whole confession inside a pool process"""
+    service = _worker_service.themed(item.get('theme'))
+    return service.render_confession(item['confession_id'], item['content'], item.get('format'))
+
+
+def _render_page(job: PageJob, theme: Optional[str] = None) -> Dict[str, Any]:
+    return _worker_service.themed(theme).create_confession_image(*job)
+
+
+def _encode_page(job: Tuple[List[str], int, int, int, str, List[int]], theme: Optional[str] = None):
+    return _worker_service.themed(theme).encode_page_in_memory(*job)
+
+
+class RenderPool:
+    """Process pool that renders the pages of one confession in parallel"""
+
+    def __init__(self, config: Dict[str, Any], processes: int):
+        self.config = config
+        self.processes = processes
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            # A pool inherited through fork (e.g. gunicorn --preload) is not usable here
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = create_worker_pool(self.config, self.processes)
+                self._pid = os.getpid()
+            return self._executor
+
+    def render_pages(self, jobs: List[PageJob], theme: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Render every page (with theme's render context) and return their encoding stats in page order"""
+        executor = self._get_executor()
+        futures = [executor.submit(_render_page, job, theme) for job in jobs]
+        return [future.result() for future in futures]
+
+    def encode_pages(self, jobs: List[Tuple[List[str], int, int, int, str, List[int]]],
+                     theme: Optional[str] = None) -> Iterator[Any]:
+        """Render pages to encoded bytes, yielding each one in page order as soon as it is ready"""
+        executor = self._get_executor()
+        futures = [executor.submit(_encode_page, job, theme) for job in jobs]
+        try:
+            for future in futures:
+                yield future.result()
+        finally:
+            for future in futures:
+                future.cancel()
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None and self._pid == os.getpid():
+                self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+            self._pid = None
@@ -0,0 +1,100 @@
+import json
+import os
+from typing import Any, Dict
+
+from dotenv import load_dotenv
+
+# Settings a theme may override, with their types
+THEME_SETTINGS = {
+    'IMAGE_WIDTH': int,
+    'IMAGE_HEIGHT': int,
+    'FONT_SIZE': int,
+    'LINE_HEIGHT': int,
+    'MAX_LINES_PER_IMAGE': int,
+    'TEXT_MARGIN': int,
+    'FONT_FILE': str,
+    'BACKGROUND_IMAGE': str,
+}
+
+
+def load_themes(path: str) -> Dict[str, Dict[str, Any]]:
+    """Read {"theme": {"SETTING": value, ...}} from a JSON file; no themes if it does not exist"""
+    if not path or not os.path.exists(path):
+        return {}
+
+    with open(path, 'r', encoding='utf-8') as f:
+        themes = json.load(f)
+
+    for name, overrides in themes.items():
+        for key, value in overrides.items():
+            if key not in THEME_SETTINGS:
+                raise ValueError(f"Theme '{name}' sets {key}; themes may set {', '.join(THEME_SETTINGS)}")
+            if not isinstance(value, THEME_SETTINGS[key]):
+                raise ValueError(f"Theme '{name}': {key} must be a {THEME_SETTINGS[key].__name__}")
+    return themes
+
+
+def load_config() -> Dict[str, Any]:
+    """Build the service configuration from the environment (and .env, if present)"""
+    load_dotenv()
+
+    return {
+        'IMAGE_WIDTH': int(os.getenv('IMAGE_WIDTH', 1920)),
+        'IMAGE_HEIGHT': int(os.getenv('IMAGE_HEIGHT', 1920)),
+        'FONT_SIZE': int(os.getenv('FONT_SIZE', 84)),
+        'LINE_HEIGHT': int(os.getenv('LINE_HEIGHT', 110)),
+        'MAX_LINES_PER_IMAGE': int(os.getenv('MAX_LINES_PER_IMAGE', 15)),
+        'TEXT_MARGIN': int(os.getenv('TEXT_MARGIN', 100)),
+        'FONT_FILE': os.getenv('FONT_FILE', 'noto-sans.ttf'),
+        'BACKGROUND_IMAGE': os.getenv('BACKGROUND_IMAGE', 'bg.png'),
+        'THEMES': load_themes(os.getenv('THEMES_FILE', './assets/themes.json')),
+        'RENDER_CONTEXTS_MAX': int(os.getenv('RENDER_CONTEXTS_MAX', 8)),
+        'RENDER_CONTEXTS_MAX_BYTES': int(os.getenv('RENDER_CONTEXTS_MAX_BYTES', 256 * 1024 * 1024)),
+        'FONTS_DIR': os.getenv('FONTS_DIR', './assets/fonts'),
+        'IMAGES_DIR': os.getenv('IMAGES_DIR', './assets/images'),
+        'BACKGROUND_DIR': os.getenv('BACKGROUND_DIR', './assets/backgrounds'),
+        'MEASURE_CACHE_SIZE': int(os.getenv('MEASURE_CACHE_SIZE', 50000)),
+        'RENDER_PROCESSES': int(os.getenv('RENDER_PROCESSES', 0)),
+        'IMAGE_FORMAT': os.getenv('IMAGE_FORMAT', 'png'),
+        'PNG_COMPRESS_LEVEL': int(os.getenv('PNG_COMPRESS_LEVEL', 6)),
+        'WEBP_QUALITY': int(os.getenv('WEBP_QUALITY', 85)),
+        'AVIF_QUALITY': int(os.getenv('AVIF_QUALITY', 60)),
+        'JPEG_QUALITY': int(os.getenv('JPEG_QUALITY', 88)),
+        'VERSIONED_IMAGE_URLS': os.getenv('VERSIONED_IMAGE_URLS', 'True').lower() == 'true',
+        'IMAGE_CACHE_MAX_AGE': int(os.getenv('IMAGE_CACHE_MAX_AGE', 300)),
+        'IMAGES_ACCEL_REDIRECT_PREFIX': os.getenv('IMAGES_ACCEL_REDIRECT_PREFIX', ''),
+        'NEGOTIATE_IMAGE_FORMATS': [f.strip() for f in os.getenv('NEGOTIATE_IMAGE_FORMATS', '').split(',') if f.strip()],
+        'IMAGE_VARIANTS': [int(w) for w in os.getenv('IMAGE_VARIANTS', '').split(',') if w.strip()],
+        'STORAGE_BACKEND': os.getenv('STORAGE_BACKEND', 'local'),
+        'S3_BUCKET': os.getenv('S3_BUCKET', ''),
+        'S3_PREFIX': os.getenv('S3_PREFIX', ''),
+        'S3_ENDPOINT_URL': os.getenv('S3_ENDPOINT_URL', ''),
+        'IMAGES_MAX_BYTES': int(os.getenv('IMAGES_MAX_BYTES', 0)),
+        'RENDER_CACHE_DIR': os.getenv('RENDER_CACHE_DIR', './cache/renders'),
+        'RENDER_CACHE_MAX_BYTES': int(os.getenv('RENDER_CACHE_MAX_BYTES', 512 * 1024 * 1024)),
+        'JOBS_DB_PATH': os.getenv('JOBS_DB_PATH', './data/jobs.sqlite3'),
+        'RENDER_WORKERS': int(os.getenv('RENDER_WORKERS', 2)),
+        'JOB_LEASE_SECONDS': int(os.getenv('JOB_LEASE_SECONDS', 300)),
+        'JOB_MAX_ATTEMPTS': int(os.getenv('JOB_MAX_ATTEMPTS', 3)),
+        'BATCH_MAX_ITEMS': int(os.getenv('BATCH_MAX_ITEMS', 500)),
+        'JOB_QUEUE_MAX_DEPTH': int(os.getenv('JOB_QUEUE_MAX_DEPTH', 1000)),
+        'RENDER_CONCURRENCY': int(os.getenv('RENDER_CONCURRENCY', 2)),
+        'RENDER_QUEUE_SIZE': int(os.getenv('RENDER_QUEUE_SIZE', 8)),
+        'BACKFILL_CONCURRENCY': int(os.getenv('BACKFILL_CONCURRENCY', 1)),
+        'BACKFILL_QUEUE_SIZE': int(os.getenv('BACKFILL_QUEUE_SIZE', 4)),
+        'ADMISSION_TIMEOUT': float(os.getenv('ADMISSION_TIMEOUT', 20)),
+        'MAX_CONTENT_CHARS': int(os.getenv('MAX_CONTENT_CHARS', 5000)),
+        'MAX_PAGES': int(os.getenv('MAX_PAGES', 20)),
+        'CANVAS_POOL_SIZE': int(os.getenv('CANVAS_POOL_SIZE', 2)),
+        'RENDER_MEMORY_LIMIT_MB': int(os.getenv('RENDER_MEMORY_LIMIT_MB', 0)),
+        'RENDER_MEMORY_WAIT': float(os.getenv('RENDER_MEMORY_WAIT', 30)),
+        'ADMIN_TOKEN': os.getenv('ADMIN_TOKEN', ''),
+        'PROFILE_DIR': os.getenv('PROFILE_DIR', './data/profiles'),
+        'PROFILE_MAX_SECONDS': float(os.getenv('PROFILE_MAX_SECONDS', 600)),
+        'OUTBOX_DB_PATH': os.getenv('OUTBOX_DB_PATH', './data/outbox.sqlite3'),
+        'CALLBACK_MAX_ATTEMPTS': int(os.getenv('CALLBACK_MAX_ATTEMPTS', 12)),
+        'CALLBACK_TIMEOUT': float(os.getenv('CALLBACK_TIMEOUT', 10)),
+        # gunicorn.conf.py turns this off and starts the workers after forking instead
+        'START_BACKGROUND_WORKERS': os.getenv('START_BACKGROUND_WORKERS', 'True').lower() == 'true',
+        'PHP_API_BASE_URL': os.getenv('PHP_API_BASE_URL', 'http://localhost:8000'),
+    }
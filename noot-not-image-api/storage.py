@@ -0,0 +1,427 @@
+import abc
+import contextlib
+import hashlib
+import json
+import logging
+import mimetypes
+import os
+import re
+import tempfile
+import time
+from collections import defaultdict
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from render_cache import file_digest
+
+logger = logging.getLogger(__name__)
+
+# "{confession}.{ext}" or "{confession}-{page}.{ext}", optionally resized as "...@{width}w.{ext}";
+# never a path and never hidden
+PAGE_NAME = re.compile(
+    r'^(?P<stem>(?P<confession>[^./\\][^/\\]*?)(?:-(?P<page>\d+))?)(?:@(?P<width>\d+)w)?\.(?P<extension>[A-Za-z0-9]+)$'
+)
+IMAGE_EXTENSIONS = ('png', 'jpg', 'jpeg', 'webp', 'avif', 'gif')
+
+# Lists the current pages of a confession, next to the pages themselves
+MANIFEST_SUFFIX = '.pages.json'
+TEMP_PREFIX = '.tmp-'
+
+
+class StoredFile(NamedTuple):
+    filename: str
+    location: str  # relative to the storage root, e.g. "3f/a2/123-1.png" or a legacy "123-1.png"
+    size: int
+    mtime: float
+
+
+def confession_of(filename: str) -> Optional[str]:
+    """The confession a page, variant or manifest filename belongs to"""
+    if filename.endswith(MANIFEST_SUFFIX):
+        return filename[:-len(MANIFEST_SUFFIX)] or None
+    match = PAGE_NAME.match(filename)
+    return match.group('confession') if match else None
+
+
+def page_stem(filename: str) -> str:
+    """The page a file belongs to, e.g. "123-2" for 123-2.png, 123-2.webp and 123-2@480w.png"""
+    match = PAGE_NAME.match(filename)
+    return match.group('stem') if match else os.path.splitext(filename)[0]
+
+
+def size_variant(filename: str) -> Optional[Tuple[str, int]]:
+    """(original filename, width) for a resized variant such as 123-2@480w.png"""
+    match = PAGE_NAME.match(filename)
+    if match is None or match.group('width') is None:
+        return None
+    return f"{match.group('stem')}.{match.group('extension')}", int(match.group('width'))
+
+
+def is_image_name(filename: str) -> bool:
+    match = PAGE_NAME.match(filename)
+    return match is not None and match.group('extension').lower() in IMAGE_EXTENSIONS
+
+
+def is_confession_id(confession_id: Any) -> bool:
+    """Whether pages named after confession_id map back to it (no paths, dots or page-like suffixes)"""
+    return confession_of(f"{confession_id}.png") == str(confession_id)
+
+
+def shard_location(filename: str) -> str:
+    """Two levels of 256 directories, chosen by the confession so all its files share one"""
+    confession = confession_of(filename)
+    if confession is None:
+        raise ValueError(f"{filename!r} is not a page, variant or manifest name")
+    digest = hashlib.sha1(confession.encode('utf-8')).hexdigest()
+    return f"{digest[:2]}/{digest[2:4]}/{filename}"
+
+
+class ImageStorage(abc.ABC):
+    """Where generated pages live.
+
+    Files are addressed by their public filename and spread over hash shards.
+    Each render records the confession's current pages in a manifest, and
+    everything else stored for that confession (old pages, variants) can then
+    be pruned or garbage collected.
+    """
+
+    @abc.abstractmethod
+    def write(self, filename: str, data: bytes):
+        ...
+
+    @abc.abstractmethod
+    def find(self, filename: str) -> Optional[StoredFile]:
+        ...
+
+    @abc.abstractmethod
+    def read(self, filename: str) -> Optional[bytes]:
+        ...
+
+    @abc.abstractmethod
+    def digest(self, filename: str) -> Optional[str]:
+        ...
+
+    @abc.abstractmethod
+    def delete(self, stored: StoredFile):
+        ...
+
+    @abc.abstractmethod
+    def list_confession(self, confession: str) -> List[StoredFile]:
+        ...
+
+    @abc.abstractmethod
+    def iter_files(self) -> Iterator[StoredFile]:
+        ...
+
+    def local_path(self, filename: str) -> Optional[str]:
+        """Filesystem path of a stored file, if the backend has one"""
+        return None
+
+    def relative_path(self, filename: str) -> Optional[str]:
+        """Location of a stored file below the storage root, if the backend has one"""
+        return None
+
+    def pages(self, confession: Any) -> Optional[List[str]]:
+        """Filenames of the confession's current pages, from its manifest"""
+        data = self.read(f"{confession}{MANIFEST_SUFFIX}")
+        if data is None:
+            return None
+        try:
+            return json.loads(data)['pages']
+        except (ValueError, KeyError):
+            return None
+
+    def set_pages(self, confession: Any, filenames: List[str]) -> int:
+        """Record the current pages of a confession and delete its leftovers; returns files removed"""
+        confession = str(confession)
+        self.write(f"{confession}{MANIFEST_SUFFIX}",
+                   json.dumps({'pages': filenames, 'updated_at': time.time()}).encode('utf-8'))
+        return self.prune(confession, filenames)
+
+    def prune(self, confession: str, keep: List[str]) -> int:
+        """Delete files of a confession that are neither a kept page nor a format or size variant of one"""
+        kept_stems = {page_stem(filename) for filename in keep}
+        removed = 0
+        for stored in self.list_confession(confession):
+            if stored.filename.endswith(MANIFEST_SUFFIX) or page_stem(stored.filename) in kept_stems:
+                continue
+            self.delete(stored)
+            removed += 1
+        return removed
+
+    def collect_garbage(self, max_bytes: int = 0, grace_seconds: float = 300,
+                        dry_run: bool = False) -> Dict[str, Any]:
+        """Remove stale pages and abandoned temporary files, then evict variants beyond max_bytes.
+
+        Files younger than grace_seconds are left alone so in-progress renders are
+        not mistaken for garbage. Pages listed in a manifest are never evicted: they
+        are referenced by the PHP API and cannot be regenerated from here.
+        """
+        cutoff = time.time() - grace_seconds
+        by_confession = defaultdict(list)
+        stats = {'files': 0, 'bytes': 0, 'stale_removed': 0, 'temp_removed': 0, 'variants_evicted': 0,
+                 'bytes_freed': 0, 'over_budget': False, 'dry_run': dry_run}
+
+        def remove(stored: StoredFile, counter: str):
+            if not dry_run:
+                self.delete(stored)
+            stats[counter] += 1
+            stats['bytes_freed'] += stored.size
+
+        for stored in self.iter_files():
+            if stored.filename.startswith(TEMP_PREFIX):
+                if stored.mtime < cutoff:
+                    remove(stored, 'temp_removed')
+                continue
+            confession = confession_of(stored.filename)
+            if confession is not None:
+                by_confession[confession].append(stored)
+
+        variants = []
+        live = []
+        for confession, files in by_confession.items():
+            manifest = next((f for f in files if f.filename.endswith(MANIFEST_SUFFIX)), None)
+            pages = self.pages(confession) if manifest is not None else None
+            if pages is None:
+                # Not rendered since storage was sharded: nothing is known to be stale
+                live.extend(files)
+                continue
+
+            kept_stems = {page_stem(page) for page in pages}
+            locations = {stored.location for stored in files}
+            for stored in files:
+                kept = page_stem(stored.filename) in kept_stems
+                sharded = stored.location == shard_location(stored.filename)
+                if stored is manifest or kept and sharded:
+                    live.append(stored)
+                    if stored is not manifest and stored.filename not in pages:
+                        variants.append(stored)
+                elif kept and shard_location(stored.filename) not in locations:
+                    # A legacy flat file that is still the only copy
+                    live.append(stored)
+                elif stored.mtime < cutoff:
+                    # An old page, or a legacy flat copy shadowed by the sharded one
+                    remove(stored, 'stale_removed')
+                else:
+                    live.append(stored)
+
+        total = sum(stored.size for stored in live)
+        if max_bytes and total > max_bytes:
+            # Format and size variants are re-created on demand, so they go first, oldest first
+            for stored in sorted(variants, key=lambda f: f.mtime):
+                if total <= max_bytes:
+                    break
+                if stored.mtime >= cutoff:
+                    continue
+                remove(stored, 'variants_evicted')
+                total -= stored.size
+            stats['over_budget'] = total > max_bytes
+            if stats['over_budget']:
+                logger.error(f"Stored images use {total} bytes, over the {max_bytes} byte budget, "
+                             f"and only current pages are left")
+
+        stats['files'] = len(live) - stats['variants_evicted']
+        stats['bytes'] = total
+        return stats
+
+
+class LocalStorage(ImageStorage):
+    """Hash-sharded directory tree; files written before sharding are still found at the root"""
+
+    def __init__(self, root: str):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, location: str) -> str:
+        return os.path.join(self.root, *location.split('/'))
+
+    def write(self, filename: str, data: bytes):
+        """Write data atomically: readers see the old file or the new one, never a partial one"""
+        path = self._path(shard_location(filename))
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=TEMP_PREFIX)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            # mkstemp creates files only the owner can read; nginx serves them too
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, path)
+        except BaseException:
+            with contextlib.suppress(OSError):
+                os.remove(tmp_path)
+            raise
+
+    def find(self, filename: str) -> Optional[StoredFile]:
+        if confession_of(filename) is None:
+            return None
+        for location in (shard_location(filename), filename):
+            try:
+                stat = os.stat(self._path(location))
+            except OSError:
+                continue
+            return StoredFile(filename, location, stat.st_size, stat.st_mtime)
+        return None
+
+    def read(self, filename: str) -> Optional[bytes]:
+        path = self.local_path(filename)
+        if path is None:
+            return None
+        try:
+            with open(path, 'rb') as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def digest(self, filename: str) -> Optional[str]:
+        path = self.local_path(filename)
+        return file_digest(path) if path is not None else None
+
+    def delete(self, stored: StoredFile):
+        with contextlib.suppress(OSError):
+            os.remove(self._path(stored.location))
+
+    def list_confession(self, confession: str) -> List[StoredFile]:
+        shard_dir = os.path.dirname(self._path(shard_location(f"{confession}{MANIFEST_SUFFIX}")))
+        return [stored for stored in self._scan(shard_dir) if confession_of(stored.filename) == confession]
+
+    def iter_files(self) -> Iterator[StoredFile]:
+        # Legacy flat files at the root, then the two shard levels
+        yield from self._scan(self.root)
+        for first in self._subdirs(self.root):
+            for second in self._subdirs(os.path.join(self.root, first)):
+                yield from self._scan(os.path.join(self.root, first, second))
+
+    def local_path(self, filename: str) -> Optional[str]:
+        stored = self.find(filename)
+        return self._path(stored.location) if stored is not None else None
+
+    def relative_path(self, filename: str) -> Optional[str]:
+        stored = self.find(filename)
+        return stored.location if stored is not None else None
+
+    def _scan(self, directory: str) -> Iterator[StoredFile]:
+        try:
+            entries = list(os.scandir(directory))
+        except OSError:
+            return
+        prefix = os.path.relpath(directory, self.root).replace(os.sep, '/')
+        for entry in entries:
+            try:
+                if not entry.is_file():
+                    continue
+                stat = entry.stat()
+            except OSError:
+                continue
+            location = entry.name if prefix == '.' else f"{prefix}/{entry.name}"
+            yield StoredFile(entry.name, location, stat.st_size, stat.st_mtime)
+
+    def _subdirs(self, directory: str) -> List[str]:
+        try:
+            return sorted(entry.name for entry in os.scandir(directory)
+                          if len(entry.name) == 2 and entry.is_dir())
+        except OSError:
+            return []
+
+
+class S3Storage(ImageStorage):
+    """S3-compatible object storage using the same sharded keys below an optional prefix.
+
+    client is a boto3 S3 client or anything with the same put/get/head/delete
+    and list_objects_v2 calls.
+    """
+
+    def __init__(self, bucket: str, client: Any, prefix: str = ''):
+        self.bucket = bucket
+        self.client = client
+        self.prefix = prefix.strip('/') + '/' if prefix.strip('/') else ''
+
+    def _key(self, location: str) -> str:
+        return self.prefix + location
+
+    def write(self, filename: str, data: bytes):
+        # A PUT replaces the object atomically
+        self.client.put_object(
+            Bucket=self.bucket,
+            Key=self._key(shard_location(filename)),
+            Body=data,
+            ContentType=mimetypes.guess_type(filename)[0] or 'application/octet-stream',
+            Metadata={'sha256': hashlib.sha256(data).hexdigest()},
+        )
+
+    def _head(self, filename: str) -> Optional[Dict[str, Any]]:
+        if confession_of(filename) is None:
+            return None
+        try:
+            return self.client.head_object(Bucket=self.bucket, Key=self._key(shard_location(filename)))
+        except Exception as e:
+            if _is_missing(e):
+                return None
+            raise
+
+    def find(self, filename: str) -> Optional[StoredFile]:
+        head = self._head(filename)
+        if head is None:
+            return None
+        return StoredFile(filename, shard_location(filename), head['ContentLength'], head['LastModified'].timestamp())
+
+    def read(self, filename: str) -> Optional[bytes]:
+        if confession_of(filename) is None:
+            return None
+        try:
+            response = self.client.get_object(Bucket=self.bucket, Key=self._key(shard_location(filename)))
+        except Exception as e:
+            if _is_missing(e):
+                return None
+            raise
+        return response['Body'].read()
+
+    def digest(self, filename: str) -> Optional[str]:
+        head = self._head(filename)
+        if head is None:
+            return None
+        return head.get('Metadata', {}).get('sha256') or head['ETag'].strip('"')
+
+    def delete(self, stored: StoredFile):
+        self.client.delete_object(Bucket=self.bucket, Key=self._key(stored.location))
+
+    def list_confession(self, confession: str) -> List[StoredFile]:
+        shard = shard_location(f"{confession}{MANIFEST_SUFFIX}").rsplit('/', 1)[0]
+        return [stored for stored in self._list(f"{shard}/{confession}") if confession_of(stored.filename) == confession]
+
+    def iter_files(self) -> Iterator[StoredFile]:
+        return self._list('')
+
+    def _list(self, location_prefix: str) -> Iterator[StoredFile]:
+        params = {'Bucket': self.bucket, 'Prefix': self._key(location_prefix)}
+        while True:
+            response = self.client.list_objects_v2(**params)
+            for item in response.get('Contents', []):
+                location = item['Key'][len(self.prefix):]
+                yield StoredFile(location.rsplit('/', 1)[-1], location, item['Size'], item['LastModified'].timestamp())
+            if not response.get('IsTruncated'):
+                return
+            params['ContinuationToken'] = response['NextContinuationToken']
+
+
+def _is_missing(error: Exception) -> bool:
+    code = getattr(error, 'response', {}).get('Error', {}).get('Code')
+    return code in ('404', 'NoSuchKey', 'NotFound')
+
+
+def create_storage(config: Dict[str, Any]) -> ImageStorage:
+    """Storage backend selected by STORAGE_BACKEND"""
+    backend = config.get('STORAGE_BACKEND', 'local')
+
+    if backend == 'local':
+        return LocalStorage(config.get('IMAGES_DIR', './assets/images'))
+
+    if backend == 's3':
+        try:
+            import boto3
+        except ImportError:
+            raise RuntimeError('STORAGE_BACKEND=s3 requires boto3 (pip install boto3)')
+        client = boto3.client('s3', endpoint_url=config.get('S3_ENDPOINT_URL') or None)
+        return S3Storage(config['S3_BUCKET'], client, config.get('S3_PREFIX', ''))
+
+    raise ValueError(f"Unknown STORAGE_BACKEND '{backend}'. Available: local, s3")
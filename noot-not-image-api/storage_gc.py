@@ -0,0 +1,44 @@
+"""Garbage collect stored confession images.
+
+Deletes pages no longer listed in their confession's manifest (e.g. after a
+confession shrank from 3 pages to 1), legacy flat copies of re-rendered
+confessions and abandoned temporary files, then evicts transcoded variants,
+oldest first, until the storage fits IMAGES_MAX_BYTES. Meant to run
+periodically, e.g. from cron:
+
+    python storage_gc.py --max-bytes 20000000000
+"""
+import argparse
+import json
+import logging
+import sys
+
+from settings import load_config
+from storage import create_storage
+
+logger = logging.getLogger('storage_gc')
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Remove stale generated images and enforce the disk budget')
+    parser.add_argument('--max-bytes', type=int, help='Storage budget, overriding IMAGES_MAX_BYTES (0 = unlimited)')
+    parser.add_argument('--grace-seconds', type=float, default=300,
+                        help='Leave files younger than this alone (default: %(default)s)')
+    parser.add_argument('--dry-run', action='store_true', help='Report what would be removed without deleting')
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    args = parse_args(argv)
+
+    config = load_config()
+    max_bytes = config['IMAGES_MAX_BYTES'] if args.max_bytes is None else args.max_bytes
+
+    stats = create_storage(config).collect_garbage(max_bytes, args.grace_seconds, args.dry_run)
+    print(json.dumps(stats))
+    return 1 if stats['over_budget'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,70 @@
+import io
+import time
+import uuid
+import zipfile
+from typing import Any, Dict, Iterable, Iterator
+from urllib.parse import quote
+
+from werkzeug.utils import secure_filename
+
+
+class _ChunkWriter(io.RawIOBase):
+    """Unseekable sink that hands out whatever zipfile has written so far"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def zip_stream(pages: Iterable[Dict[str, Any]]) -> Iterator[bytes]:
+    """Stream rendered pages as a ZIP archive, emitting each page as soon as it arrives"""
+    sink = _ChunkWriter()
+
+    # Pages are already compressed images, so they are stored as-is
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_STORED) as archive:
+        for page in pages:
+            entry = zipfile.ZipInfo(page['filename'], date_time=time.localtime()[:6])
+            archive.writestr(entry, page['data'])
+            yield sink.drain()
+
+    yield sink.drain()
+
+
+def attachment_disposition(filename: str, page_number: int) -> str:
+    """Content-Disposition of a part: an ASCII-safe filename, plus the original as RFC 5987 filename*"""
+    fallback = secure_filename(filename) or f"page-{page_number}"
+    if fallback == filename:
+        return f'attachment; filename="{filename}"'
+    return f"attachment; filename=\"{fallback}\"; filename*=UTF-8''{quote(filename, safe='')}"
+
+
+def multipart_boundary() -> str:
+    return f"noot-not-{uuid.uuid4().hex}"
+
+
+def multipart_stream(pages: Iterable[Dict[str, Any]], boundary: str) -> Iterator[bytes]:
+    """Stream rendered pages as the parts of a multipart/mixed body"""
+    for page in pages:
+        headers = (
+            f"--{boundary}\r\n"
+            f"Content-Type: {page['mimetype']}\r\n"
+            f"Content-Length: {len(page['data'])}\r\n"
+            f"Content-Disposition: {attachment_disposition(page['filename'], page['page_number'])}\r\n"
+            f"X-Page-Number: {page['page_number']}/{page['total_pages']}\r\n"
+            f"X-Encode-Ms: {page['encode_ms']}\r\n"
+            "\r\n"
+        )
+        yield headers.encode('ascii') + page['data'] + b"\r\n"
+
+    yield f"--{boundary}--\r\n".encode('ascii')
@@ -0,0 +1,72 @@
+import importlib
+import json
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVICE_DIR)
+
+from image_generator import ImageGeneratorService  # noqa: E402
+
+
+@pytest.fixture
+def service_config(tmp_path):
+    return {
+        'FONTS_DIR': os.path.join(SERVICE_DIR, 'assets', 'fonts'),
+        'BACKGROUND_DIR': os.path.join(SERVICE_DIR, 'assets', 'backgrounds'),
+        'IMAGES_DIR': str(tmp_path / 'images'),
+    }
+
+
+@pytest.fixture
+def service(service_config):
+    return ImageGeneratorService(service_config)
+
+
+@pytest.fixture
+def app_client(service_config, tmp_path, monkeypatch):
+    monkeypatch.setenv('IMAGES_DIR', service_config['IMAGES_DIR'])
+    monkeypatch.setenv('FONTS_DIR', service_config['FONTS_DIR'])
+    monkeypatch.setenv('BACKGROUND_DIR', service_config['BACKGROUND_DIR'])
+    monkeypatch.setenv('JOBS_DB_PATH', str(tmp_path / 'jobs.sqlite3'))
+    monkeypatch.setenv('OUTBOX_DB_PATH', str(tmp_path / 'outbox.sqlite3'))
+    monkeypatch.setenv('RENDER_CACHE_MAX_BYTES', '0')
+    sys.modules.pop('app', None)
+    app_module = importlib.import_module('app')
+    yield app_module.app.test_client(), app_module
+    app_module.job_queue.stop()
+    app_module.callback_outbox.stop()
+    sys.modules.pop('app', None)
+
+
+@pytest.fixture
+def php_stub():
+    """Local stand-in for the PHP API; append status codes to `responses` to script failures"""
+    received = []
+    responses = []
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+            received.append((self.path, body))
+            status = responses.pop(0) if responses else 200
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', '2')
+            self.end_headers()
+            self.wfile.write(b'{}')
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{server.server_port}', received, responses
+    server.shutdown()
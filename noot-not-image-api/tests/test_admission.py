@@ -0,0 +1,64 @@
+import threading
+import time
+
+import pytest
+
+from admission import AdmissionController, Overloaded
+
+
+def test_full_queue_is_rejected_with_retry_after():
+    controller = AdmissionController(concurrency=1, queue_size=0)
+    with controller.admit('live'):
+        with pytest.raises(Overloaded) as rejected:
+            controller.acquire('live')
+
+    assert rejected.value.retry_after >= 1
+    assert controller.stats()['rejected']['live'] == 1
+    controller.acquire('live').release()
+
+
+def test_waiting_live_requests_go_before_backfill():
+    controller = AdmissionController(concurrency=1, queue_size=4, backfill_concurrency=1, queue_timeout=5)
+    order = []
+    running = controller.acquire('live')
+
+    def wait_for(lane):
+        with controller.admit(lane):
+            order.append(lane)
+
+    backfill = threading.Thread(target=wait_for, args=('backfill',))
+    backfill.start()
+    while controller.stats()['waiting']['backfill'] == 0:
+        time.sleep(0.01)
+    live = threading.Thread(target=wait_for, args=('live',))
+    live.start()
+    while controller.stats()['waiting']['live'] == 0:
+        time.sleep(0.01)
+
+    running.release()
+    live.join(5)
+    backfill.join(5)
+    assert order == ['live', 'backfill']
+
+
+def test_backfill_never_takes_every_slot():
+    controller = AdmissionController(concurrency=2, queue_size=4, backfill_concurrency=1,
+                                     backfill_queue_size=4, queue_timeout=0.05)
+    with controller.admit('backfill'):
+        with pytest.raises(Overloaded):
+            controller.acquire('backfill')
+        controller.acquire('live').release()
+
+
+def test_render_endpoints_shed_load_and_cap_content(app_client):
+    client, app_module = app_client
+    app_module.config['MAX_PAGES'] = 1
+
+    too_long = client.post('/generate-images', json={'confession_id': 1, 'content': 'palabra ' * 500})
+    assert too_long.status_code == 413
+
+    app_module.admission.queue_size['live'] = 0
+    with app_module.admission.admit('live'), app_module.admission.admit('live'):
+        response = client.post('/generate-images', json={'confession_id': 2, 'content': 'hola'})
+    assert response.status_code == 429
+    assert int(response.headers['Retry-After']) >= 1
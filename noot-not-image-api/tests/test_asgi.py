@@ -0,0 +1,102 @@
+import asyncio
+import importlib
+import sys
+import time
+
+import pytest
+
+pytest.importorskip('quart')
+pytest.importorskip('httpx')
+
+
+@pytest.fixture
+def asgi_module(service_config, tmp_path, monkeypatch, php_stub):
+    base_url, _, _ = php_stub
+    monkeypatch.setenv('IMAGES_DIR', service_config['IMAGES_DIR'])
+    monkeypatch.setenv('FONTS_DIR', service_config['FONTS_DIR'])
+    monkeypatch.setenv('BACKGROUND_DIR', service_config['BACKGROUND_DIR'])
+    monkeypatch.setenv('JOBS_DB_PATH', str(tmp_path / 'jobs.sqlite3'))
+    monkeypatch.setenv('OUTBOX_DB_PATH', str(tmp_path / 'outbox.sqlite3'))
+    monkeypatch.setenv('RENDER_CACHE_MAX_BYTES', '0')
+    monkeypatch.setenv('PHP_API_BASE_URL', base_url)
+    monkeypatch.setenv('START_BACKGROUND_WORKERS', 'False')
+    for name in ('app', 'asgi_app'):
+        sys.modules.pop(name, None)
+    yield importlib.import_module('asgi_app')
+    for name in ('app', 'asgi_app'):
+        sys.modules.pop(name, None)
+
+
+def serve(asgi_module, scenario):
+    async def run():
+        async with asgi_module.app.test_app() as test_app:
+            await scenario(test_app.test_client())
+    asyncio.run(run())
+
+
+def test_renders_and_serves_images(asgi_module):
+    async def scenario(client):
+        assert (await client.get('/ready')).status_code == 200
+
+        response = await client.post('/generate-images', json={'confession_id': 51, 'content': 'hola asíncrono'})
+        assert response.status_code == 200
+        url = (await response.get_json())['image_urls'][0]
+
+        image = await client.get(url)
+        assert image.status_code == 200
+        assert (await image.get_data())[:8] == b'\x89PNG\r\n\x1a\n'
+        assert 'immutable' in image.headers['Cache-Control']
+        not_modified = await client.get(url, headers={'If-None-Match': image.headers['ETag']})
+        assert not_modified.status_code == 304
+
+        ranged = await client.get(url, headers={'Range': 'bytes=0-7'})
+        assert ranged.status_code == 206
+        assert (await client.get('/images/nope.png')).status_code == 404
+
+    serve(asgi_module, scenario)
+
+
+def test_streams_pages_as_zip(asgi_module):
+    async def scenario(client):
+        response = await client.post('/generate-images', json={'confession_id': 52, 'content': 'hola', 'mode': 'zip'})
+        assert response.status_code == 200
+        assert (await response.get_data())[:2] == b'PK'
+        assert asgi_module.admission.stats()['running'] == {'live': 0, 'backfill': 0}
+
+    serve(asgi_module, scenario)
+
+
+def test_stream_slot_is_released_when_the_body_never_starts(asgi_module):
+    admission = asgi_module.admission
+
+    async def scenario():
+        # Closed before the first chunk, as when the client disconnects while headers are sent
+        body = asgi_module.TicketBody(iter([b'page']), admission.acquire('live'))
+        await body.aclose()
+        assert admission.stats()['running']['live'] == 0
+
+        # Dropped without being iterated or closed at all
+        asgi_module.TicketBody(iter([b'page']), admission.acquire('live'))
+        assert admission.stats()['running']['live'] == 0
+
+    asyncio.run(scenario())
+
+
+def test_webhook_renders_in_background_and_calls_back(asgi_module, php_stub):
+    _, received, _ = php_stub
+
+    async def scenario(client):
+        response = await client.post('/webhook/confession-created', json={'confession_id': 53, 'content': 'hola'})
+        assert response.status_code == 202
+        status_url = (await response.get_json())['status_url']
+
+        deadline = time.monotonic() + 30
+        while not received and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+        assert (await (await client.get(status_url)).get_json())['status'] == 'done'
+
+    serve(asgi_module, scenario)
+
+    path, body = received[0]
+    assert path == '/api/confessions/53/update-images'
+    assert body['image_urls'][0].startswith('/images/53.png')
@@ -0,0 +1,73 @@
+import json
+
+import backfill
+
+
+def test_batch_endpoint_streams_progress_per_item(app_client):
+    client, _ = app_client
+    response = client.post('/generate-images/batch', json={'items': [
+        {'confession_id': 41, 'content': 'primera'},
+        {'confession_id': 42},
+        {'confession_id': 43, 'content': 'tercera', 'format': 'jpeg'},
+    ]})
+
+    assert response.mimetype == 'application/x-ndjson'
+    lines = [json.loads(line) for line in response.data.decode().splitlines()]
+    assert [line.get('status') for line in lines[:3]] == ['ok', 'error', 'ok']
+    assert lines[2]['image_urls'][0].startswith('/images/43.jpg')
+    assert lines[3] == {'done': True, 'total': 3, 'succeeded': 2, 'failed': 1}
+
+
+def test_batch_endpoint_validates_input(app_client):
+    client, _ = app_client
+    assert client.post('/generate-images/batch', json={'items': 'nope'}).status_code == 400
+    assert client.post('/generate-images/batch', json={'items': [], 'format': 'bmp'}).status_code == 400
+    assert client.post('/generate-images/batch', json=[1, 2]).status_code == 400
+    assert client.post('/generate-images', json=[1, 2]).status_code == 400
+
+
+def test_backfill_renders_posts_and_resumes(service_config, tmp_path, monkeypatch, php_stub):
+    base_url, received, _ = php_stub
+    for key, value in service_config.items():
+        monkeypatch.setenv(key, value)
+    monkeypatch.setenv('RENDER_CACHE_MAX_BYTES', '0')
+
+    source = tmp_path / 'confessions.jsonl'
+    source.write_text('\n'.join(json.dumps(item) for item in [
+        {'confession_id': 51, 'content': 'uno'},
+        {'confession_id': 52, 'content': 'dos'},
+        {'confession_id': 53, 'content': 'tres'},
+    ]) + '\n')
+    state = tmp_path / 'state.jsonl'
+    state.write_text(json.dumps({'confession_id': 52, 'image_urls': []}) + '\n')
+
+    args = [str(source), '--state', str(state), '--workers', '1', '--php-url', base_url]
+    assert backfill.main(args) == 0
+
+    assert sorted(path for path, _ in received) == ['/api/confessions/51/update-images',
+                                                    '/api/confessions/53/update-images']
+    assert backfill.load_completed(str(state)) == {'51', '52', '53'}
+
+    # Nothing left to do on a second run
+    assert backfill.main(args) == 0
+    assert len(received) == 2
+
+
+def test_backfill_skips_lines_that_are_not_items(tmp_path):
+    source = tmp_path / 'confessions.jsonl'
+    source.write_text('[1, 2]\n"x"\nnot json\n\n{"confession_id": 7}\n{"confession_id": 8, "content": "hola"}\n',
+                      encoding='utf-8')
+
+    assert list(backfill.read_items(str(source))) == [{'confession_id': 8, 'content': 'hola'}]
+
+
+def test_backfill_does_not_wait_after_the_last_attempt(php_stub, monkeypatch):
+    base_url, _, responses = php_stub
+    responses.extend([503, 503])
+    sleeps = []
+    monkeypatch.setattr(backfill.time, 'sleep', sleeps.append)
+
+    error = backfill.post_images(backfill.requests.Session(), base_url, 9, [], attempts=2)
+
+    assert error == 'PHP API answered 503'
+    assert sleeps == [1]
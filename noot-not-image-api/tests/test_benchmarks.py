@@ -0,0 +1,27 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks'))
+
+import bench_render  # noqa: E402
+
+
+def results(**medians):
+    return {'results': {'short': {stage: {'median_ms': ms} for stage, ms in medians.items()}}}
+
+
+def test_compare_flags_only_stages_beyond_the_threshold():
+    baseline = results(wrap_text=10.0, encode_png=100.0, create_gradient_background=0.1)
+    current = results(wrap_text=10.5, encode_png=130.0, create_gradient_background=0.3)
+
+    regressions = bench_render.compare(baseline, current, threshold=15, min_delta_ms=0.5)
+
+    assert len(regressions) == 1
+    assert regressions[0].startswith('short/encode_png')
+
+
+def test_run_times_every_requested_stage():
+    report = bench_render.run(['short'], ['wrap_text', 'encode_png'], repeat=1, warmup=0)
+
+    assert set(report['results']['short']) == {'wrap_text', 'encode_png'}
+    assert report['results']['short']['encode_png']['median_ms'] > 0
@@ -0,0 +1,94 @@
+import time
+
+import pytest
+
+from callback_outbox import CallbackOutbox
+
+
+@pytest.fixture
+def outbox(tmp_path, php_stub):
+    base_url, _, _ = php_stub
+    return CallbackOutbox(str(tmp_path / 'outbox.sqlite3'), base_url, max_attempts=3, base_delay=0.01,
+                          timeout=2)
+
+
+def test_updates_are_delivered_and_removed(outbox, php_stub):
+    _, received, _ = php_stub
+    outbox.enqueue(61, ['/images/61.png'])
+
+    assert outbox.dispatch_due() == 1
+    assert received == [('/api/confessions/61/update-images',
+                         {'confession_id': '61', 'image_urls': ['/images/61.png']})]
+    assert outbox.stats()['depth'] == 0
+
+
+def test_failed_deliveries_are_retried_with_backoff(outbox, php_stub):
+    _, received, responses = php_stub
+    responses.extend([503, 502])
+    outbox.enqueue(62, ['/images/62.png'])
+
+    outbox.dispatch_due()
+    assert outbox.stats()['depth'] == 1
+
+    deadline = time.time() + 2
+    while outbox.stats()['depth'] and time.time() < deadline:
+        outbox.dispatch_due()
+        time.sleep(0.01)
+
+    assert len(received) == 3
+    assert outbox.stats() == {'depth': 0, 'oldest_age_seconds': 0.0, 'dead': 0}
+
+
+def test_pending_updates_for_a_confession_are_coalesced(outbox, php_stub):
+    _, received, _ = php_stub
+    outbox.enqueue(63, ['/images/63.png'])
+    outbox.enqueue(63, ['/images/63-1.png', '/images/63-2.png'])
+
+    assert outbox.stats()['depth'] == 1
+    outbox.dispatch_due()
+    assert [body['image_urls'] for _, body in received] == [['/images/63-1.png', '/images/63-2.png']]
+
+
+def test_rejected_updates_are_not_retried(outbox, php_stub):
+    _, received, responses = php_stub
+    responses.append(404)
+    outbox.enqueue(64, ['/images/64.png'])
+
+    outbox.dispatch_due()
+    time.sleep(0.05)
+    outbox.dispatch_due()
+
+    assert len(received) == 1
+    assert outbox.stats()['dead'] == 1
+
+
+def test_updates_survive_a_restart(tmp_path, php_stub):
+    base_url, received, _ = php_stub
+    db_path = str(tmp_path / 'outbox.sqlite3')
+    CallbackOutbox(db_path, 'http://127.0.0.1:9').enqueue(65, ['/images/65.png'])
+
+    restarted = CallbackOutbox(db_path, base_url)
+    assert restarted.stats()['depth'] == 1
+    restarted.dispatch_due()
+    assert len(received) == 1
+
+
+def test_backoff_grows_exponentially_with_jitter(outbox):
+    outbox.base_delay = 1.0
+    for attempts in range(1, 6):
+        delay = outbox.backoff(attempts)
+        assert 2 ** (attempts - 2) <= delay <= 2 ** (attempts - 1)
+
+
+def test_requeued_dead_updates_start_a_new_backlog(outbox, php_stub):
+    _, _, responses = php_stub
+    responses.append(404)
+    outbox.enqueue(66, ['/images/66.png'])
+    outbox.dispatch_due()
+
+    conn = outbox._connect()
+    conn.execute("UPDATE callbacks SET created_at = created_at - 3600")
+    conn.close()
+    outbox.enqueue(66, ['/images/66-1.png'])
+
+    assert outbox.stats()['oldest_age_seconds'] < 60
@@ -0,0 +1,42 @@
+import io
+
+import pytest
+from PIL import Image
+
+from encoders import ENCODERS, encode_image, negotiate_format, resolve_format
+
+
+@pytest.mark.parametrize('image_format', sorted(ENCODERS))
+def test_every_encoder_produces_a_readable_image(service, image_format):
+    page = service.render_page(['hola 😊'], 1, 1, 1)
+    encoded = encode_image(page, image_format)
+
+    with Image.open(io.BytesIO(encoded.data)) as decoded:
+        assert decoded.size == page.size
+    assert encoded.encode_ms >= 0
+
+
+def test_format_is_selected_per_request(service):
+    result = service.render_confession(11, 'una confesión', 'webp' if 'webp' in ENCODERS else 'jpeg')
+
+    assert result['image_urls'][0].endswith('.' + ENCODERS[result['pages'][0]['format']].extension)
+    assert result['pages'][0]['bytes'] > 0
+
+
+def test_resolve_format_rejects_unknown_formats():
+    assert resolve_format('JPG') == 'jpeg'
+    assert resolve_format(None, 'png8') == 'png8'
+    with pytest.raises(ValueError):
+        resolve_format('bmp')
+
+
+def test_negotiate_format_follows_the_accept_header():
+    preferred = [name for name in ('avif', 'webp') if name in ENCODERS]
+    if not preferred:
+        pytest.skip('Pillow was built without WebP and AVIF support')
+    browser = 'image/avif,image/webp,image/apng,image/*,*/*;q=0.8'
+
+    assert negotiate_format(browser, preferred) == preferred[0]
+    assert negotiate_format('image/png', preferred) is None
+    assert negotiate_format(f'{ENCODERS[preferred[0]].mimetype};q=0', preferred[:1]) is None
+    assert negotiate_format(None, preferred) is None
@@ -0,0 +1,67 @@
+import pytest
+
+from encoders import ENCODERS
+from storage import shard_location
+
+
+def generate(client, confession_id=31):
+    response = client.post('/generate-images', json={'confession_id': confession_id, 'content': 'hola'})
+    return response.json['image_urls'][0]
+
+
+def test_versioned_urls_are_immutable_and_revalidate_with_etag(app_client):
+    client, _ = app_client
+    url = generate(client)
+    assert '?v=' in url
+
+    response = client.get(url)
+    assert response.status_code == 200
+    assert 'immutable' in response.headers['Cache-Control']
+    etag = response.headers['ETag']
+
+    unversioned = client.get(url.split('?')[0])
+    assert 'immutable' not in unversioned.headers['Cache-Control']
+
+    not_modified = client.get(url, headers={'If-None-Match': etag})
+    assert not_modified.status_code == 304
+
+
+def test_range_requests_are_supported(app_client):
+    client, _ = app_client
+    response = client.get(generate(client), headers={'Range': 'bytes=0-7'})
+
+    assert response.status_code == 206
+    assert response.data == b'\x89PNG\r\n\x1a\n'
+
+
+def test_accel_redirect_mode_hands_the_file_to_nginx(app_client):
+    client, app_module = app_client
+    url = generate(client)
+    app_module.config['IMAGES_ACCEL_REDIRECT_PREFIX'] = '/internal-images/'
+
+    response = client.get(url)
+    assert response.headers['X-Accel-Redirect'] == '/internal-images/' + shard_location('31.png')
+    assert response.data == b''
+    assert client.get(url, headers={'If-None-Match': response.headers['ETag']}).status_code == 304
+
+
+def test_missing_images_return_404(app_client):
+    client, _ = app_client
+    assert client.get('/images/nope.png').status_code == 404
+    assert client.get('/images/..%2Fapp.py').status_code == 404
+
+
+def test_negotiated_formats_of_versioned_urls_are_immutable(app_client):
+    if 'webp' not in ENCODERS:
+        pytest.skip('Pillow was built without WebP support')
+    client, app_module = app_client
+    app_module.config['NEGOTIATE_IMAGE_FORMATS'] = ['webp']
+    url = generate(client, 33)
+
+    response = client.get(url, headers={'Accept': 'image/webp,*/*'})
+    assert response.mimetype == 'image/webp'
+    assert 'immutable' in response.headers['Cache-Control']
+    assert 'Accept' in response.headers['Vary']
+
+    stale = client.get(url.split('?')[0] + '?v=00000000', headers={'Accept': 'image/webp,*/*'})
+    assert 'immutable' not in stale.headers['Cache-Control']
@@ -0,0 +1,101 @@
+import time
+
+from job_queue import JobQueue
+
+
+def wait_for_status(queue, job_id, statuses, timeout=5.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = queue.get(job_id)
+        if job['status'] in statuses:
+            return job
+        time.sleep(0.02)
+    raise AssertionError(f'job {job_id} still {job["status"]}')
+
+
+def test_jobs_run_in_background_and_report_results(tmp_path):
+    queue = JobQueue(str(tmp_path / 'jobs.sqlite3'), lambda payload: {'echo': payload['value']},
+                     workers=2, poll_interval=0.05)
+    queue.start()
+    try:
+        job = queue.enqueue({'value': 42})
+        assert job['status'] in ('queued', 'running', 'done')
+
+        job = wait_for_status(queue, job['job_id'], ('done', 'failed'))
+        assert job['status'] == 'done'
+        assert job['result'] == {'echo': 42}
+    finally:
+        queue.stop()
+
+
+def test_failed_jobs_keep_the_error(tmp_path):
+    def handler(payload):
+        raise RuntimeError('font missing')
+
+    queue = JobQueue(str(tmp_path / 'jobs.sqlite3'), handler, workers=1, poll_interval=0.05)
+    queue.start()
+    try:
+        job = wait_for_status(queue, queue.enqueue({})['job_id'], ('done', 'failed'))
+        assert job['status'] == 'failed'
+        assert job['error'] == 'font missing'
+    finally:
+        queue.stop()
+
+
+def test_jobs_survive_a_restart(tmp_path):
+    db_path = str(tmp_path / 'jobs.sqlite3')
+    job_id = JobQueue(db_path, lambda payload: {}).enqueue({'value': 1})['job_id']
+
+    # A job left running by a dead process is picked up again once its lease expires
+    crashed = JobQueue(db_path, lambda payload: {}, lease_seconds=0)
+    assert crashed._claim()['id'] == job_id
+
+    restarted = JobQueue(db_path, lambda payload: {'value': payload['value']}, poll_interval=0.05)
+    restarted.start()
+    try:
+        job = wait_for_status(restarted, job_id, ('done',))
+        assert job['result'] == {'value': 1}
+        assert job['attempts'] == 2
+    finally:
+        restarted.stop()
+
+
+def test_jobs_that_keep_killing_their_worker_are_failed(tmp_path):
+    db_path = str(tmp_path / 'jobs.sqlite3')
+    job_id = JobQueue(db_path, lambda payload: {}).enqueue({})['job_id']
+
+    # Each claim is abandoned as if the process died mid-render
+    crashing = JobQueue(db_path, lambda payload: {}, lease_seconds=0, max_attempts=2)
+    assert crashing._claim()['attempt'] == 1
+    time.sleep(0.01)
+    assert crashing._claim()['attempt'] == 2
+    time.sleep(0.01)
+    assert crashing._claim() is None
+
+    job = crashing.get(job_id)
+    assert job['status'] == 'failed'
+    assert job['attempts'] == 2
+    assert job['error'] == 'Gave up after 2 attempts'
+
+
+def test_a_stale_attempt_cannot_overwrite_the_result(tmp_path):
+    queue = JobQueue(str(tmp_path / 'jobs.sqlite3'), lambda payload: {}, lease_seconds=0)
+    job_id = queue.enqueue({})['job_id']
+
+    slow = queue._claim()
+    time.sleep(0.01)
+    fast = queue._claim()
+    assert queue._finish(job_id, fast['attempt'], 'done', result={'run': 'fast'})
+    assert not queue._finish(job_id, slow['attempt'], 'done', result={'run': 'slow'})
+    assert queue.get(job_id)['result'] == {'run': 'fast'}
+
+
+def test_the_lease_is_renewed_while_the_handler_runs(tmp_path):
+    queue = JobQueue(str(tmp_path / 'jobs.sqlite3'), lambda payload: {}, lease_seconds=30)
+    job_id = queue.enqueue({})['job_id']
+    claimed = queue._claim()
+
+    queue.lease_seconds = 3600
+    assert queue._renew(job_id, claimed['attempt'])
+    assert not queue._renew(job_id, claimed['attempt'] + 1)
+    assert queue._claim() is None
@@ -0,0 +1,70 @@
+import json
+
+LONG_CONFESSION = 'una confesión con emojis 😅 que ocupa más de una página ' * 40
+
+
+def test_layout_matches_rendering_without_rasterizing(service):
+    plan = service.layout(LONG_CONFESSION)
+
+    assert plan.pages == service.paginate(LONG_CONFESSION)
+    for lines, widths in zip(plan.pages, plan.widths):
+        assert widths == [service.get_mixed_text_width(line) for line in lines]
+    assert all(width <= plan.max_width for widths in plan.widths for width in widths)
+
+
+def test_render_reuses_the_plan_widths(service, monkeypatch):
+    plan = service.layout(LONG_CONFESSION)
+    expected = service.render_page(plan.pages[0], 1, 1, len(plan.pages))
+
+    def measure(*args):
+        raise AssertionError('line measured again')
+
+    monkeypatch.setattr(service, 'get_mixed_text_width', measure)
+    monkeypatch.setattr(service, 'wrap_lines', measure)
+    urls = service.render_confession(1, LONG_CONFESSION, 'png', plan)['image_urls']
+
+    assert len(urls) == len(plan.pages)
+    assert service.render_page(plan.pages[0], 1, 1, len(plan.pages), plan.widths[0]).tobytes() == expected.tobytes()
+
+
+def test_layout_endpoint(app_client):
+    client, app_module = app_client
+    response = client.post('/layout', json={'content': LONG_CONFESSION})
+
+    assert response.status_code == 200
+    assert response.json['renderable'] is True
+    assert response.json['total_pages'] == len(response.json['pages']) > 1
+    assert response.json['pages'][0]['lines'][0]['width'] > 0
+
+    app_module.config['MAX_PAGES'] = 1
+    assert client.post('/layout', json={'content': LONG_CONFESSION}).json['renderable'] is False
+    assert client.post('/layout', json={}).status_code == 400
+
+
+def test_non_string_content_is_a_bad_request(app_client):
+    client, app_module = app_client
+    assert client.post('/generate-images', json={'confession_id': 1, 'content': ['a']}).status_code == 400
+    assert client.post('/webhook/confession-created', json={'confession_id': 1, 'content': ['a']}).status_code == 400
+    assert client.post('/layout', json={'content': ['a']}).status_code == 400
+
+    app_module.config['MAX_CONTENT_CHARS'] = 3
+    assert client.post('/generate-images', json={'confession_id': 1, 'content': 'hola'}).status_code == 413
+
+
+def test_queued_plans_survive_json_and_expire_with_the_layout(service):
+    plan = service.layout(LONG_CONFESSION)
+    payload = json.loads(json.dumps(service.plan_payload(plan)))
+
+    assert service.plan_from_payload(payload) == plan
+    assert service.plan_from_payload(None) is None
+
+    service.max_lines_per_image += 1
+    assert service.plan_from_payload(payload) is None
+
+
+def test_layout_rejects_bodies_that_are_not_objects(app_client):
+    client, _ = app_client
+    response = client.post('/layout', json=[1, 2])
+
+    assert response.status_code == 400
+    assert response.json['error'] == 'content is required'
@@ -0,0 +1,42 @@
+import threading
+import time
+
+from memory_budget import MemoryBudget
+
+
+def test_pooled_canvases_are_reused_without_changing_the_pages(service):
+    plan = service.layout('una confesión sobre lienzos reutilizados')
+    expected = service.render_page(plan.pages[0], 71, 1, 1, plan.widths[0]).tobytes()
+
+    for _ in range(2):
+        with service.drawn_page(plan.pages[0], 71, 1, 1, plan.widths[0]) as image:
+            assert image.tobytes() == expected
+
+    assert service.canvas_pool.stats()['created'] == 1
+    assert service.canvas_pool.stats()['reused'] == 2
+
+
+def test_renders_wait_for_running_ones_while_over_the_limit():
+    budget = MemoryBudget(limit_bytes=100, max_wait=5, usage=lambda: 200)
+    order = []
+
+    def second():
+        with budget.render():
+            order.append('second')
+
+    with budget.render():
+        waiter = threading.Thread(target=second)
+        waiter.start()
+        time.sleep(0.2)
+        order.append('first done')
+    waiter.join(5)
+
+    assert order == ['first done', 'second']
+    assert budget.stats()['deferred'] == 1
+
+
+def test_a_lone_render_is_never_deferred():
+    budget = MemoryBudget(limit_bytes=100, max_wait=5, usage=lambda: 200)
+    with budget.render():
+        pass
+    assert budget.stats()['deferred'] == 0
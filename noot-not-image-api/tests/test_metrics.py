@@ -0,0 +1,37 @@
+import os
+import subprocess
+import sys
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def sample(text, name):
+    return next(float(line.split()[-1]) for line in text.splitlines() if line.startswith(name))
+
+
+def test_metrics_cover_render_stages_and_errors(app_client):
+    client, _ = app_client
+    client.post('/generate-images', json={'confession_id': 41, 'content': 'hola 😀'})
+    client.post('/generate-images', json={'confession_id': 42})
+
+    text = client.get('/metrics').get_data(as_text=True)
+
+    for stage in ('wrap', 'background', 'text_draw', 'encode', 'disk_write'):
+        assert f'noot_render_stage_seconds_count{{stage="{stage}"}}' in text
+    assert sample(text, 'noot_render_pages_count') >= 1
+    assert 'noot_output_bytes_bucket{format="png"' in text
+    assert sample(text, 'noot_errors_total{endpoint="generate_images",reason="400"}') >= 1
+
+
+def test_multiprocess_samples_are_aggregated(tmp_path):
+    env = {**os.environ, 'PROMETHEUS_MULTIPROC_DIR': str(tmp_path)}
+    record = "import metrics; metrics.RENDER_PAGES.observe(2)"
+    for _ in range(2):
+        subprocess.run([sys.executable, '-c', record], cwd=SERVICE_DIR, env=env, check=True)
+
+    scrape = "import metrics; print(metrics.render_latest()[0].decode())"
+    output = subprocess.run([sys.executable, '-c', scrape], cwd=SERVICE_DIR, env=env, check=True,
+                            capture_output=True, text=True).stdout
+
+    assert sample(output, 'noot_render_pages_count') == 2
+    assert sample(output, 'noot_render_pages_sum') == 4
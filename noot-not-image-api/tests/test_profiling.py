@@ -0,0 +1,73 @@
+import time
+import tracemalloc
+
+import pytest
+
+
+@pytest.fixture
+def admin_client(app_client, tmp_path):
+    client, app_module = app_client
+    app_module.config['ADMIN_TOKEN'] = 'secret'
+    app_module.profiler.output_dir = str(tmp_path / 'profiles')
+    return client, {'X-Admin-Token': 'secret'}
+
+
+def test_admin_hooks_need_the_token(app_client, admin_client):
+    client, app_module = app_client
+    assert client.post('/admin/profile', json={}, headers={'X-Admin-Token': 'nope'}).status_code == 401
+    assert client.post('/admin/profile', json={}, headers={'X-Admin-Token': 'sécret'}).status_code == 401
+
+    app_module.config['ADMIN_TOKEN'] = ''
+    assert client.post('/admin/profile', json={}, headers={'X-Admin-Token': ''}).status_code == 404
+
+
+def test_cprofile_capture_of_the_next_requests(admin_client):
+    client, headers = admin_client
+    armed = client.post('/admin/profile', json={'mode': 'cprofile', 'requests': 1}, headers=headers)
+    assert armed.status_code == 202
+
+    client.post('/generate-images', json={'confession_id': 72, 'content': 'hola perfilada'})
+
+    report = client.get(armed.json['status_url'], headers=headers).json
+    assert report['status'] == 'done'
+    assert report['captured'][0]['endpoint'] == 'generate_images'
+    assert 'render_confession' in report['profile']
+
+    download = client.get(armed.json['status_url'] + '?format=pstats', headers=headers)
+    assert download.status_code == 200
+    assert len(download.data) > 0
+
+
+def test_tracemalloc_capture_reports_peaks_and_allocations(admin_client):
+    client, headers = admin_client
+    armed = client.post('/admin/profile', json={'mode': 'tracemalloc', 'requests': 2}, headers=headers).json
+    assert client.post('/admin/profile', json={'mode': 'cprofile'}, headers=headers).status_code == 400
+
+    client.post('/layout', json={'content': 'hola'})
+    client.get('/health')
+    assert client.get(armed['status_url'], headers=headers).json['status'] == 'running'
+    client.post('/layout', json={'content': 'adiós'})
+
+    report = client.get(armed['status_url'], headers=headers).json
+    assert report['status'] == 'done'
+    assert [entry['endpoint'] for entry in report['captured']] == ['layout', 'layout']
+    assert all(entry['peak_bytes'] > 0 for entry in report['captured'])
+    assert isinstance(report['allocations'], list)
+
+
+def test_captures_expire_and_stop_tracing(admin_client):
+    client, headers = admin_client
+    armed = client.post('/admin/profile', json={'mode': 'tracemalloc', 'requests': 5, 'seconds': 0.5},
+                        headers=headers).json
+    client.post('/layout', json={'content': 'hola'})
+    assert tracemalloc.is_tracing()
+
+    deadline = time.time() + 5
+    while client.get(armed['status_url'], headers=headers).json['status'] == 'running' and time.time() < deadline:
+        time.sleep(0.05)
+
+    report = client.get(armed['status_url'], headers=headers).json
+    assert report['status'] == 'expired'
+    assert len(report['captured']) == 1
+    assert not tracemalloc.is_tracing()
+    assert client.post('/admin/profile', json={'mode': 'cprofile'}, headers=headers).status_code == 202
@@ -0,0 +1,67 @@
+from image_generator import ImageGeneratorService
+from render_cache import RenderCache
+
+
+def cached_service(service_config, tmp_path, max_bytes=50 * 1024 * 1024):
+    return ImageGeneratorService({**service_config, 'RENDER_CACHE_DIR': str(tmp_path / 'cache'),
+                                  'RENDER_CACHE_MAX_BYTES': max_bytes})
+
+
+def test_identical_requests_reuse_the_render(service_config, tmp_path, monkeypatch):
+    service = cached_service(service_config, tmp_path)
+    urls = service.generate_confession_images(3, 'una confesión repetida')
+
+    def fail(*args, **kwargs):
+        raise AssertionError('page was rendered again')
+
+    monkeypatch.setattr(service, 'create_confession_image', fail)
+    assert service.generate_confession_images(3, 'una confesión repetida') == urls
+    assert service.render_cache.stats()['hits'] == 1
+    assert service.render_cache.stats()['misses'] == 1
+
+
+def test_hit_restores_pages_overwritten_by_other_content(service_config, tmp_path):
+    service = cached_service(service_config, tmp_path)
+
+    service.generate_confession_images(4, 'versión original')
+    original = service.storage.read('4.png')
+    service.generate_confession_images(4, 'versión editada por un admin')
+    service.generate_confession_images(4, 'versión original')
+
+    assert service.storage.read('4.png') == original
+    assert service.render_cache.stats()['hits'] == 1
+
+
+def test_layout_changes_miss_the_cache(service_config, tmp_path):
+    small = cached_service(service_config, tmp_path)
+    large = ImageGeneratorService({**small.config, 'FONT_SIZE': 100})
+
+    assert small.render_cache_key(5, 'hola', 'png') != large.render_cache_key(5, 'hola', 'png')
+    assert small.render_cache_key(5, 'hola', 'png') != small.render_cache_key(6, 'hola', 'png')
+    assert small.render_cache_key(5, 'hola', 'png') != small.render_cache_key(5, 'hola', 'webp')
+
+
+def test_cache_stays_within_its_disk_budget(service_config, tmp_path):
+    service = cached_service(service_config, tmp_path, max_bytes=1)
+    service.generate_confession_images(8, 'primera')
+    service.generate_confession_images(9, 'segunda')
+
+    assert service.render_cache.stats()['bytes'] <= 1
+
+
+def test_eviction_frees_headroom_so_it_does_not_rescan_on_every_store(tmp_path, monkeypatch):
+    class Pages:
+        def read(self, filename):
+            return b'x' * 1000
+
+    cache = RenderCache(str(tmp_path / 'cache'), max_bytes=20 * 1000)
+    scans = []
+    evict = cache.evict
+    monkeypatch.setattr(cache, 'evict', lambda: scans.append(1) or evict())
+
+    for n in range(30):
+        cache.store(f'{n:064x}', [], Pages(), ['1.png'])
+
+    # Every eviction frees 10% of the budget: two entries here, so at most every other store scans
+    assert 0 < len(scans) <= 5
+    assert cache.stats()['bytes'] <= 20 * 1000
@@ -0,0 +1,24 @@
+from PIL import Image
+
+from image_generator import ImageGeneratorService
+
+LONG_CONFESSION = 'esta confesión es tan larga que ocupa varias páginas 😅 ' * 60
+
+
+def test_parallel_rendering_matches_sequential(service_config, tmp_path):
+    sequential = ImageGeneratorService({**service_config, 'IMAGES_DIR': str(tmp_path / 'sequential')})
+    parallel = ImageGeneratorService({**service_config, 'IMAGES_DIR': str(tmp_path / 'parallel'),
+                                      'RENDER_PROCESSES': 2})
+    try:
+        expected = sequential.generate_confession_images(7, LONG_CONFESSION)
+        actual = parallel.generate_confession_images(7, LONG_CONFESSION)
+    finally:
+        parallel.render_pool.shutdown()
+
+    assert len(actual) > 2
+    assert actual == expected
+    for url in actual:
+        filename = url.rsplit('/', 1)[1]
+        with Image.open(sequential.storage.local_path(filename)) as a, \
+                Image.open(parallel.storage.local_path(filename)) as b:
+            assert a.tobytes() == b.tobytes()
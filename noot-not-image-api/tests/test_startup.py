@@ -0,0 +1,63 @@
+import os
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import time
+
+import pytest
+import requests
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_ready_reports_a_warmed_up_worker(app_client):
+    client, app_module = app_client
+
+    assert client.get('/ready').json['status'] == 'ready'
+
+    app_module.worker_ready.clear()
+    response = client.get('/ready')
+    assert response.status_code == 503
+    assert client.get('/health').status_code == 200
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+@pytest.mark.skipif(shutil.which('gunicorn') is None, reason='gunicorn is not installed')
+def test_preloaded_gunicorn_workers_run_the_job_queue(service_config, tmp_path):
+    port = free_port()
+    env = {**os.environ, 'PORT': str(port), 'GUNICORN_WORKERS': '2',
+           'IMAGES_DIR': service_config['IMAGES_DIR'], 'FONTS_DIR': service_config['FONTS_DIR'],
+           'BACKGROUND_DIR': service_config['BACKGROUND_DIR'], 'RENDER_CACHE_MAX_BYTES': '0',
+           'JOBS_DB_PATH': str(tmp_path / 'jobs.sqlite3'), 'OUTBOX_DB_PATH': str(tmp_path / 'outbox.sqlite3'),
+           'PHP_API_BASE_URL': 'http://127.0.0.1:9'}
+    server = subprocess.Popen([sys.executable, '-m', 'gunicorn', '--config', 'gunicorn.conf.py', 'app:app'],
+                              cwd=SERVICE_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base_url = f'http://127.0.0.1:{port}'
+    try:
+        deadline = time.time() + 60
+        while True:
+            try:
+                if requests.get(f'{base_url}/ready', timeout=1).status_code == 200:
+                    break
+            except requests.ConnectionError:
+                pass
+            assert time.time() < deadline, 'gunicorn never became ready'
+            time.sleep(0.2)
+
+        job = requests.post(f'{base_url}/webhook/confession-created',
+                            json={'confession_id': 61, 'content': 'hola'}).json()
+        while requests.get(f"{base_url}{job['status_url']}").json()['status'] in ('queued', 'running'):
+            assert time.time() < deadline, 'the job was never processed'
+            time.sleep(0.2)
+
+        assert requests.get(f"{base_url}{job['status_url']}").json()['status'] == 'done'
+    finally:
+        server.send_signal(signal.SIGTERM)
+        server.wait(30)
@@ -0,0 +1,123 @@
+import datetime
+import io
+import os
+import time
+
+import pytest
+
+from image_generator import ImageGeneratorService
+from storage import ImageStorage, LocalStorage, S3Storage, shard_location
+
+LONG_CONFESSION = 'una confesión larguísima que ocupa varias páginas ' * 40
+
+
+def test_pages_are_sharded_and_shrinking_a_confession_deletes_old_pages(service):
+    service.generate_confession_images(12, LONG_CONFESSION)
+    assert service.storage.find('12-2.png').location == shard_location('12-2.png')
+
+    service.generate_confession_images(12, 'ahora es corta')
+
+    assert service.storage.pages(12) == ['12.png']
+    assert service.storage.find('12-1.png') is None
+    assert service.storage.find('12-2.png') is None
+    assert not any(os.path.isfile(os.path.join(service.images_dir, name)) for name in os.listdir(service.images_dir))
+
+
+def test_legacy_flat_files_are_served_until_rerendered(app_client, service_config):
+    client, _ = app_client
+    with open(os.path.join(service_config['IMAGES_DIR'], '77.png'), 'wb') as f:
+        f.write(b'\x89PNG legacy')
+
+    response = client.get('/images/77.png')
+    assert response.status_code == 200
+    assert response.data == b'\x89PNG legacy'
+    assert client.get('/images/77.pages.json').status_code == 404
+
+
+def test_gc_removes_stale_files_and_evicts_variants_over_budget(tmp_path):
+    storage = LocalStorage(str(tmp_path))
+    for name in ('5-1.png', '5-2.png', '5-3.png', '5-1.webp'):
+        storage.write(name, b'x' * 100)
+    storage.write('5.pages.json', b'{"pages": ["5-1.png", "5-2.png"]}')
+    with open(tmp_path / '5-1.png', 'wb') as f:
+        f.write(b'legacy')
+    with open(tmp_path / '.tmp-abandoned', 'wb'):
+        pass
+    for stored in storage.iter_files():
+        path = os.path.join(str(tmp_path), stored.location)
+        os.utime(path, (time.time() - 3600, time.time() - 3600))
+
+    stats = storage.collect_garbage(max_bytes=250)
+
+    assert stats['stale_removed'] == 2  # 5-3.png and the shadowed flat 5-1.png
+    assert stats['temp_removed'] == 1
+    assert stats['variants_evicted'] == 1
+    assert not stats['over_budget']
+    assert sorted(stored.filename for stored in storage.iter_files()) == ['5-1.png', '5-2.png', '5.pages.json']
+
+
+class MissingKey(Exception):
+    response = {'Error': {'Code': 'NoSuchKey'}}
+
+
+class FakeS3:
+    """In-memory stand-in for the subset of the S3 API the storage uses"""
+
+    def __init__(self):
+        self.objects = {}
+
+    def put_object(self, Bucket, Key, Body, ContentType, Metadata):
+        self.objects[Key] = (Body, Metadata, datetime.datetime.now(datetime.timezone.utc))
+
+    def _get(self, Key):
+        if Key not in self.objects:
+            raise MissingKey()
+        return self.objects[Key]
+
+    def head_object(self, Bucket, Key):
+        body, metadata, modified = self._get(Key)
+        return {'ContentLength': len(body), 'LastModified': modified, 'Metadata': metadata, 'ETag': '"e"'}
+
+    def get_object(self, Bucket, Key):
+        return {'Body': io.BytesIO(self._get(Key)[0])}
+
+    def delete_object(self, Bucket, Key):
+        self.objects.pop(Key, None)
+
+    def list_objects_v2(self, Bucket, Prefix, ContinuationToken=None):
+        keys = sorted(key for key in self.objects if key.startswith(Prefix))
+        return {'Contents': [{'Key': key, 'Size': len(self.objects[key][0]), 'LastModified': self.objects[key][2]}
+                             for key in keys]}
+
+
+def test_s3_backend_stores_and_prunes_pages(service_config):
+    client = FakeS3()
+    service = ImageGeneratorService(service_config, storage=S3Storage('images', client, prefix='pages'))
+
+    service.generate_confession_images(13, LONG_CONFESSION)
+    assert f"pages/{shard_location('13-2.png')}" in client.objects
+
+    urls = service.generate_confession_images(13, 'corta')
+    assert urls[0].startswith('/images/13.png')
+    assert sorted(key.rsplit('/', 1)[1] for key in client.objects) == ['13.pages.json', '13.png']
+    assert service.storage.read('13.png').startswith(b'\x89PNG')
+    assert os.listdir(service.images_dir) == []
+
+
+def test_incomplete_backends_fail_when_constructed():
+    class ReadOnlyStorage(ImageStorage):
+        def read(self, filename):
+            return None
+
+    with pytest.raises(TypeError):
+        ReadOnlyStorage()
+
+
+def test_ids_that_cannot_name_a_page_are_rejected(app_client):
+    client, _ = app_client
+    for confession_id in ('a/b', '../x', '12-3'):
+        response = client.post('/generate-images', json={'confession_id': confession_id, 'content': 'hola'})
+        assert response.status_code == 400
+
+    with pytest.raises(ValueError):
+        shard_location('../x')
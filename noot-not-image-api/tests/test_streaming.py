@@ -0,0 +1,61 @@
+import io
+import os
+import zipfile
+
+from PIL import Image
+
+from streaming import multipart_stream, zip_stream
+
+LONG_CONFESSION = 'una confesión que no cabe en una sola imagen ' * 40
+
+
+def test_pages_render_in_memory_without_touching_disk(service):
+    pages = list(service.iter_confession_pages(21, LONG_CONFESSION, 'png'))
+
+    assert [page['filename'] for page in pages] == [f'21-{n}.png' for n in range(1, len(pages) + 1)]
+    assert len(pages) == len(service.paginate(LONG_CONFESSION))
+    assert os.listdir(service.images_dir) == []
+    with Image.open(io.BytesIO(pages[0]['data'])) as image:
+        assert image.size == (service.image_width, service.image_height)
+
+
+def test_zip_stream_yields_a_valid_archive_page_by_page(service):
+    chunks = list(zip_stream(service.iter_confession_pages(22, LONG_CONFESSION, 'jpeg')))
+
+    archive = zipfile.ZipFile(io.BytesIO(b''.join(chunks)))
+    assert archive.namelist()[0] == '22-1.jpg'
+    assert len(chunks) == len(archive.namelist()) + 1
+    assert archive.testzip() is None
+
+
+def test_multipart_stream_frames_every_page():
+    pages = [
+        {'filename': '1-1.png', 'page_number': 1, 'total_pages': 2, 'mimetype': 'image/png',
+         'data': b'first', 'encode_ms': 1.0},
+        {'filename': '1-2.png', 'page_number': 2, 'total_pages': 2, 'mimetype': 'image/png',
+         'data': b'second', 'encode_ms': 1.0},
+    ]
+    body = b''.join(multipart_stream(pages, 'b'))
+
+    parts = body.split(b'--b')
+    assert len(parts) == 4
+    assert parts[1].endswith(b'\r\n\r\nfirst\r\n')
+    assert b'filename="1-2.png"' in parts[2]
+    assert parts[3] == b'--\r\n'
+
+
+def test_multipart_part_names_stay_ascii():
+    page = {'filename': 'confesión-1.png', 'page_number': 1, 'total_pages': 1, 'mimetype': 'image/png',
+            'data': b'first', 'encode_ms': 1.0}
+    body = b''.join(multipart_stream([page], 'b'))
+
+    assert b'filename="confesion-1.png"' in body
+    assert b"filename*=UTF-8''confesi%C3%B3n-1.png" in body
+
+
+def test_blank_content_is_rejected_in_every_mode(app_client):
+    client, _ = app_client
+    for mode in ('store', 'zip', 'multipart'):
+        response = client.post('/generate-images', json={'confession_id': 23, 'content': '   ', 'mode': mode})
+        assert response.status_code == 400
+        assert response.get_json()['error'] == 'content has no text to render'
@@ -0,0 +1,96 @@
+from PIL import Image, ImageChops, ImageDraw, ImageStat
+
+import pytest
+
+# Mean absolute difference per channel (0-255) and share of visibly different pixels
+MAX_MEAN_DIFFERENCE = 1.0
+MAX_CHANGED_RATIO = 0.01
+CHANGED_THRESHOLD = 48
+
+
+def legacy_text_with_effects(draw, text, x, y, font, text_color=(0, 0, 0),
+                             shadow_color=(150, 150, 150), outline_color=(128, 128, 128)):
+    """The original 26 draw.text calls per segment"""
+    draw.text((x + 4, y + 4), text, font=font, fill=shadow_color)
+    for ox in range(-2, 3):
+        for oy in range(-2, 3):
+            if ox != 0 or oy != 0:
+                draw.text((x + ox, y + oy), text, font=font, fill=outline_color)
+    draw.text((x, y), text, font=font, fill=text_color)
+
+
+def legacy_mixed_text_with_effects(service, draw, text, x, y):
+    current_x = x
+    for segment, is_emoji in service.split_text_and_emojis(text):
+        if is_emoji:
+            bbox = service.emoji_font.getbbox(segment)
+            emoji_width = bbox[2] - bbox[0]
+            if emoji_width > 0:
+                draw.text((current_x + 2, y + 2), segment, font=service.emoji_font, fill=(200, 200, 200))
+                draw.text((current_x, y), segment, font=service.emoji_font, fill=(0, 0, 0))
+                current_x += emoji_width
+                continue
+            segment = service.convert_emojis_to_text(segment)
+        legacy_text_with_effects(draw, segment, current_x, y, service.font)
+        current_x += service.get_text_width(segment, service.font)
+
+
+def assert_visually_equal(expected, actual):
+    difference = ImageChops.difference(expected, actual)
+    mean = max(ImageStat.Stat(difference).mean)
+    changed = sum(difference.convert('L').point(lambda v: 255 if v > CHANGED_THRESHOLD else 0).histogram()[255:])
+    ratio = changed / (difference.width * difference.height)
+
+    assert mean <= MAX_MEAN_DIFFERENCE, f'mean difference {mean:.3f}'
+    assert ratio <= MAX_CHANGED_RATIO, f'{ratio:.2%} of pixels changed'
+
+
+@pytest.mark.parametrize('line', [
+    'Nunca le dije a nadie',
+    'jalapeño ¿por qué? AVATAR',
+    'me comí el pastel 🎂😂 perdón 🙏',
+])
+def test_line_matches_legacy_rendering(service, line):
+    background = service.create_gradient_background()
+    width = service.get_mixed_text_width(line)
+    x = (service.image_width - width) // 2
+    y = 600
+
+    expected = background.copy()
+    legacy_mixed_text_with_effects(service, ImageDraw.Draw(expected), line, x, y)
+    actual = background.copy()
+    service.add_mixed_text_with_effects(actual, line, x, y)
+
+    box = (0, y - 100, service.image_width, y + 300)
+    assert_visually_equal(expected.crop(box), actual.crop(box))
+
+
+def test_id_badge_matches_legacy_rendering(service):
+    background = service.create_gradient_background()
+    x, y = 1500, 150
+
+    expected = background.copy()
+    legacy_text_with_effects(ImageDraw.Draw(expected), '1234-2', x, y, service.id_font)
+    actual = background.copy()
+    service.add_text_with_effects(actual, '1234-2', x, y, service.id_font)
+
+    box = (x - 50, y - 50, service.image_width, y + 250)
+    assert_visually_equal(expected.crop(box), actual.crop(box))
+
+
+@pytest.mark.parametrize('x, y, edges', [
+    (-40, -30, {'left': 0, 'top': 0}),
+    (150, 160, {'right': 200, 'bottom': 200}),
+])
+def test_text_near_edges_is_clipped(service, x, y, edges):
+    blank = Image.new('RGB', (200, 200), (255, 255, 255))
+    expected = blank.copy()
+    legacy_text_with_effects(ImageDraw.Draw(expected), 'Borde', x, y, service.font)
+    actual = blank.copy()
+    service.add_text_with_effects(actual, 'Borde', x, y, service.font)
+
+    # The visible part of the text reaches the canvas edges and matches the unclipped drawing
+    left, top, right, bottom = ImageChops.difference(actual, blank).getbbox()
+    drawn = {'left': left, 'top': top, 'right': right, 'bottom': bottom}
+    assert {edge: drawn[edge] for edge in edges} == edges
+    assert_visually_equal(expected, actual)
@@ -0,0 +1,30 @@
+import pytest
+
+from text_segmentation import contains_emoji, emojis_to_text, segment_text
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('', []),
+    ('sin emojis', [('sin emojis', False)]),
+    ('hola 😊 mundo', [('hola ', False), ('😊', True), (' mundo', False)]),
+    ('😂😂😂', [('😂😂😂', True)]),
+    # Variation selectors, skin tones and ZWJ sequences stay inside one cluster
+    ('te ❤️ mucho', [('te ', False), ('❤️', True), (' mucho', False)]),
+    ('ok👍🏽!', [('ok', False), ('👍🏽', True), ('!', False)]),
+    ('familia 👨‍👩‍👧 feliz', [('familia ', False), ('👨‍👩‍👧', True), (' feliz', False)]),
+    ('🇨🇱 y 🇦🇷', [('🇨🇱', True), (' y ', False), ('🇦🇷', True)]),
+])
+def test_segment_text(text, expected):
+    assert segment_text(text) == expected
+    assert ''.join(segment for segment, _ in segment_text(text)) == text
+
+
+def test_contains_emoji():
+    assert contains_emoji('todo bien 👌')
+    assert not contains_emoji('todo bien')
+    assert not contains_emoji('‍️')
+
+
+def test_emojis_to_text_prefers_the_longest_match():
+    assert emojis_to_text('te ❤️ 😂🔥') == 'te <3 XD(fire)'
+    assert emojis_to_text('sin cambios') == 'sin cambios'
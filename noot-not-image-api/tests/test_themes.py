@@ -0,0 +1,86 @@
+import io
+
+import pytest
+from PIL import Image
+
+from image_generator import ImageGeneratorService
+from render_context import RenderContextCache
+
+THEMES = {
+    'story': {'IMAGE_WIDTH': 1080, 'IMAGE_HEIGHT': 1920, 'FONT_SIZE': 64, 'LINE_HEIGHT': 84},
+    'airy': {'LINE_HEIGHT': 160},
+}
+
+
+@pytest.fixture
+def themed_service(service_config):
+    return ImageGeneratorService({**service_config, 'THEMES': THEMES})
+
+
+def test_theme_renders_with_its_own_canvas_and_fonts(themed_service):
+    story = themed_service.themed('story')
+    result = story.render_confession(61, 'una confesión vertical')
+
+    with Image.open(io.BytesIO(story.storage.read('61.png'))) as image:
+        assert image.size == (1080, 1920)
+    assert story.font.size == 64
+    assert themed_service.font.size == 84
+    assert result['image_urls'][0].startswith('/images/61.png')
+    assert story.render_cache_key(61, 'hola', 'png') != themed_service.render_cache_key(61, 'hola', 'png')
+
+
+def test_contexts_are_reused_and_spacing_only_themes_share_the_default(themed_service):
+    first = themed_service.themed('story')
+    second = themed_service.themed('story')
+    assert first.font is second.font
+    assert first.text_measurer is second.text_measurer
+
+    airy = themed_service.themed('airy')
+    assert airy.font is themed_service.font
+    assert airy.line_height == 160
+    assert themed_service.render_contexts.stats()['misses'] == 1
+
+    with pytest.raises(ValueError, match='Unknown theme'):
+        themed_service.themed('neon')
+
+
+def test_least_recently_used_contexts_are_evicted(themed_service):
+    contexts = RenderContextCache(max_entries=2)
+    for size in (60, 70, 80):
+        contexts.get(size, themed_service.load_context)
+    contexts.get(80, themed_service.load_context)
+
+    assert contexts.stats()['entries'] == 2
+    assert contexts.stats()['evictions'] == 1
+
+    # Over the memory budget only the most recently used context stays
+    small = RenderContextCache(max_bytes=1)
+    small.get('a', themed_service.load_context)
+    small.get('b', themed_service.load_context)
+    assert small.stats()['entries'] == 1
+
+
+def test_endpoints_accept_a_theme(app_client):
+    client, app_module = app_client
+    app_module.image_generator.themes = THEMES
+
+    response = client.post('/generate-images', json={'confession_id': 62, 'content': 'hola', 'theme': 'story'})
+    assert response.status_code == 200
+    with Image.open(io.BytesIO(client.get(response.json['image_urls'][0]).data)) as image:
+        assert image.width == 1080
+
+    layout = client.post('/layout', json={'content': 'hola', 'theme': 'story'})
+    assert layout.json['max_line_width'] == 1080 - 2 * 100 - 100
+
+    unknown = client.post('/generate-images', json={'confession_id': 62, 'content': 'hola', 'theme': 'neon'})
+    assert unknown.status_code == 400
+    assert 'Unknown theme' in unknown.json['error']
+
+
+def test_loading_a_context_leaves_the_service_alone(themed_service):
+    font, measurer = themed_service.font, themed_service.text_measurer
+    context = themed_service.load_context()
+
+    assert context.font is not font
+    assert themed_service.font is font
+    assert themed_service.text_measurer is measurer
@@ -0,0 +1,34 @@
+import io
+
+from PIL import Image
+
+from image_generator import ImageGeneratorService
+
+
+def test_pages_are_rendered_with_size_variants(service_config):
+    service = ImageGeneratorService({**service_config, 'IMAGE_VARIANTS': [480, 4000]})
+    result = service.render_confession(8, 'una confesión con variantes')
+
+    variants = result['pages'][0]['variants']
+    assert [variant['filename'] for variant in variants] == ['8@480w.png']
+    with Image.open(io.BytesIO(service.storage.read('8@480w.png'))) as image:
+        assert image.width == 480
+    assert result['image_sets'][0]['srcset'] == f"{variants[0]['url']} 480w, {result['image_urls'][0]} {service.image_width}w"
+
+    # Variants belong to their page, so a re-render keeps them
+    service.render_confession(8, 'una confesión con variantes')
+    assert service.storage.find('8@480w.png') is not None
+
+
+def test_missing_variants_are_derived_on_request(app_client):
+    client, app_module = app_client
+    client.post('/generate-images', json={'confession_id': 41, 'content': 'hola'})
+    app_module.image_generator.variant_widths = [480]
+
+    response = client.get('/images/41@480w.png')
+    assert response.status_code == 200
+    with Image.open(io.BytesIO(response.data)) as image:
+        assert image.width == 480
+
+    assert client.get('/images/41@300w.png').status_code == 404
+    assert client.get('/images/42@480w.png').status_code == 404
@@ -0,0 +1,65 @@
+import random
+
+import pytest
+
+SAMPLES = [
+    '',
+    'Hola',
+    'Nunca le dije a nadie que me comí el último pedazo de pastel 🎂😂 y todavía me siento culpable',
+    'a  b   c    d' + ' ' * 5 + 'e',
+    'Supercalifragilisticoespialidoso' * 6 + ' corto',
+    '😊😊😊 ' * 40,
+    'mezcla❤️de👍🏽texto👨‍👩‍👧y emojis ' * 12,
+    '我从来没有告诉过任何人这件事 ' * 10,
+    'AV To Wa Ty ' * 30,
+]
+
+
+def legacy_wrap_text(service, text):
+    """The original quadratic wrap_text, kept as the reference behavior"""
+    words = text.split(' ')
+    lines = []
+    current_line = ''
+    max_width = service.max_text_width - 100
+
+    for word in words:
+        test_line = current_line + ' ' + word if current_line else word
+
+        if service.get_mixed_text_width(test_line) <= max_width:
+            current_line = test_line
+        else:
+            if current_line:
+                lines.append(current_line)
+            current_line = word
+
+            if service.get_mixed_text_width(current_line) > max_width:
+                lines.append(current_line)
+                current_line = ''
+
+    if current_line:
+        lines.append(current_line)
+
+    return lines
+
+
+def random_corpus(count=40, seed=7):
+    rng = random.Random(seed)
+    vocabulary = ['yo', 'nunca', 'confesé', 'que', 'WWWWWW', 'iiiii', 'jalapeño', '😊', '🔥🔥', 'café☕',
+                  '¿por qué?', 'lo', 'siento', 'AVATAR', 'a', '', 'extraordinariamente', '❤️', '🙏🏼']
+    return [' '.join(rng.choice(vocabulary) for _ in range(rng.randint(1, 400))) for _ in range(count)]
+
+
+@pytest.mark.parametrize('text', SAMPLES + random_corpus())
+def test_wrap_text_matches_legacy_breaking(service, text):
+    assert service.wrap_text(text) == legacy_wrap_text(service, text)
+
+
+def test_measurements_are_cached_across_calls(service):
+    text = 'el mismo texto de siempre ' * 20
+    service.wrap_text(text)
+    cached = len(service.text_measurer.cache)
+
+    service.wrap_text(text)
+
+    assert cached > 0
+    assert len(service.text_measurer.cache) == cached
@@ -0,0 +1,80 @@
+from typing import List, Tuple
+
+from PIL import Image, ImageDraw, ImageFilter, ImageFont
+
+Color = Tuple[int, int, int]
+
+# A run of text drawn with one font: (text, font, x offset from the line origin, outlined)
+TextRun = Tuple[str, ImageFont.ImageFont, int, bool]
+
+
+class TextEffectsRenderer:
+    """Draws text with drop shadow and outline from a single rasterized glyph mask.
+
+    Instead of drawing every run once for the shadow, once per outline offset and
+    once more for the fill, the line is rasterized into a coverage mask a single
+    time. The outline is a dilation of that mask, the shadows are the mask pasted
+    at an offset, and each layer is composited onto the image in one paste.
+    """
+
+    def __init__(self, shadow_offset: int = 4, outline_width: int = 2, emoji_shadow_offset: int = 2,
+                 emoji_shadow_color: Color = (200, 200, 200)):
+        self.shadow_offset = shadow_offset
+        self.outline_width = outline_width
+        self.emoji_shadow_offset = emoji_shadow_offset
+        self.emoji_shadow_color = emoji_shadow_color
+        self.outline_filter = ImageFilter.MaxFilter(outline_width * 2 + 1)
+
+    def draw_runs(self, image: Image.Image, runs: List[TextRun], x: int, y: int,
+                  text_color: Color, shadow_color: Color, outline_color: Color):
+        """Draw a line made of runs at (x, y)"""
+        runs = [run for run in runs if run[0]]
+        if not runs:
+            return
+
+        # Ink box of the whole line relative to (x, y)
+        boxes = []
+        for text, font, offset, _ in runs:
+            left, top, right, bottom = font.getbbox(text)
+            boxes.append((offset + left, top, offset + right, bottom))
+        left = min(box[0] for box in boxes)
+        top = min(box[1] for box in boxes)
+        right = max(box[2] for box in boxes)
+        bottom = max(box[3] for box in boxes)
+
+        pad = max(self.shadow_offset, self.outline_width, self.emoji_shadow_offset)
+        size = (right - left + pad * 2, bottom - top + pad * 2)
+        if size[0] <= pad * 2 or size[1] <= pad * 2:
+            return
+        origin_x = x + left - pad
+        origin_y = y + top - pad
+
+        # Rasterize every glyph exactly once
+        outlined_mask = Image.new('L', size, 0)
+        plain_mask = None
+        outlined_draw = ImageDraw.Draw(outlined_mask)
+        plain_draw = None
+        for text, font, offset, outlined in runs:
+            position = (offset - left + pad, -top + pad)
+            if outlined:
+                outlined_draw.text(position, text, font=font, fill=255)
+            else:
+                if plain_mask is None:
+                    plain_mask = Image.new('L', size, 0)
+                    plain_draw = ImageDraw.Draw(plain_mask)
+                plain_draw.text(position, text, font=font, fill=255)
+
+        # Shadows first, then the outline, then the fill on top
+        self._paste(image, shadow_color, outlined_mask, origin_x + self.shadow_offset,
+                    origin_y + self.shadow_offset)
+        if plain_mask is not None:
+            self._paste(image, self.emoji_shadow_color, plain_mask, origin_x + self.emoji_shadow_offset,
+                        origin_y + self.emoji_shadow_offset)
+        if self.outline_width > 0:
+            self._paste(image, outline_color, outlined_mask.filter(self.outline_filter), origin_x, origin_y)
+        self._paste(image, text_color, outlined_mask, origin_x, origin_y)
+        if plain_mask is not None:
+            self._paste(image, text_color, plain_mask, origin_x, origin_y)
+
+    def _paste(self, image: Image.Image, color: Color, mask: Image.Image, x: int, y: int):
+        image.paste(color, (x, y, x + mask.width, y + mask.height), mask)
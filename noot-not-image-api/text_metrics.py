@@ -0,0 +1,122 @@
+import threading
+from collections import OrderedDict
+from typing import Any, Hashable, Optional, Tuple
+
+from PIL import ImageFont
+
+# (advance, left, right) of a segment drawn at the origin
+SegmentMetrics = Tuple[float, int, int]
+
+
+class LRUCache:
+    """Bounded, thread-safe least-recently-used mapping"""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max(1, max_entries)
+        self._data: 'OrderedDict[Hashable, Any]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            try:
+                self._data.move_to_end(key)
+                return self._data[key]
+            except KeyError:
+                return default
+
+    def put(self, key: Hashable, value: Any):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class TextMeasurer:
+    """Measures text segments once per font and caches their advances"""
+
+    def __init__(self, max_entries: int = 50000, fallback_char_width: int = 42):
+        self.cache = LRUCache(max_entries)
+        self.fallback_char_width = fallback_char_width
+
+    def metrics(self, text: str, font: ImageFont.ImageFont) -> SegmentMetrics:
+        """Return the advance and horizontal ink extents of text drawn at x=0"""
+        key = (font, text)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+
+        try:
+            left, _, right, _ = font.getbbox(text)
+            advance = font.getlength(text)
+        except Exception:
+            # Same estimation get_text_width falls back to
+            right = advance = len(text) * self.fallback_char_width
+            left = 0
+
+        result = (advance, left, right)
+        self.cache.put(key, result)
+        return result
+
+    def line(self) -> 'LineWidth':
+        """Start measuring an empty line"""
+        return LineWidth(self)
+
+
+class LineWidth:
+    """Incrementally computed width of a line built from measured segments.
+
+    Consecutive segments of the same kind form one run, and each run is as wide
+    as the bounding box of its concatenated text, matching how
+    get_mixed_text_width measures a whole line.
+    """
+
+    __slots__ = ('measurer', 'closed', 'run_key', 'pen', 'left', 'right')
+
+    def __init__(self, measurer: TextMeasurer):
+        self.measurer = measurer
+        self.closed = 0
+        self.run_key: Optional[Tuple[ImageFont.ImageFont, bool]] = None
+        self.pen = 0.0
+        self.left = 0
+        self.right = 0
+
+    def copy(self) -> 'LineWidth':
+        other = LineWidth.__new__(LineWidth)
+        other.measurer = self.measurer
+        other.closed = self.closed
+        other.run_key = self.run_key
+        other.pen = self.pen
+        other.left = self.left
+        other.right = self.right
+        return other
+
+    def append(self, text: str, font: ImageFont.ImageFont, is_emoji: bool = False):
+        if not text:
+            return
+
+        advance, left, right = self.measurer.metrics(text, font)
+        run_key = (font, is_emoji)
+
+        if run_key != self.run_key:
+            self.closed += self.right - self.left
+            self.run_key = run_key
+            self.pen = advance
+            self.left = left
+            self.right = right
+            return
+
+        self.left = min(self.left, int(self.pen + left))
+        self.right = max(self.right, int(self.pen + right))
+        self.pen += advance
+
+    @property
+    def width(self) -> int:
+        return self.closed + self.right - self.left
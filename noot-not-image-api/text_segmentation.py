@@ -0,0 +1,127 @@
+import re
+from typing import List, Tuple
+
+# Code point ranges rendered with the emoji font
+EMOJI_RANGES = (
+    "\U0001F600-\U0001F64F"  # emoticons
+    "\U0001F300-\U0001F5FF"  # symbols & pictographs (includes skin tone modifiers)
+    "\U0001F680-\U0001F6FF"  # transport & map symbols
+    "\U0001F1E0-\U0001F1FF"  # flags (iOS)
+    "\U00002600-\U000026FF"  # miscellaneous symbols
+    "\U00002700-\U000027BF"  # dingbats
+    "\U0001F900-\U0001F9FF"  # supplemental symbols and pictographs
+    "\U0001FA70-\U0001FAFF"  # symbols and pictographs extended-A
+)
+
+_BASE = f"[{EMOJI_RANGES}]"
+_REGIONAL_INDICATOR = "[\U0001F1E6-\U0001F1FF]"
+_SKIN_TONE = "[\U0001F3FB-\U0001F3FF]"
+_VARIATION_SELECTOR = "[\uFE0E\uFE0F]"
+_ZWJ = "\u200D"
+
+# One emoji as the user sees it: a flag pair, or a base emoji with optional variation
+# selector and skin tone, optionally joined to more of the same with zero-width joiners
+_ELEMENT = f"{_BASE}{_VARIATION_SELECTOR}?{_SKIN_TONE}?{_VARIATION_SELECTOR}?"
+_CLUSTER = f"(?:{_REGIONAL_INDICATOR}{_REGIONAL_INDICATOR}|{_ELEMENT}(?:{_ZWJ}{_ELEMENT})*)"
+
+# Compiled once: consecutive emoji clusters form a single run
+EMOJI_RUN = re.compile(f"(?:{_CLUSTER})+")
+
+EMOJI_FALLBACKS = {
+    # Caras y emociones
+    '😀': ':D', '😁': ':D', '😂': 'XD', '🤣': 'XD', '😃': ':D',
+    '😄': ':D', '😅': ':)', '😆': 'XD', '😊': ':)', '😇': ':)',
+    '🙂': ':)', '🙃': ':)', '😉': ';)', '😌': ':)', '😍': '<3',
+    '🥰': '<3', '😘': ':*', '😗': ':*', '😙': ':*', '😚': ':*',
+    '😋': ':P', '😛': ':P', '😝': 'XP', '😜': ';P', '🤪': 'XP',
+    '🤨': ':/', '🧐': '(monocle)', '🤓': '(nerd)', '😎': 'B)',
+    '🤩': '*_*', '🥳': '(party)',
+
+    # Emociones negativas
+    '😞': ':(', '😒': ':|', '😔': ':(', '😟': ':(', '😕': ':(',
+    '🙁': ':(', '☹️': ':(', '😣': '>:(', '😖': '>:(', '😫': 'X(',
+    '😩': ':(', '🥺': ':(', '😢': 'T_T', '😭': 'T_T', '😤': '>:(',
+    '😠': '>:(', '😡': '>:(', '🤬': '****', '🤯': '(mind blown)',
+    '😳': 'O_O', '🥵': '(hot)', '🥶': '(cold)', '😱': ':O',
+    '😨': 'D:', '😰': 'D:', '😥': ':(', '😓': ':-/',
+
+    # Gestos y manos
+    '👍': '(thumbs up)', '👎': '(thumbs down)', '👌': '(OK)',
+    '✌️': '(peace)', '🤞': '(fingers crossed)', '🤟': '(love)',
+    '🤘': '(rock)', '🤙': '(call me)', '👈': '(point left)',
+    '👉': '(point right)', '👆': '(point up)', '👇': '(point down)',
+    '☝️': '(index up)', '✋': '(hand)', '🤚': '(hand)', '🖐️': '(hand)',
+    '🖖': '(vulcan)', '👋': '(wave)', '🤝': '(handshake)',
+    '🙏': '(pray)', '✍️': '(write)', '💪': '(strong)',
+
+    # Corazones y amor
+    '❤️': '<3', '🧡': '<3', '💛': '<3', '💚': '<3', '💙': '<3',
+    '💜': '<3', '🖤': '</3', '🤍': '<3', '🤎': '<3', '💔': '</3',
+    '❣️': '<3', '💕': '<3', '💞': '<3', '💓': '<3', '💗': '<3',
+    '💖': '<3', '💘': '<3', '💝': '<3', '💟': '<3',
+
+    # Objetos y símbolos
+    '🔥': '(fire)', '⭐': '(star)', '🌟': '(star)', '✨': '(sparkles)',
+    '💫': '(dizzy)', '💥': '(boom)', '💯': '(100)', '💢': '(anger)',
+    '💦': '(sweat)', '💨': '(dash)', '🕳️': '(hole)', '💤': '(sleep)',
+    '🎉': '(party)', '🎊': '(confetti)', '🎈': '(balloon)',
+    '🎁': '(gift)', '🎂': '(cake)', '🍰': '(cake)', '🎵': '(music)',
+    '🎶': '(music)', '🎯': '(target)', '🏆': '(trophy)',
+    '🥇': '(gold)', '🥈': '(silver)', '🥉': '(bronze)',
+    '🏅': '(medal)', '🎖️': '(medal)',
+
+    # Transporte y tecnología
+    '🚀': '(rocket)', '✈️': '(plane)', '🚗': '(car)', '🏠': '(home)',
+    '🏫': '(school)', '🏢': '(office)', '🏥': '(hospital)',
+    '🏪': '(store)', '🎬': '(movie)', '📱': '(phone)',
+    '💻': '(computer)', '📷': '(camera)', '📺': '(TV)',
+    '⏰': '(clock)', '📅': '(calendar)', '📚': '(books)',
+    '✏️': '(pencil)', '📝': '(memo)', '📄': '(page)', '📋': '(clipboard)',
+
+    # Naturaleza
+    '🌞': '(sun)', '🌙': '(moon)', '🌈': '(rainbow)', '☀️': '(sun)',
+    '⛅': '(cloud)', '☁️': '(cloud)', '🌧️': '(rain)',
+    '⛈️': '(storm)', '🌩️': '(lightning)', '❄️': '(snow)',
+    '🌨️': '(snow)', '🌊': '(wave)', '🌳': '(tree)',
+    '🌸': '(flower)', '🌺': '(flower)', '🌻': '(flower)',
+    '🌹': '(rose)', '🌷': '(tulip)',
+
+    # Comida y bebida
+    '🍕': '(pizza)', '🍔': '(burger)', '🍟': '(fries)',
+    '🌭': '(hotdog)', '🥪': '(sandwich)', '🌮': '(taco)',
+    '🌯': '(burrito)', '🍣': '(sushi)', '🍜': '(ramen)',
+    '🍝': '(pasta)', '🍪': '(cookie)', '🍫': '(chocolate)',
+    '🍯': '(honey)', '☕': '(coffee)', '🍵': '(tea)',
+    '🥤': '(drink)', '🍺': '(beer)', '🍷': '(wine)',
+}
+
+# Longest keys first so multi-code-point emojis (e.g. with U+FE0F) win over their prefixes
+_FALLBACK_PATTERN = re.compile('|'.join(re.escape(emoji) for emoji in sorted(EMOJI_FALLBACKS, key=len, reverse=True)))
+
+
+def contains_emoji(text: str) -> bool:
+    """Check if text contains emojis"""
+    return EMOJI_RUN.search(text) is not None
+
+
+def segment_text(text: str) -> List[Tuple[str, bool]]:
+    """Split text in one pass into (segment, is_emoji) runs"""
+    segments = []
+    position = 0
+
+    for match in EMOJI_RUN.finditer(text):
+        start, end = match.span()
+        if start > position:
+            segments.append((text[position:start], False))
+        segments.append((match.group(), True))
+        position = end
+
+    if position < len(text):
+        segments.append((text[position:], False))
+
+    return segments
+
+
+def emojis_to_text(text: str) -> str:
+    """Replace known emojis with text representations in a single scan"""
+    return _FALLBACK_PATTERN.sub(lambda match: EMOJI_FALLBACKS[match.group()], text)